@@ -5,29 +5,70 @@ Main application package
 import os
 from flask import Flask
 from flask_login import LoginManager
-from app.models import db, User
+from flask_jwt_extended import JWTManager
+from app.models import db, User, ensure_tables
+from app.routes.api import api_bp
 from app.routes.auth import auth_bp
 from app.routes.main import main_bp
 from app.config import Config
+from app.utils.http import run_on_thread_loop
+from app.utils.json_provider import make_json_provider
+from app.utils.query_stats import init_query_stats
+from app.utils.profiler import init_profiler
+from app.utils.replicas import replica_binds
+from app.utils.sqlite import configure_sqlite, init_sqlite
+from app.utils.auth_events import init_auth_events
+from app.utils.cleanup import init_cleanup
+from app.utils.tracing import init_tracing
+from app.utils.log import init_logging
+from app.utils.revocation import get_revocation_list
 
 def create_app():
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(Config)
     
-    # Initialize database (no migrations - just connection setup)
+    # JSON log lines with request ids, written to stdout by a background thread (LOG_*)
+    init_logging(app)
+    
+    # Run async views on a per-thread loop that keeps its provider connections
+    app.async_to_sync = run_on_thread_loop
+    
+    # orjson for API responses and request bodies when installed (JSON_PROVIDER)
+    app.json = make_json_provider(app)
+    
+    # Read replicas become extra binds; RoutingSession decides per statement
+    app.config['SQLALCHEMY_BINDS'] = {
+        **app.config.get('SQLALCHEMY_BINDS', {}),
+        **replica_binds(app.config['SQLALCHEMY_REPLICA_URIS']),
+    }
+    
+    # SQLite files get WAL, one writer connection and query-only readers (SQLITE_PROFILE)
+    configure_sqlite(app)
+    
+    # Initialize database; schema changes ship as migrations (see manage.py)
     db.init_app(app)
+    init_sqlite(app, db)
+    
+    # Spans for sampled requests, their SQL and provider calls (TRACE_EXPORTER); first, so they cover the rest
+    init_tracing(app)
     
     # Create tables on first request if they don't exist
     @app.before_request
     def create_tables():
-        if not getattr(app, '_tables_created', False):
-            app._tables_created = True
-            try:
-                db.create_all()
-                print("Database tables ready")
-            except Exception as e:
-                print(f"Table note: {e}")
+        ensure_tables(app)
+    
+    # Count queries per request (X-DB-* headers in debug, logs otherwise)
+    init_query_stats(app)
+    
+    # Sample the stacks of requests sent with a signed X-Profile header or picked at random
+    init_profiler(app)
+    
+    # Auth events are buffered in memory and written in batches by a background thread
+    init_auth_events(app)
+    
+    # Stale accounts, codes and tokens trimmed in small batches (CLEANUP_INTERVAL; or flask cleanup)
+    init_cleanup(app)
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -39,8 +80,16 @@ def create_app():
     def load_user(user_id):
         return User.query.get(int(user_id))
     
+    # JSON API tokens; revocation is checked in memory, synced from revoked_token
+    jwt = JWTManager(app)
+    
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_payload):
+        return get_revocation_list().is_revoked(jwt_payload['jti'])
+    
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
+    app.register_blueprint(api_bp)
     
     return app
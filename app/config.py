@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,18 +12,184 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = db_url or "sqlite:///dev.db"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Optional read replicas (comma-separated URIs); plain reads go to a replica unless it
+    # lags more than REPLICA_MAX_LAG seconds or the user wrote in the last few seconds
+    SQLALCHEMY_REPLICA_URIS = os.getenv('SQLALCHEMY_REPLICA_URIS', '')
+    REPLICA_READ_YOUR_WRITES = float(os.getenv('REPLICA_READ_YOUR_WRITES', '5'))
+    REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '2'))
+    REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '5'))
+    
+    # SQLite files: 'wal' = WAL journal, tuned pragmas, one writer connection and a pool of
+    # query-only readers (app/utils/sqlite.py); 'default' = SQLAlchemy's defaults
+    SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'wal')
+    SQLITE_READERS = int(os.getenv('SQLITE_READERS', '8'))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', '16'))  # per connection
+    SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '256'))
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-key-change-in-production")
     
+    # users rows are updated optimistically; a change that lost a race is re-applied up to this many times
+    USER_UPDATE_ATTEMPTS = int(os.getenv('USER_UPDATE_ATTEMPTS', '5'))
+    USER_UPDATE_BACKOFF = float(os.getenv('USER_UPDATE_BACKOFF', '0.005'))  # s; random wait up to this, doubling
+    
+    # JSON API tokens (/api); revocations are checked against an in-memory Bloom filter + set
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY') or SECRET_KEY
+    JWT_TOKEN_LOCATION = ['headers']
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', '900')))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(seconds=int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', '2592000')))
+    REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', '100000'))
+    REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', '1'))  # revocations from other workers
+    REVOCATION_REBUILD_INTERVAL = float(os.getenv('REVOCATION_REBUILD_INTERVAL', '3600'))
+    
+    # JSON encoding/decoding: 'auto' (orjson when installed), 'orjson' or 'stdlib'
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+    JSON_STREAM_CHUNK = int(os.getenv('JSON_STREAM_CHUNK', '1000'))  # longer arrays are streamed
+    
     # Email Settings (Brevo)
     BREVO_API_KEY = os.getenv('BREVO_API_KEY')
     SENDER_EMAIL = os.getenv('SENDER_EMAIL')
     SENDER_NAME = os.getenv('SENDER_NAME', 'BBA Services')
     
+    # Signup email checks: 'dns' (cached MX lookups) or 'local' (syntax only, no DNS)
+    EMAIL_DELIVERABILITY = os.getenv('EMAIL_DELIVERABILITY', 'dns')
+    EMAIL_DNS_TIMEOUT = float(os.getenv('EMAIL_DNS_TIMEOUT', '5'))  # background lookup timeout
+    EMAIL_DNS_WAIT = float(os.getenv('EMAIL_DNS_WAIT', '0.3'))  # max signup waits on an uncached domain
+    EMAIL_DOMAIN_CACHE_SIZE = int(os.getenv('EMAIL_DOMAIN_CACHE_SIZE', '10000'))
+    EMAIL_DOMAIN_POSITIVE_TTL = float(os.getenv('EMAIL_DOMAIN_POSITIVE_TTL', '86400'))
+    EMAIL_DOMAIN_NEGATIVE_TTL = float(os.getenv('EMAIL_DOMAIN_NEGATIVE_TTL', '3600'))
+    
     # SMS Settings (Vonage Verify API for 2FA)
     VONAGE_API_KEY = os.getenv('VONAGE_API_KEY')
     VONAGE_API_SECRET = os.getenv('VONAGE_API_SECRET')
     VONAGE_BRAND_NAME = os.getenv('VONAGE_BRAND_NAME', 'BBA Services')
     
+    # SMS provider routing: names tried per destination country by recent latency/success.
+    # 'vonage' is Vonage Verify; other names need an SMS_HTTP_PROVIDERS entry (name=url,...)
+    SMS_PROVIDERS = os.getenv('SMS_PROVIDERS', 'vonage')
+    SMS_HTTP_PROVIDERS = os.getenv('SMS_HTTP_PROVIDERS', '')
+    SMS_HTTP_TOKEN = os.getenv('SMS_HTTP_TOKEN')
+    SMS_CODE_TTL = int(os.getenv('SMS_CODE_TTL', '300'))
+    # Unanswered challenges older than this are cancelled by `flask cancel-sms-challenges`
+    SMS_CHALLENGE_ABANDON_AFTER = int(os.getenv('SMS_CHALLENGE_ABANDON_AFTER', '180'))
+    SMS_ROUTER_WINDOW = int(os.getenv('SMS_ROUTER_WINDOW', '50'))
+    SMS_ROUTER_MIN_SAMPLES = int(os.getenv('SMS_ROUTER_MIN_SAMPLES', '5'))
+    SMS_ROUTER_EXPLORE = float(os.getenv('SMS_ROUTER_EXPLORE', '0.05'))
+    
+    # Auth event log: 'db' (auth_event table), 'file' (gzipped NDJSON in AUTH_EVENT_DIR) or 'off'
+    AUTH_EVENT_SINK = os.getenv('AUTH_EVENT_SINK', 'db')
+    AUTH_EVENT_BUFFER = int(os.getenv('AUTH_EVENT_BUFFER', '10000'))  # oldest events dropped past this
+    AUTH_EVENT_BATCH_SIZE = int(os.getenv('AUTH_EVENT_BATCH_SIZE', '500'))
+    AUTH_EVENT_FLUSH_INTERVAL = float(os.getenv('AUTH_EVENT_FLUSH_INTERVAL', '1'))
+    AUTH_EVENT_DIR = os.getenv('AUTH_EVENT_DIR', 'auth_events')
+    
+    # Questionnaire storage: months older than the retention are archived to gzipped NDJSON
+    QUESTIONNAIRE_RETENTION_MONTHS = int(os.getenv('QUESTIONNAIRE_RETENTION_MONTHS', '24'))
+    QUESTIONNAIRE_ARCHIVE_DIR = os.getenv('QUESTIONNAIRE_ARCHIVE_DIR', 'archive/questionnaire')
+    QUESTIONNAIRE_PARTITIONS_AHEAD = int(os.getenv('QUESTIONNAIRE_PARTITIONS_AHEAD', '3'))  # PostgreSQL only
+    # Rubric (app/rubrics/<version>.json) that scores new submissions; `flask rescore-questionnaires` applies it to old ones
+    QUESTIONNAIRE_RUBRIC = os.getenv('QUESTIONNAIRE_RUBRIC', 'v1')
+    
+    # Authenticator-app (TOTP) MFA
+    TOTP_ISSUER = os.getenv('TOTP_ISSUER', 'BBA Services')
+    TOTP_INTERVAL = int(os.getenv('TOTP_INTERVAL', '30'))
+    TOTP_DRIFT_STEPS = int(os.getenv('TOTP_DRIFT_STEPS', '1'))  # accepted steps either side of now
+    
+    # Provider REST endpoints used by the async views (override to point at local stand-ins)
+    BREVO_API_URL = os.getenv('BREVO_API_URL', 'https://api.brevo.com/v3')
+    VONAGE_API_URL = os.getenv('VONAGE_API_URL', 'https://api.nexmo.com')
+    PROVIDER_TIMEOUT = float(os.getenv('PROVIDER_TIMEOUT', '3'))
+    PROVIDER_KEEPALIVE = float(os.getenv('PROVIDER_KEEPALIVE', '60'))  # idle pooled connections kept this long
+    
+    # Worker warm-up after fork (gunicorn.conf.py); /ready answers 503 until it is done
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', '1') == '1'
+    WARMUP_DB_CONNECTIONS = int(os.getenv('WARMUP_DB_CONNECTIONS', '2'))  # per engine, capped at the pool size
+    WARMUP_PROVIDERS = os.getenv('WARMUP_PROVIDERS', '0') == '1'  # also connect to Brevo/Vonage/SMS providers
+    
+    # Circuit breakers around Brevo/Vonage calls
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+    BREAKER_HALF_OPEN_CALLS = int(os.getenv('BREAKER_HALF_OPEN_CALLS', '1'))
+    
+    # Email failover when Brevo is down (smtp_relay_server.py)
+    SMTP_RELAY_HOST = os.getenv('SMTP_RELAY_HOST')
+    SMTP_RELAY_PORT = int(os.getenv('SMTP_RELAY_PORT', '25'))
+    
+    # Bulk verification email (Brevo message versions)
+    BULK_EMAIL_BATCH_SIZE = int(os.getenv('BULK_EMAIL_BATCH_SIZE', '500'))  # recipients per request, max 1000
+    BULK_EMAIL_CONCURRENCY = int(os.getenv('BULK_EMAIL_CONCURRENCY', '4'))
+    BULK_EMAIL_TIMEOUT = float(os.getenv('BULK_EMAIL_TIMEOUT', '30'))
+    
+    # ASGI server: view threads per worker. An async view keeps its thread while it awaits a provider,
+    # so this is the number of requests a worker has in flight, as with gunicorn --threads.
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', '256'))
+    # DB pool per worker (not SQLite). Views return their connection before awaiting a provider
+    # (release_connection), so only threads running SQL hold one; the rest of ASGI_THREADS wait up to
+    # DB_POOL_TIMEOUT seconds for one. Keep (DB_POOL_SIZE + DB_MAX_OVERFLOW) x workers (x processes
+    # sharing the database) below PostgreSQL's max_connections, e.g. 100 on a small Railway plan.
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    SQLALCHEMY_ENGINE_OPTIONS = {} if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {
+        'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW, 'pool_timeout': DB_POOL_TIMEOUT,
+    }
+    
+    # Per-request query accounting: log requests over this many queries, and
+    # statements repeated this many times in one request (likely N+1)
+    QUERY_STATS_LOG_THRESHOLD = int(os.getenv('QUERY_STATS_LOG_THRESHOLD', '10'))
+    QUERY_STATS_REPEAT_THRESHOLD = int(os.getenv('QUERY_STATS_REPEAT_THRESHOLD', '3'))
+    
+    # Wave (app/utils/wave.py): OAuth app, endpoints, and per-user response caching of GraphQL queries;
+    # responses are fresh for WAVE_CACHE_TTL seconds, then served stale for WAVE_CACHE_STALE while refreshed
+    WAVE_CLIENT_ID = os.getenv('WAVE_CLIENT_ID')
+    WAVE_CLIENT_SECRET = os.getenv('WAVE_CLIENT_SECRET')
+    WAVE_REDIRECT_URI = os.getenv('WAVE_REDIRECT_URI')
+    WAVE_OAUTH_URL = os.getenv('WAVE_OAUTH_URL', 'https://api.waveapps.com/oauth2')
+    WAVE_GRAPHQL_URL = os.getenv('WAVE_GRAPHQL_URL', 'https://gql.waveapps.com/graphql/public')
+    WAVE_TIMEOUT = float(os.getenv('WAVE_TIMEOUT', '10'))
+    WAVE_CACHE_TTL = float(os.getenv('WAVE_CACHE_TTL', '60'))
+    WAVE_CACHE_STALE = float(os.getenv('WAVE_CACHE_STALE', '300'))
+    WAVE_CACHE_SIZE = int(os.getenv('WAVE_CACHE_SIZE', '5000'))  # responses kept per process
+    WAVE_SESSION_CACHE = int(os.getenv('WAVE_SESSION_CACHE', '256'))  # authenticated sessions kept per process
+    WAVE_POOL_SIZE = int(os.getenv('WAVE_POOL_SIZE', '10'))
+    WAVE_RATE_LIMIT = float(os.getenv('WAVE_RATE_LIMIT', '5'))  # queries per second per process, 0 = unlimited
+    WAVE_RATE_BURST = int(os.getenv('WAVE_RATE_BURST', '10'))
+    WAVE_RATE_WAIT = float(os.getenv('WAVE_RATE_WAIT', '2'))  # longest a request waits for its turn
+    
+    # Request profiler: fraction of requests sampled (plus any with a signed X-Profile header)
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))  # seconds between stack samples
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+    
+    # Cleanup job (app/utils/cleanup.py, flask cleanup): keyset batches with a pause between them;
+    # CLEANUP_INTERVAL > 0 also runs it in a background thread of each worker, every that many seconds
+    CLEANUP_UNVERIFIED_DAYS = int(os.getenv('CLEANUP_UNVERIFIED_DAYS', '7'))  # unverified accounts deleted after
+    CLEANUP_BATCH_SIZE = int(os.getenv('CLEANUP_BATCH_SIZE', '500'))
+    CLEANUP_BATCH_PAUSE = float(os.getenv('CLEANUP_BATCH_PAUSE', '0.05'))
+    CLEANUP_INTERVAL = float(os.getenv('CLEANUP_INTERVAL', '0'))
+    
+    # Tracing (app/utils/tracing.py): 'file' (OTLP/JSON lines in TRACE_DIR), 'otlp' (POST to an
+    # OTLP/HTTP collector at TRACE_OTLP_URL) or 'off'; requests are sampled when they start
+    TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'off')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))  # unless the caller's traceparent decides
+    TRACE_MAX_PER_SECOND = int(os.getenv('TRACE_MAX_PER_SECOND', '20'))  # sampled requests per process, any source
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'bba-services')
+    TRACE_OTLP_URL = os.getenv('TRACE_OTLP_URL', 'http://localhost:4318/v1/traces')
+    TRACE_DIR = os.getenv('TRACE_DIR', 'traces')
+    TRACE_BUFFER = int(os.getenv('TRACE_BUFFER', '20000'))  # finished spans; oldest dropped past this
+    TRACE_BATCH_SIZE = int(os.getenv('TRACE_BATCH_SIZE', '512'))
+    TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', '2'))
+    
+    # Logging (app/utils/log.py): one JSON line per record on stdout, written by a background thread;
+    # LOG_LEVELS and LOG_SAMPLING take 'logger=value' pairs, applied to that logger and its children
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING,httpcore=WARNING')
+    LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')  # fraction of records below WARNING kept, e.g. app.utils.sms=0.1
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # or 'text'
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # records waiting to be written; newer ones dropped
+    
     # Security Settings
     SESSION_COOKIE_SECURE = os.getenv('FLASK_ENV') == 'production'
     SESSION_COOKIE_HTTPONLY = True
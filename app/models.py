@@ -1,44 +1,78 @@
+import logging
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils import totp, tracing
+from app.utils.replicas import RoutingSession
 
-db = SQLAlchemy()
+# Reads may be routed to replicas (SQLALCHEMY_REPLICA_URIS); see app/utils/replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_tables(app):
+    """Create missing tables once per process (first request, or worker warm-up)."""
+    if not getattr(app, '_tables_created', False):
+        app._tables_created = True
+        try:
+            db.create_all()
+            logger.info("Database tables ready")
+        except Exception as e:
+            logger.warning("Table note: %s", e)
+
+
+def release_connection():
+    """End the current read transaction so its pooled connection is returned
+    before awaiting a provider call. Loaded objects reload on next access."""
+    db.session.commit()
 
 
 class User(UserMixin, db.Model):
-    """Simple user model with email verification and optional SMS MFA."""
+    """Simple user model with email verification and optional SMS or TOTP MFA."""
     
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
+    # Bumped on every UPDATE; a commit based on an outdated row raises StaleDataError
+    # (see app/utils/optimistic.py)
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     is_verified = db.Column(db.Boolean, default=False, nullable=False)
     
     # Optional MFA fields
-    phone = db.Column(db.String(20), nullable=True)
+    phone = db.Column(db.String(20), nullable=True, index=True)
     mfa_enabled = db.Column(db.Boolean, default=False, nullable=False)
+    mfa_method = db.Column(db.String(10), nullable=True)  # 'sms' or 'totp'
+    totp_secret = db.Column(db.String(32), nullable=True)  # Base32 authenticator secret
     
     # Temporary codes
     verification_code = db.Column(db.String(6), nullable=True)  # Email verification
     sms_code = db.Column(db.String(6), nullable=True)  # SMS MFA code (legacy)
     vonage_request_id = db.Column(db.String(64), nullable=True)  # Vonage Verify request ID
+    sms_challenge_phone = db.Column(db.String(20), nullable=True)  # Number the active challenge went to
+    sms_challenge_sent_at = db.Column(db.DateTime, nullable=True)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     verified_at = db.Column(db.DateTime, nullable=True)
     
+    __mapper_args__ = {'version_id_col': version_id}
+    
     def __repr__(self):
         return f'<User {self.email}>'
     
     def set_password(self, password):
         """Hash and set the user's password."""
-        self.password_hash = generate_password_hash(password)
+        with tracing.span('password.hash'):
+            self.password_hash = generate_password_hash(password)
     
     def check_password(self, password):
         """Verify the password against the stored hash."""
-        return check_password_hash(self.password_hash, password)
+        with tracing.span('password.verify'):
+            return check_password_hash(self.password_hash, password)
     
     def verify_email(self):
         """Mark the user's email as verified."""
@@ -50,25 +84,92 @@ class User(UserMixin, db.Model):
         """Enable SMS-based MFA with phone number."""
         self.phone = phone_number
         self.mfa_enabled = True
+        self.mfa_method = 'sms'
+    
+    def generate_totp_secret(self):
+        """Create a new authenticator secret (not active until enable_totp)."""
+        self.totp_secret = totp.new_secret()
+        return self.totp_secret
+    
+    def verify_totp(self, token):
+        """Check an authenticator code locally; each code is accepted once."""
+        return totp.verify(self.id, self.totp_secret, token)
+    
+    def enable_totp(self):
+        """Enable authenticator-app MFA with the current secret."""
+        self.mfa_enabled = True
+        self.mfa_method = 'totp'
+    
+    def set_sms_challenge(self, challenge_id, phone_number, sent_at):
+        """Remember the SMS challenge the user should answer."""
+        self.vonage_request_id = challenge_id
+        self.sms_challenge_phone = phone_number
+        self.sms_challenge_sent_at = sent_at
+    
+    def clear_sms_challenge(self):
+        """Forget the SMS challenge once answered."""
+        self.set_sms_challenge(None, None, None)
+    
+    @property
+    def uses_totp(self):
+        return self.mfa_enabled and self.mfa_method == 'totp'
     
     def disable_mfa(self):
         """Disable MFA."""
         self.mfa_enabled = False
+        self.mfa_method = None
         self.phone = None
         self.sms_code = None
+        self.totp_secret = None
+
+
+class AuthEvent(db.Model):
+    """Append-only audit record of an auth event (see app/utils/auth_events.py)."""
+    
+    __tablename__ = 'auth_event'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    event = db.Column(db.String(32), nullable=False)
+    # No foreign key: the trail outlives the user and inserts never wait on users
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    email = db.Column(db.String(120), nullable=True)
+    ip = db.Column(db.String(45), nullable=True)
+    user_agent = db.Column(db.String(255), nullable=True)
+    detail = db.Column(db.JSON, nullable=True)
+
+
+class RevokedToken(db.Model):
+    """A revoked API token, kept until it would have expired (see app/utils/revocation.py)."""
+    
+    __tablename__ = 'revoked_token'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)  # 'access' or 'refresh'
+    user_id = db.Column(db.Integer, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
 
 class QuestionnaireResponse(db.Model):
+    # Partitioned by month on created_at on PostgreSQL (migration 006); old
+    # months are archived to files, see app/utils/questionnaire_storage.py
+    __table_args__ = (
+        db.Index('ix_questionnaire_response_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     answers = db.Column(db.JSON, nullable=False)
     score = db.Column(db.Float)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rubric_version = db.Column(db.String(20))  # rubric that computed score, see app/utils/scoring.py
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
 
 
 class WaveToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     access_token = db.Column(db.String, nullable=False)
     refresh_token = db.Column(db.String)
     expires_at = db.Column(db.DateTime)
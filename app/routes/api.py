@@ -0,0 +1,275 @@
+"""
+JSON API for the mobile clients.
+
+Clients log in with email, password and their MFA code and get a
+short-lived access token plus a refresh token, sent back as
+`Authorization: Bearer <token>`. Token checks are stateless apart from
+the in-memory revocation list (app/utils/revocation.py).
+"""
+import random
+from datetime import datetime
+
+from email_validator import EmailNotValidError
+from flask import Blueprint, current_app, jsonify, redirect, request, session, url_for
+from flask_jwt_extended import (create_access_token, create_refresh_token, decode_token, get_jwt,
+                                get_jwt_identity, jwt_required)
+
+from app.models import db, User, QuestionnaireResponse, WaveToken, release_connection
+from app.utils.auth_events import emit
+from app.utils.deliverability import validate_signup_email
+from app.utils.email import send_verification_email_async
+from app.utils.json_provider import json_array_response
+from app.utils.optimistic import update_user
+from app.utils.questionnaire_storage import list_responses
+from app.utils.revocation import revoke_token
+from app.utils.sms import verify_sms_code_async
+from app.utils.sms_challenges import (active_challenge, clear_answered_challenge, request_sms_challenge,
+                                      store_sms_challenge)
+from app.utils.wave import WaveError, WaveNotConnected, WaveRateLimited, get_wave_client, wave_query
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+def _error(message, status, **extra):
+    return jsonify({'error': message, **extra}), status
+
+
+def _tokens(user_id):
+    identity = str(user_id)
+    return {'access_token': create_access_token(identity=identity),
+            'refresh_token': create_refresh_token(identity=identity)}
+
+
+@api_bp.route('/auth/register', methods=['POST'])
+async def register():
+    """Create an account; the emailed code is confirmed at /api/auth/verify-email."""
+    data = request.get_json(silent=True) or {}
+    email = (data.get('email') or '').strip()
+    password = data.get('password') or ''
+
+    if not email or len(password) < 6:
+        return _error('Email and a password of at least 6 characters are required', 400)
+    try:
+        await validate_signup_email(email)
+    except EmailNotValidError:
+        return _error('Invalid email address', 400)
+    if User.query.filter_by(email=email).first():
+        return _error('Email already registered', 409)
+
+    verification_code = str(random.randint(100000, 999999))
+    user = User(email=email)
+    user.set_password(password)
+    user.verification_code = verification_code
+    db.session.add(user)
+    db.session.commit()
+    emit('signup', user.id, email, channel='api')
+
+    sent = await send_verification_email_async(email, verification_code)
+    return jsonify({'message': 'Account created', 'verification_email_sent': sent}), 201
+
+
+@api_bp.route('/auth/verify-email', methods=['POST'])
+def verify_email():
+    """Confirm the emailed verification code."""
+    data = request.get_json(silent=True) or {}
+    email, code = (data.get('email') or '').strip(), (data.get('code') or '').strip()
+
+    user = User.query.filter_by(email=email).first()
+    if not user or user.is_verified or not code or user.verification_code != code:
+        if user and not user.is_verified:
+            emit('email_verification_failed', user.id, email, channel='api')
+        return _error('Invalid verification code', 400)
+
+    def verify(user):
+        if user.is_verified or user.verification_code != code:
+            return False  # a resend replaced the code meanwhile
+        user.verify_email()
+
+    user_id = user.id
+    if not update_user(user, verify):
+        return _error('Invalid verification code', 400)
+    emit('email_verified', user_id, email, channel='api')
+    return jsonify({'message': 'Email verified'}), 200
+
+
+@api_bp.route('/auth/login', methods=['POST'])
+async def login():
+    """
+    Exchange credentials for tokens.
+
+    Users with SMS MFA call this twice: without `sms_code` to have a code
+    sent (401 with mfa_required), then with it. TOTP users send `totp_code`.
+    """
+    data = request.get_json(silent=True) or {}
+    email = (data.get('email') or '').strip()
+    password = data.get('password') or ''
+
+    user = User.query.filter_by(email=email).first()
+    if not user or not user.check_password(password):
+        emit('login_failed', user.id if user else None, email, channel='api',
+             reason='bad_password' if user else 'unknown_email')
+        return _error('Invalid credentials', 401)
+    if not user.is_verified:
+        return _error('Email not verified', 403)
+
+    user_id = user.id
+    if user.uses_totp:
+        totp_code = (data.get('totp_code') or '').strip()
+        if not totp_code:
+            return _error('Authenticator code required', 401, mfa_required='totp')
+        if not user.verify_totp(totp_code):
+            emit('mfa_failed', user_id, email, method='totp', channel='api')
+            return _error('Invalid authenticator code', 401, mfa_required='totp')
+
+    elif user.mfa_enabled:
+        sms_code = (data.get('sms_code') or '').strip()
+        phone, pending_request_id = user.phone, user.vonage_request_id
+        active = active_challenge(user, phone)
+        release_connection()
+
+        if not sms_code:
+            request_id, reused = await request_sms_challenge(user_id, phone, active, pending_request_id)
+            if not request_id:
+                return _error('Failed to send SMS code', 503)
+            if not reused and not store_sms_challenge(user, request_id, phone, pending_request_id):
+                reused = True  # another request stored its challenge first
+            emit('mfa_challenge_sent', user_id, email, method='sms', reused=reused, channel='api')
+            return _error('SMS code required', 401, mfa_required='sms', phone_last4=phone[-4:])
+
+        if not pending_request_id or not await verify_sms_code_async(pending_request_id, sms_code):
+            emit('mfa_failed', user_id, email, method='sms', channel='api')
+            return _error('Invalid SMS code', 401, mfa_required='sms')
+        clear_answered_challenge(user, pending_request_id)
+
+    emit('login', user_id, email, channel='api')
+    return jsonify(_tokens(user_id)), 200
+
+
+@api_bp.route('/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """New access token for a valid refresh token."""
+    return jsonify({'access_token': create_access_token(identity=get_jwt_identity())}), 200
+
+
+@api_bp.route('/auth/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """Revoke the presented token, and the refresh token if sent in the body."""
+    claims = get_jwt()
+    revoke_token(claims)
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            decoded = decode_token(refresh_token)
+        except Exception:
+            decoded = None
+        if decoded and decoded['sub'] == claims['sub']:
+            revoke_token(decoded)
+    emit('logout', int(claims['sub']), None, channel='api')
+    return jsonify({'message': 'Logged out'}), 200
+
+
+@api_bp.route('/me')
+@jwt_required()
+def me():
+    """The caller's identity and the claims of the token used."""
+    claims = get_jwt()
+    return jsonify({'user_id': int(claims['sub']), 'expires_at': claims['exp']}), 200
+
+
+@api_bp.route('/questionnaire', methods=['POST'])
+@jwt_required()
+def submit_questionnaire():
+    """Store a submission scored with the current rubric; a client-sent score is ignored."""
+    from app.utils.scoring import score_answers
+
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _error('Answers must be a JSON object', 400)
+    answers = {k: v for k, v in data.items() if k != 'score'}
+    score, version = score_answers(answers)
+    qr = QuestionnaireResponse(user_id=user_id, answers=answers, score=score, rubric_version=version)
+    db.session.add(qr)
+    db.session.commit()
+    return jsonify({"id": qr.id, "score": score, "rubric_version": version}), 201
+
+
+@api_bp.route('/questionnaire', methods=['GET'])
+@jwt_required()
+def list_questionnaires():
+    # ?archived=1 also reads months moved to the archive files
+    items = list_responses(get_jwt_identity(), include_archived=request.args.get('archived') == '1')
+    return json_array_response([{"id": i['id'], "answers": i['answers'], "score": i['score'],
+                                 "created_at": i['created_at']} for i in items])
+
+
+@api_bp.route('/wave/connect')
+@jwt_required()
+def wave_connect():
+    from requests_oauthlib import OAuth2Session
+
+    config = current_app.config
+    redirect_uri = config['WAVE_REDIRECT_URI'] or url_for('api.wave_callback', _external=True)
+    oauth = OAuth2Session(config['WAVE_CLIENT_ID'], redirect_uri=redirect_uri)
+    authorization_url, state = oauth.authorization_url(f"{config['WAVE_OAUTH_URL']}/authorize")
+    session['oauth_state'] = state
+    return redirect(authorization_url)
+
+
+@api_bp.route('/wave/callback')
+@jwt_required(optional=True)
+def wave_callback():
+    from requests_oauthlib import OAuth2Session
+
+    config = current_app.config
+    redirect_uri = config['WAVE_REDIRECT_URI'] or url_for('api.wave_callback', _external=True)
+    state = session.pop('oauth_state', None)
+    oauth = OAuth2Session(config['WAVE_CLIENT_ID'], state=state, redirect_uri=redirect_uri)
+    try:
+        token = oauth.fetch_token(f"{config['WAVE_OAUTH_URL']}/token", client_secret=config['WAVE_CLIENT_SECRET'],
+                                  authorization_response=request.url)
+    except Exception as e:
+        return jsonify({"error": "token_exchange_failed", "details": str(e)}), 400
+
+    user_id = get_jwt_identity()
+    if not user_id:
+        # If not authenticated, token can still be returned to caller to associate later
+        return jsonify({"token": token}), 200
+
+    wt = WaveToken(user_id=int(user_id), access_token=token.get('access_token'),
+                   refresh_token=token.get('refresh_token'))
+    expires_at = token.get('expires_at')
+    if expires_at:
+        try:
+            wt.expires_at = datetime.fromtimestamp(int(expires_at))
+        except (TypeError, ValueError):
+            pass
+
+    db.session.add(wt)
+    db.session.commit()
+    get_wave_client().invalidate(int(user_id))
+    return jsonify({"message": "Wave token saved"}), 200
+
+
+BUSINESSES_QUERY = """
+query { businesses(page: 1, pageSize: 50) { edges { node { id name isPersonal } } } }
+"""
+
+
+@api_bp.route('/wave/businesses')
+@jwt_required()
+def wave_businesses():
+    """The user's Wave businesses, served from the per-user Wave cache."""
+    user_id = int(get_jwt_identity())
+    release_connection()  # nothing to hold across the Wave round trip
+    try:
+        data = wave_query(user_id, BUSINESSES_QUERY)
+    except WaveNotConnected:
+        return _error('Wave is not connected', 404)
+    except WaveRateLimited as e:
+        return _error('Wave rate limit reached', 429, retry_after=round(e.retry_after, 1))
+    except WaveError as e:
+        return _error('Wave request failed', 502, details=str(e))
+    return jsonify({"businesses": [edge['node'] for edge in data['businesses']['edges']]})
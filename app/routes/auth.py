@@ -1,16 +1,21 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from email_validator import validate_email, EmailNotValidError
-from app.models import db, User
-from app.utils.email import send_verification_email
-from app.utils.sms import send_sms_code, generate_code
+from email_validator import EmailNotValidError
+from app.models import db, User, release_connection
+from app.utils.auth_events import emit
+from app.utils.deliverability import validate_signup_email
+from app.utils.email import send_verification_email_async
+from app.utils.optimistic import update_user
+from app.utils.sms import verify_sms_code_async, generate_code
+from app.utils.sms_challenges import (active_challenge, clear_answered_challenge, request_sms_challenge,
+                                      store_sms_challenge)
 import random
 
 auth_bp = Blueprint('auth', __name__)
 
 
 @auth_bp.route('/signup', methods=['GET', 'POST'])
-def signup():
+async def signup():
     """Simple signup with email verification."""
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -34,7 +39,8 @@ def signup():
             return render_template('signup.html')
         
         try:
-            validate_email(email)
+            # Domain deliverability is cached; DNS never holds up the request for long
+            await validate_signup_email(email)
         except EmailNotValidError:
             flash('Invalid email address.', 'danger')
             return render_template('signup.html')
@@ -52,9 +58,10 @@ def signup():
         
         db.session.add(user)
         db.session.commit()
+        emit('signup', user.id, email)
         
         # Send verification email
-        if send_verification_email(email, verification_code):
+        if await send_verification_email_async(email, verification_code):
             flash('Account created! Check your email for verification code.', 'success')
             login_user(user)
             return redirect(url_for('auth.verify_email'))
@@ -75,19 +82,37 @@ def verify_email():
     if request.method == 'POST':
         code = request.form.get('verification_code', '').strip()
         
-        if current_user.verification_code == code:
-            current_user.verify_email()
-            db.session.commit()
+        def verify(user):
+            if user.is_verified or user.verification_code != code:
+                return False  # a resend replaced the code meanwhile
+            user.verify_email()
+        
+        user_id, email = current_user.id, current_user.email
+        if current_user.verification_code == code and update_user(current_user, verify):
+            emit('email_verified', user_id, email)
             flash('Email verified! You can now access your dashboard.', 'success')
             return redirect(url_for('main.dashboard'))
         else:
+            emit('email_verification_failed', current_user.id, current_user.email)
             flash('Invalid verification code.', 'danger')
     
     return render_template('verify_email.html')
 
 
+def _sms_sent(user, user_id, user_email, request_id, phone, reused, previous):
+    """Store a newly sent challenge; a reused one is already stored."""
+    if not reused and not store_sms_challenge(user, request_id, phone, previous):
+        reused = True  # another request stored its challenge first
+    emit('mfa_challenge_sent', user_id, user_email, method='sms', reused=reused)
+    if reused:
+        flash(f'A code was already sent to your phone ending in {phone[-4:]}. '
+              'Please enter that code.', 'info')
+        return
+    flash(f'SMS code sent to your phone ending in {phone[-4:]}.', 'success')
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
-def login():
+async def login():
     """Simple login with optional MFA."""
     if current_user.is_authenticated:
         if not current_user.is_verified:
@@ -106,34 +131,47 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if not user or not user.check_password(password):
+            emit('login_failed', user.id if user else None, email,
+                 reason='bad_password' if user else 'unknown_email')
             flash('Invalid email or password.', 'danger')
             return render_template('login.html')
         
         # Check MFA if enabled
-        if user.mfa_enabled:
+        if user.uses_totp:
+            # Authenticator codes are checked locally, no provider round trip
+            totp_code = request.form.get('totp_code', '').strip()
+            if not totp_code:
+                return render_template('login.html', require_mfa=True, mfa_method='totp', email=email)
+            
+            if not user.verify_totp(totp_code):
+                emit('mfa_failed', user.id, email, method='totp')
+                flash('Invalid authenticator code.', 'danger')
+                return render_template('login.html', require_mfa=True, mfa_method='totp', email=email)
+        
+        elif user.mfa_enabled:
+            user_id, phone, pending_request_id = user.id, user.phone, user.vonage_request_id
+            active = active_challenge(user, phone)
+            release_connection()
+            
             if not sms_code:
                 # Send SMS code automatically on first login attempt
-                request_id = send_sms_code(user.phone, None)
+                request_id, reused = await request_sms_challenge(user_id, phone, active, pending_request_id)
                 if request_id:
-                    user.vonage_request_id = request_id
-                    db.session.commit()
-                    flash(f'SMS code sent to your phone ending in {user.phone[-4:]}.', 'success')
+                    _sms_sent(user, user_id, email, request_id, phone, reused, pending_request_id)
                 else:
                     flash('Failed to send SMS code. Please try again.', 'danger')
                 return render_template('login.html', require_mfa=True, email=email)
             
-            # Import verify function
-            from app.utils.sms import verify_sms_code
-            
-            if not user.vonage_request_id or not verify_sms_code(user.vonage_request_id, sms_code):
+            if not pending_request_id or not await verify_sms_code_async(pending_request_id, sms_code):
+                emit('mfa_failed', user_id, email, method='sms')
                 flash('Invalid SMS code.', 'danger')
                 return render_template('login.html', require_mfa=True, email=email)
             
-            # Clear request ID after use
-            user.vonage_request_id = None
-            db.session.commit()
+            # Clear the challenge after use
+            clear_answered_challenge(user, pending_request_id)
         
         login_user(user)
+        emit('login', user.id, email, mfa=user.mfa_method if user.mfa_enabled else None)
         
         if not user.is_verified:
             return redirect(url_for('auth.verify_email'))
@@ -147,6 +185,7 @@ def login():
 @login_required
 def logout():
     """Logout user."""
+    emit('logout', current_user.id, current_user.email)
     logout_user()
     flash('Logged out.', 'info')
     return redirect(url_for('auth.login'))
@@ -154,17 +193,25 @@ def logout():
 
 @auth_bp.route('/resend-verification')
 @login_required
-def resend_verification():
+async def resend_verification():
     """Resend email verification code."""
     if current_user.is_verified:
         flash('Email already verified.', 'info')
         return redirect(url_for('main.dashboard'))
     
     verification_code = str(random.randint(100000, 999999))
-    current_user.verification_code = verification_code
-    db.session.commit()
     
-    if send_verification_email(current_user.email, verification_code):
+    def resend(user):
+        if user.is_verified:
+            return False  # verified in another tab meanwhile
+        user.verification_code = verification_code
+    
+    email = current_user.email
+    if not update_user(current_user, resend):
+        flash('Email already verified.', 'info')
+        return redirect(url_for('main.dashboard'))
+    
+    if await send_verification_email_async(email, verification_code):
         flash('Verification code resent.', 'success')
     else:
         flash('Failed to send email.', 'danger')
@@ -173,7 +220,7 @@ def resend_verification():
 
 
 @auth_bp.route('/request-sms-code', methods=['POST'])
-def request_sms_code():
+async def request_sms_code():
     """Resend SMS code for MFA login (for users not yet logged in)."""
     email = request.form.get('email', '').strip()
     
@@ -187,12 +234,14 @@ def request_sms_code():
         flash('Unable to send SMS code.', 'danger')
         return redirect(url_for('auth.login'))
     
-    # Send SMS code via Vonage - it returns request_id
-    request_id = send_sms_code(user.phone, None)  # Vonage generates the code
+    user_id, phone, pending_request_id = user.id, user.phone, user.vonage_request_id
+    active = active_challenge(user, phone)
+    release_connection()
+    
+    # Reuses the code already on its way unless it has expired
+    request_id, reused = await request_sms_challenge(user_id, phone, active, pending_request_id)
     if request_id:
-        user.vonage_request_id = request_id
-        db.session.commit()
-        flash(f'SMS code sent to your phone ending in {user.phone[-4:]}.', 'success')
+        _sms_sent(user, user_id, email, request_id, phone, reused, pending_request_id)
     else:
         flash('Failed to send SMS.', 'danger')
     
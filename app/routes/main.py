@@ -1,7 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, current_app, render_template, redirect, url_for, request, flash
 from flask_login import login_required, current_user
-from app.models import db
-from app.utils.sms import send_sms_code, generate_code
+from app.models import User, release_connection
+from app.utils.auth_events import emit, get_auth_event_log
+from app.utils.breaker import breaker_states
+from app.utils.deliverability import get_domain_cache
+from app.utils.optimistic import update_user
+from app.utils.query_stats import endpoint_totals
+from app.utils.sms_providers import get_router
+from app.utils.totp import provisioning_uri
+from app.utils.log import get_log_stats
+from app.utils.tracing import get_tracer
+from app.utils.warmup import start_warm_up, warmup_state
+from app.utils.sms import verify_sms_code_async, generate_code
+from app.utils.sms_challenges import active_challenge, request_sms_challenge, store_sms_challenge
 
 main_bp = Blueprint('main', __name__)
 
@@ -12,6 +23,53 @@ def health():
     return {'status': 'ok'}, 200
 
 
+@main_bp.route('/ready')
+def ready():
+    """Readiness: 200 once this worker has warmed up (see app/utils/warmup.py)."""
+    if not current_app.config['WARMUP_ENABLED']:
+        return {'status': 'ready', 'warmup': 'disabled'}, 200
+    state = warmup_state()
+    if state['status'] == 'ready':
+        return state, 200
+    # Servers without the gunicorn hook (flask run, bare uvicorn) warm up on the first probe
+    start_warm_up(current_app._get_current_object())
+    return warmup_state(), 503
+
+
+@main_bp.route('/health/providers')
+def provider_health():
+    """Circuit breaker state, SMS routing stats and the email domain cache."""
+    return {
+        'breakers': breaker_states(),
+        'sms_routing': get_router().snapshot(),
+        'email_domains': get_domain_cache().snapshot(),
+    }, 200
+
+
+@main_bp.route('/health/queries')
+def query_health():
+    """Per-endpoint query counts, DB time and suspected N+1 requests."""
+    return {'endpoints': endpoint_totals()}, 200
+
+
+@main_bp.route('/health/auth-events')
+def auth_event_health():
+    """Auth event buffer depth, writes and drops."""
+    return get_auth_event_log().stats(), 200
+
+
+@main_bp.route('/health/traces')
+def trace_health():
+    """Sampling decisions, spans buffered, exported and dropped."""
+    return get_tracer().stats(), 200
+
+
+@main_bp.route('/health/logs')
+def log_health():
+    """Log records queued, waiting, dropped on a full queue and sampled out."""
+    return get_log_stats(), 200
+
+
 @main_bp.route('/')
 def index():
     """Landing page."""
@@ -30,7 +88,7 @@ def dashboard():
 
 @main_bp.route('/enable-mfa', methods=['GET', 'POST'])
 @login_required
-def enable_mfa():
+async def enable_mfa():
     """Enable SMS-based MFA."""
     if not current_user.is_verified:
         return redirect(url_for('auth.verify_email'))
@@ -46,16 +104,21 @@ def enable_mfa():
             # Step 2: Verify code and enable MFA
             phone = request.form.get('phone_hidden')
             
-            # Import verify function
-            from app.utils.sms import verify_sms_code
+            user_id, email, request_id = current_user.id, current_user.email, current_user.vonage_request_id
+            release_connection()
             
-            if current_user.vonage_request_id and verify_sms_code(current_user.vonage_request_id, sms_code):
-                current_user.enable_mfa(phone)
-                current_user.vonage_request_id = None  # Clear temp request_id
-                db.session.commit()
+            def enable(user):
+                user.enable_mfa(phone)
+                if user.vonage_request_id == request_id:
+                    user.clear_sms_challenge()
+            
+            if request_id and await verify_sms_code_async(request_id, sms_code):
+                update_user(current_user, enable)
+                emit('mfa_enabled', user_id, email, method='sms')
                 flash('SMS MFA enabled successfully!', 'success')
                 return redirect(url_for('main.dashboard'))
             else:
+                emit('mfa_failed', user_id, email, method='sms')
                 flash('Invalid verification code.', 'danger')
                 return render_template('enable_mfa.html', phone=phone, step=2)
         else:
@@ -65,11 +128,21 @@ def enable_mfa():
                 flash('Phone number required.', 'danger')
                 return render_template('enable_mfa.html')
             
-            # Send SMS code via Vonage - it returns request_id
-            request_id = send_sms_code(phone, None)  # Vonage generates the code
+            user_id, email, pending_request_id = current_user.id, current_user.email, current_user.vonage_request_id
+            active = active_challenge(current_user, phone)
+            release_connection()
+            
+            # A double-submitted form reuses the code already on its way
+            request_id, reused = await request_sms_challenge(user_id, phone, active, pending_request_id)
+            if request_id and not reused and not store_sms_challenge(current_user, request_id, phone,
+                                                                     pending_request_id):
+                reused = True  # another request stored its challenge first
+            if request_id:
+                emit('mfa_challenge_sent', user_id, email, method='sms', reused=reused)
+            if reused:
+                flash('A code was already sent to your phone. Please enter that code.', 'info')
+                return render_template('enable_mfa.html', phone=phone, step=2)
             if request_id:
-                current_user.vonage_request_id = request_id
-                db.session.commit()
                 flash('Verification code sent to your phone.', 'success')
                 return render_template('enable_mfa.html', phone=phone, step=2)
             else:
@@ -79,11 +152,51 @@ def enable_mfa():
     return render_template('enable_mfa.html')
 
 
+@main_bp.route('/enable-totp', methods=['GET', 'POST'])
+@login_required
+def enable_totp():
+    """Enable authenticator-app (TOTP) MFA."""
+    if not current_user.is_verified:
+        return redirect(url_for('auth.verify_email'))
+    
+    if current_user.mfa_enabled:
+        flash('MFA already enabled.', 'info')
+        return redirect(url_for('main.dashboard'))
+    
+    if request.method == 'POST':
+        totp_code = request.form.get('totp_code', '').strip()
+        secret = current_user.totp_secret
+        
+        def enable(user):
+            if user.totp_secret != secret:
+                return False  # a new secret was issued in another tab meanwhile
+            user.enable_totp()
+        
+        user_id, email = current_user.id, current_user.email
+        if secret and current_user.verify_totp(totp_code) and update_user(current_user, enable):
+            emit('mfa_enabled', user_id, email, method='totp')
+            flash('Authenticator app MFA enabled successfully!', 'success')
+            return redirect(url_for('main.dashboard'))
+        
+        emit('mfa_failed', user_id, email, method='totp')
+        flash('Invalid authenticator code.', 'danger')
+    else:
+        # New secret on every visit until the user confirms a code
+        update_user(current_user, User.generate_totp_secret)
+    
+    return render_template(
+        'enable_totp.html',
+        secret=current_user.totp_secret,
+        uri=provisioning_uri(current_user.totp_secret, current_user.email)
+    )
+
+
 @main_bp.route('/disable-mfa', methods=['POST'])
 @login_required
 def disable_mfa():
     """Disable MFA."""
-    current_user.disable_mfa()
-    db.session.commit()
+    user_id, email, method = current_user.id, current_user.email, current_user.mfa_method
+    update_user(current_user, User.disable_mfa)
+    emit('mfa_disabled', user_id, email, method=method)
     flash('MFA disabled.', 'info')
     return redirect(url_for('main.dashboard'))
\ No newline at end of file
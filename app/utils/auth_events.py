@@ -0,0 +1,203 @@
+"""
+Buffered auth event log.
+
+Routes call emit() for logins, failed passwords, MFA challenges and
+verifications. emit() only appends to an in-memory ring buffer of
+AUTH_EVENT_BUFFER events; a background thread drains it every
+AUTH_EVENT_FLUSH_INTERVAL seconds, or as soon as AUTH_EVENT_BATCH_SIZE
+events are waiting, and writes each batch with one multi-row INSERT into
+the append-only auth_event table (AUTH_EVENT_SINK=db) or to hourly
+gzip-compressed NDJSON files in AUTH_EVENT_DIR (AUTH_EVENT_SINK=file).
+
+Auditing never waits on the database. When the buffer is full the oldest
+event is overwritten, and when a batch cannot be written it is dropped;
+both are counted in stats() and served at /health/auth-events.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import insert
+
+from app.models import db, AuthEvent
+from app.utils import tracing
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {
+    'signup',
+    'email_verified',
+    'email_verification_failed',
+    'login',
+    'login_failed',
+    'logout',
+    'mfa_challenge_sent',
+    'mfa_failed',
+    'mfa_enabled',
+    'mfa_disabled',
+}
+
+
+class AuthEventLog:
+    """Ring buffer of pending events plus the thread that flushes it."""
+
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.sink = config['AUTH_EVENT_SINK']
+        self.batch_size = config['AUTH_EVENT_BATCH_SIZE']
+        self.flush_interval = config['AUTH_EVENT_FLUSH_INTERVAL']
+        self.directory = config['AUTH_EVENT_DIR']
+        self._buffer = deque(maxlen=config['AUTH_EVENT_BUFFER'])
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self.counts = {'emitted': 0, 'written': 0, 'batches': 0,
+                       'dropped_full': 0, 'dropped_failed': 0, 'write_errors': 0}
+
+    def emit(self, event, trace=None):
+        """Queue ``event``; ``trace`` is the emitting request's tracing context, if it is sampled."""
+        if self.sink == 'off':
+            return
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.counts['dropped_full'] += 1
+            self._buffer.append((event, trace))
+            self.counts['emitted'] += 1
+            pending = len(self._buffer)
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_flusher(self):
+        # Started on first use so each forked worker gets its own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='auth-events', daemon=True)
+            self._thread.start()
+
+    def _take(self):
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        return batch
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written."""
+        written = 0
+        while True:
+            taken = self._take()
+            if not taken:
+                return written
+            batch = [event for event, _ in taken]
+            try:
+                # Linked to every sampled request that queued an event in the batch
+                with tracing.linked_span('auth_events.write', [trace for _, trace in taken],
+                                         sink=self.sink, events=len(batch)):
+                    if self.sink == 'file':
+                        self._write_file(batch)
+                    else:
+                        self._write_db(batch)
+            except Exception as e:
+                with self._lock:
+                    self.counts['write_errors'] += 1
+                    self.counts['dropped_failed'] += len(batch)
+                logger.warning("Auth event batch of %d dropped: %s", len(batch), e)
+                return written
+            written += len(batch)
+            with self._lock:
+                self.counts['written'] += len(batch)
+                self.counts['batches'] += 1
+
+    def _write_db(self, batch):
+        with self.app.app_context():
+            # Straight on the primary engine: no session, no replica routing
+            with db.engine.begin() as connection:
+                connection.execute(insert(AuthEvent), batch)
+
+    def _write_file(self, batch):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"auth-events-{datetime.utcnow():%Y%m%d%H}.ndjson.gz")
+        lines = ''.join(json.dumps({**event, 'created_at': event['created_at'].isoformat() + 'Z'},
+                                   separators=(',', ':')) + '\n'
+                        for event in batch)
+        # Each flush appends a gzip member; gzip/zcat read the file as one stream
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            f.write(lines)
+
+    def stop(self, timeout=5):
+        """Stop the flusher and write what is left."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'buffered': len(self._buffer), 'capacity': self._buffer.maxlen,
+                    'sink': self.sink}
+
+
+_log = None
+
+
+def init_auth_events(app):
+    """Create the process-wide event log for ``app``; flushed again at exit."""
+    global _log
+    _log = AuthEventLog(app)
+    atexit.register(_log.stop)
+    return _log
+
+
+def get_auth_event_log():
+    return _log
+
+
+def emit(event, user_id=None, email=None, **detail):
+    """
+    Record an auth event without blocking the request.
+
+    Pass plain values: views call this after release_connection(), when
+    touching a model attribute would reload it from the database.
+
+    Args:
+        event (str): One of EVENT_TYPES
+        user_id (int): User the event concerns, if known
+        email (str): Address the event concerns (kept for unknown users)
+        **detail: Small JSON-serializable context, e.g. method='sms'
+    """
+    if _log is None:
+        return
+    if event not in EVENT_TYPES:
+        raise ValueError(f"Unknown auth event type: {event}")
+    ip = user_agent = None
+    if has_request_context():
+        ip = request.remote_addr
+        user_agent = (request.user_agent.string or '')[:255] or None
+    _log.emit({
+        'created_at': datetime.utcnow(),
+        'event': event,
+        'user_id': user_id,
+        'email': email,
+        'ip': ip,
+        'user_agent': user_agent,
+        'detail': detail or None,
+    }, tracing.current_context())
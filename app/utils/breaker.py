@@ -0,0 +1,153 @@
+"""
+Circuit breakers for provider calls (Brevo, Vonage).
+
+A breaker opens after consecutive provider failures (timeouts, transport
+errors, 5xx) and short-circuits further calls until the reset timeout
+expires. It then half-opens and lets a limited number of probe calls
+through: a successful probe closes it again, a failed one re-opens it.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker is open."""
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker."""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0,
+                 half_open_max_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self.stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        if state == self._state:
+            return
+        logger.warning("Circuit breaker %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self.clock()
+            self.stats['opened'] += 1
+        elif state == CLOSED:
+            self._failures = 0
+        self._probes_in_flight = 0
+
+    def allow(self):
+        """Reserve a call slot; False means the call must be short-circuited."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                allowed = True
+            elif state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                allowed = True
+            else:
+                allowed = False
+            self.stats['calls' if allowed else 'rejected'] += 1
+            return allowed
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.stats['failures'] += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    @contextmanager
+    def guard(self, ignore=()):
+        """Run the enclosed provider call under the breaker.
+
+        Raises CircuitOpenError without running the block when the breaker
+        is open. Exceptions escaping the block count as failures unless
+        they are instances of ``ignore`` (e.g. a wrong-code response).
+        Works around ``await`` expressions as well as sync calls.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            yield self
+        except ignore:
+            self.record_success()
+            raise
+        except BaseException:
+            self.record_failure()
+            raise
+        self.record_success()
+
+    def reset(self):
+        with self._lock:
+            self._transition(CLOSED)
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in': (max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+                             if state == OPEN else 0.0),
+                **self.stats,
+            }
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Return the process-wide breaker for a provider, creating it from config."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(
+                    name,
+                    failure_threshold=current_app.config['BREAKER_FAILURE_THRESHOLD'],
+                    reset_timeout=current_app.config['BREAKER_RESET_TIMEOUT'],
+                    half_open_max_calls=current_app.config['BREAKER_HALF_OPEN_CALLS'],
+                )
+    return breaker
+
+
+def breaker_states():
+    """Snapshot of every breaker, for health checks and tests."""
+    return {name: breaker.snapshot() for name, breaker in sorted(_breakers.items())}
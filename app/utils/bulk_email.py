@@ -0,0 +1,160 @@
+"""
+Bulk verification email sending through Brevo message versions.
+
+One Brevo request carries up to BULK_EMAIL_BATCH_SIZE recipients: the
+HTML is a template and each message version supplies its recipient's
+code as a param. Batches are sent with at most BULK_EMAIL_CONCURRENCY
+requests in flight, and every recipient's outcome is appended to an
+NDJSON results file so a rerun only retries the ones that did not go out.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+from flask import current_app
+
+from app.utils.breaker import get_breaker, CircuitOpenError
+from app.utils.email import ProviderClientError, VERIFICATION_SUBJECT, _sender, _verification_html
+
+logger = logging.getLogger(__name__)
+
+# Brevo caps messageVersions at 1000 per request
+MAX_BATCH_SIZE = 1000
+
+
+def read_outbox(path):
+    """Yield {"email", "code"} dicts from an NDJSON outbox (see user_import)."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def sent_emails(results_path):
+    """Recipients already delivered according to a previous run's results."""
+    sent = set()
+    if results_path and os.path.exists(results_path):
+        for result in read_outbox(results_path):
+            if result.get('status') == 'sent':
+                sent.add(result['email'])
+    return sent
+
+
+def _batch_payload(batch):
+    return {
+        "sender": _sender(),
+        "subject": VERIFICATION_SUBJECT,
+        "htmlContent": _verification_html("{{ params.code }}"),
+        "messageVersions": [
+            {"to": [{"email": message['email']}], "params": {"code": message['code']}}
+            for message in batch
+        ],
+    }
+
+
+async def send_batch(client, url, headers, batch):
+    """Send one batch; returns a result dict per recipient, in order."""
+    try:
+        with get_breaker('brevo').guard(ignore=(ProviderClientError,)):
+            response = await client.post(url, json=_batch_payload(batch), headers=headers)
+            if response.is_server_error:
+                response.raise_for_status()
+            if response.is_client_error:
+                raise ProviderClientError(f"{response.status_code} {response.text}")
+        message_ids = response.json().get('messageIds') or []
+    except CircuitOpenError:
+        return [{'email': m['email'], 'status': 'failed', 'error': 'brevo circuit open'} for m in batch]
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        logger.warning("Failed to send batch of %d via Brevo: %s", len(batch), error)
+        return [{'email': m['email'], 'status': 'failed', 'error': error} for m in batch]
+
+    return [
+        {'email': message['email'], 'status': 'sent',
+         'message_id': message_ids[i] if i < len(message_ids) else None}
+        for i, message in enumerate(batch)
+    ]
+
+
+async def _send_all(messages, batch_size, concurrency, results_file, config):
+    url = f"{config['BREVO_API_URL']}/smtp/email"
+    headers = {"api-key": config['BREVO_API_KEY'] or '', "accept": "application/json"}
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {'sent': 0, 'failed': 0}
+
+    async def worker(client, batch):
+        async with semaphore:
+            results = await send_batch(client, url, headers, batch)
+        for result in results:
+            counts[result['status']] += 1
+            if results_file is not None:
+                results_file.write(json.dumps(result) + '\n')
+        if results_file is not None:
+            results_file.flush()
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=config['BULK_EMAIL_TIMEOUT'], limits=limits) as client:
+        tasks = set()
+        batch = []
+        for message in messages:
+            batch.append(message)
+            if len(batch) == batch_size:
+                tasks.add(asyncio.create_task(worker(client, batch)))
+                batch = []
+            # Keep the number of pending batches bounded so large outboxes stream
+            if len(tasks) >= 2 * concurrency:
+                _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if batch:
+            tasks.add(asyncio.create_task(worker(client, batch)))
+        if tasks:
+            await asyncio.wait(tasks)
+    return counts
+
+
+def send_bulk_verification_emails(messages, batch_size=None, concurrency=None, results_path=None):
+    """
+    Send verification codes to many recipients in Brevo batches.
+
+    Args:
+        messages (iterable): {"email", "code"} dicts
+        batch_size (int): Recipients per Brevo request
+        concurrency (int): Batches in flight at once
+        results_path (str): NDJSON file per-recipient results are appended to;
+            recipients it already lists as sent are skipped
+
+    Returns:
+        dict: sent/failed/skipped counts, elapsed seconds and messages_per_sec
+    """
+    config = current_app.config
+    batch_size = min(batch_size or config['BULK_EMAIL_BATCH_SIZE'], MAX_BATCH_SIZE)
+    concurrency = concurrency or config['BULK_EMAIL_CONCURRENCY']
+
+    already_sent = sent_emails(results_path)
+    skipped = 0
+
+    def pending():
+        nonlocal skipped
+        for message in messages:
+            if message['email'] in already_sent:
+                skipped += 1
+            else:
+                yield message
+
+    started = time.perf_counter()
+    results_file = open(results_path, 'a', encoding='utf-8') if results_path else None
+    try:
+        counts = asyncio.run(_send_all(pending(), batch_size, concurrency, results_file, config))
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    elapsed = time.perf_counter() - started
+    counts['skipped'] = skipped
+    counts['elapsed'] = elapsed
+    counts['messages_per_sec'] = counts['sent'] / elapsed if elapsed else 0.0
+    logger.info("Bulk verification emails: %d sent, %d failed, %d skipped, %.0f messages/sec",
+                counts['sent'], counts['failed'], skipped, counts['messages_per_sec'])
+    return counts
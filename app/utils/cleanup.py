@@ -0,0 +1,252 @@
+"""
+Maintenance job that trims rows nothing will read again.
+
+Steps, in order:
+
+- unverified-users: accounts still unverified CLEANUP_UNVERIFIED_DAYS
+  after signup, with their Wave tokens and questionnaire responses (their
+  auth events stay, like every audit row)
+- stale-codes: verification and legacy SMS codes left on verified users
+- sms-challenges: abandoned SMS challenges, cleared and cancelled at the
+  provider (cancel_abandoned_challenges)
+- wave-tokens: Wave tokens replaced by a newer one of the same user, and
+  expired ones that cannot be refreshed
+- revoked-tokens: revocations of JWTs that have expired anyway
+  (purge_expired)
+
+Each step works in keyset batches of CLEANUP_BATCH_SIZE rows and sleeps
+CLEANUP_BATCH_PAUSE seconds between them. Candidates are read through
+db.session, so a replica or the SQLite readers can serve the scan. Each
+batch is then changed in its own short transaction on the primary,
+which checks the conditions again. A row that changed meanwhile (a user
+who verified) is left alone, and no lock is held across batches. On
+PostgreSQL, rows locked by live requests are skipped and picked up on
+the next run.
+
+`flask cleanup` runs it once. With CLEANUP_INTERVAL set, each worker
+also runs it in a background thread. On PostgreSQL an advisory lock
+makes sure one process at a time does the work; elsewhere, concurrent
+runs are safe, just redundant.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, exists, func, or_, select, text, update
+from sqlalchemy.orm import aliased
+
+from app.models import db, User, QuestionnaireResponse, WaveToken, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+STEPS = ('unverified-users', 'stale-codes', 'sms-challenges', 'wave-tokens', 'revoked-tokens')
+
+# pg_try_advisory_lock key held while a cleanup runs
+ADVISORY_LOCK_KEY = 0x636c65616e  # 'clean'
+
+
+def _batches(candidates, batch_size, pause):
+    """Keyset batches of ids from ``candidates(after, limit)``, sleeping ``pause`` between them."""
+    after = 0
+    while True:
+        ids = candidates(after, batch_size)
+        db.session.commit()  # end the read before the write transaction
+        if not ids:
+            return
+        yield ids
+        if len(ids) < batch_size:
+            return
+        after = ids[-1]
+        time.sleep(pause)
+
+
+def _candidates(model, *conditions):
+    def fetch(after, limit):
+        return db.session.scalars(select(model.id).where(model.id > after, *conditions)
+                                  .order_by(model.id).limit(limit)).all()
+    return fetch
+
+
+def _count(model, *conditions):
+    count = db.session.scalar(select(func.count()).select_from(model).where(*conditions))
+    db.session.commit()
+    return count
+
+
+def _locked(connection, model, ids, *conditions):
+    """Those of ``ids`` still matching ``conditions``, locked; rows other transactions hold are skipped."""
+    return connection.execute(select(model.id).where(model.id.in_(ids), *conditions)
+                              .with_for_update(skip_locked=True)).scalars().all()
+
+
+def delete_unverified_users(days, batch_size, pause, dry_run=False):
+    stale = (User.is_verified.is_(False), User.created_at < datetime.utcnow() - timedelta(days=days))
+    if dry_run:
+        return _count(User, *stale)
+    deleted = 0
+    for ids in _batches(_candidates(User, *stale), batch_size, pause):
+        with db.engine.begin() as connection:
+            ids = _locked(connection, User, ids, *stale)
+            if ids:
+                connection.execute(delete(WaveToken).where(WaveToken.user_id.in_(ids)))
+                connection.execute(delete(QuestionnaireResponse).where(QuestionnaireResponse.user_id.in_(ids)))
+                connection.execute(delete(User).where(User.id.in_(ids)))
+        deleted += len(ids)
+    return deleted
+
+
+def clear_stale_codes(batch_size, pause, dry_run=False):
+    stale = (User.is_verified.is_(True), or_(User.verification_code.is_not(None), User.sms_code.is_not(None)))
+    if dry_run:
+        return _count(User, *stale)
+    cleared = 0
+    for ids in _batches(_candidates(User, *stale), batch_size, pause):
+        with db.engine.begin() as connection:
+            ids = _locked(connection, User, ids, *stale)
+            if ids:
+                # version_id is bumped like any ORM update (app/utils/optimistic.py)
+                connection.execute(update(User).where(User.id.in_(ids)).values(
+                    verification_code=None, sms_code=None, version_id=User.version_id + 1))
+        cleared += len(ids)
+    return cleared
+
+
+def clear_abandoned_challenges(batch_size, pause, dry_run=False):
+    from app.utils.sms_challenges import abandoned_challenges, cancel_abandoned_challenges
+
+    if dry_run:
+        abandoned = datetime.utcnow() - timedelta(seconds=current_app.config['SMS_CHALLENGE_ABANDON_AFTER'])
+        return _count(User, *abandoned_challenges(abandoned))
+    return cancel_abandoned_challenges(batch_size=batch_size, pause=pause)['cleared']
+
+
+def delete_dead_wave_tokens(batch_size, pause, dry_run=False):
+    newer = aliased(WaveToken)
+    dead = or_(
+        exists().where(newer.user_id == WaveToken.user_id, newer.id > WaveToken.id),
+        and_(WaveToken.expires_at < datetime.utcnow(),
+             or_(WaveToken.refresh_token.is_(None), WaveToken.refresh_token == '')),
+    )
+    if dry_run:
+        return _count(WaveToken, dead)
+    deleted = 0
+    for ids in _batches(_candidates(WaveToken, dead), batch_size, pause):
+        with db.engine.begin() as connection:
+            ids = _locked(connection, WaveToken, ids, dead)
+            if ids:
+                connection.execute(delete(WaveToken).where(WaveToken.id.in_(ids)))
+        deleted += len(ids)
+    return deleted
+
+
+def purge_revocations(batch_size, pause, dry_run=False):
+    from app.utils.revocation import purge_expired
+
+    if dry_run:
+        return _count(RevokedToken, RevokedToken.expires_at <= datetime.utcnow())
+    return purge_expired(batch_size, pause)
+
+
+@contextmanager
+def _exclusive():
+    """Yields whether this process may run the job: a PostgreSQL advisory lock, always True elsewhere."""
+    if db.engine.dialect.name != 'postgresql':
+        yield True
+        return
+    # Autocommit, so holding the lock does not keep a transaction (and its snapshot) open
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        acquired = connection.execute(text('SELECT pg_try_advisory_lock(:key)'),
+                                      {'key': ADVISORY_LOCK_KEY}).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+
+
+def run_cleanup(steps=STEPS, batch_size=None, pause=None, dry_run=False, progress=logger.info):
+    """
+    Run the cleanup steps in order.
+
+    Args:
+        steps: Names from STEPS to run
+        batch_size: Rows per batch (default: CLEANUP_BATCH_SIZE)
+        pause: Seconds between batches (default: CLEANUP_BATCH_PAUSE)
+        dry_run: Only count the rows each step would process
+        progress: Called with one line per step
+
+    Returns:
+        dict: Rows processed per step, or None if another process is running the job
+    """
+    config = current_app.config
+    batch_size = batch_size or config['CLEANUP_BATCH_SIZE']
+    pause = config['CLEANUP_BATCH_PAUSE'] if pause is None else pause
+    runners = {
+        'unverified-users': lambda: delete_unverified_users(config['CLEANUP_UNVERIFIED_DAYS'],
+                                                            batch_size, pause, dry_run),
+        'stale-codes': lambda: clear_stale_codes(batch_size, pause, dry_run),
+        'sms-challenges': lambda: clear_abandoned_challenges(batch_size, pause, dry_run),
+        'wave-tokens': lambda: delete_dead_wave_tokens(batch_size, pause, dry_run),
+        'revoked-tokens': lambda: purge_revocations(batch_size, pause, dry_run),
+    }
+    processed = {}
+    with _exclusive() as acquired:
+        if not acquired:
+            progress('Cleanup: another process is running it; skipped')
+            return None
+        for step in (name for name in STEPS if name in steps):
+            started = time.perf_counter()
+            processed[step] = runners[step]()
+            progress(f"Cleanup {step}: {processed[step]} rows{' would be' if dry_run else ''} processed "
+                     f"in {time.perf_counter() - started:.2f}s")
+    return processed
+
+
+class CleanupScheduler:
+    """Runs the cleanup every CLEANUP_INTERVAL seconds in a thread of each worker."""
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['CLEANUP_INTERVAL']
+        self.last_run = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # Started on first use so each forked worker gets its own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='cleanup', daemon=True).start()
+
+    def _run(self):
+        # Jittered, so workers started together do not all wake at once
+        time.sleep(self.interval * random.uniform(0.5, 1.0))
+        while True:
+            try:
+                with self.app.app_context():
+                    self.last_run = run_cleanup()
+            except Exception as e:
+                logger.exception("Cleanup failed: %s", e)
+            time.sleep(self.interval)
+
+
+def init_cleanup(app):
+    """Schedule the cleanup in every worker when CLEANUP_INTERVAL is set."""
+    if app.config['CLEANUP_INTERVAL'] <= 0:
+        return None
+    scheduler = CleanupScheduler(app)
+
+    @app.before_request
+    def start_cleanup_scheduler():
+        scheduler.ensure_started()
+
+    return scheduler
@@ -0,0 +1,163 @@
+"""
+Email address validation with cached, domain-level deliverability.
+
+Syntax is checked locally on every call. Whether the domain accepts
+mail (MX, or A/AAAA fallback) is looked up once per domain and cached:
+deliverable domains for EMAIL_DOMAIN_POSITIVE_TTL, undeliverable ones for
+EMAIL_DOMAIN_NEGATIVE_TTL, in a bounded LRU. Entries close to expiry are
+refreshed in the background while the cached answer is served.
+
+Lookups run on a small thread pool, one in flight per domain. Signup
+waits at most EMAIL_DNS_WAIT seconds for an uncached domain. Past that,
+or when the resolver fails, the address is accepted and the lookup
+finishes in the background for the next signup. With
+EMAIL_DELIVERABILITY=local no DNS is done at all.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from email_validator import validate_email, EmailUndeliverableError
+from flask import current_app
+
+from app.utils import tracing
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='email-dns')
+
+
+def resolve_domain(domain, timeout):
+    """True if ``domain`` accepts mail, False if it does not, None if DNS failed."""
+    from email_validator.deliverability import validate_email_deliverability
+
+    try:
+        info = validate_email_deliverability(domain, domain, timeout=timeout)
+    except EmailUndeliverableError as e:
+        # Unexpected resolver errors are reported this way too; don't cache them
+        if str(e).startswith('There was an error'):
+            return None
+        return False
+    # Timeouts and unreachable nameservers come back as unknown
+    return None if 'unknown-deliverability' in info else True
+
+
+class DomainCache:
+    """Bounded LRU of domain -> (deliverable, cached at, expires at)."""
+
+    def __init__(self, max_entries, positive_ttl, negative_ttl, resolve=resolve_domain):
+        self.max_entries = max_entries
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.resolve = resolve
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'timeouts': 0}
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _store(self, domain, deliverable):
+        now = time.monotonic()
+        ttl = self.positive_ttl if deliverable else self.negative_ttl
+        with self._lock:
+            self._entries[domain] = (deliverable, now, now + ttl)
+            self._entries.move_to_end(domain)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, domain, timeout):
+        try:
+            with tracing.span('email.dns', 'client', **{'email.domain': domain}):
+                deliverable = self.resolve(domain, timeout)
+            if deliverable is not None:
+                self._store(domain, deliverable)
+            return deliverable
+        finally:
+            with self._lock:
+                self._pending.pop(domain, None)
+
+    def _submit(self, domain, timeout):
+        """Start (or join) the lookup for ``domain``; returns its future."""
+        with self._lock:
+            future = self._pending.get(domain)
+            if future is None:
+                future = self._pending[domain] = _executor.submit(tracing.bind(self._lookup), domain, timeout)
+        return future
+
+    def cached(self, domain, timeout):
+        """Cached answer, or None on a miss; schedules a refresh near expiry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None and now >= entry[2]:
+                del self._entries[domain]
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(domain)
+            self.stats['hits'] += 1
+        deliverable, cached_at, expires_at = entry
+        # Refresh in the background during the last 10% of the TTL
+        if now > expires_at - (expires_at - cached_at) / 10 and domain not in self._pending:
+            self.stats['refreshes'] += 1
+            self._submit(domain, timeout)
+        return deliverable
+
+    async def deliverable(self, domain, timeout, wait):
+        """Deliverability of ``domain``, waiting at most ``wait`` seconds on a miss."""
+        cached = self.cached(domain, timeout)
+        if cached is not None:
+            return cached
+        future = asyncio.wrap_future(self._submit(domain, timeout))
+        try:
+            # shield: the lookup keeps running (and fills the cache) after we give up
+            return await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            return None
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries), 'pending': len(self._pending)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_domain_cache():
+    """The process-wide cache, sized from the app config on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = current_app.config
+            _cache = DomainCache(config['EMAIL_DOMAIN_CACHE_SIZE'],
+                                 config['EMAIL_DOMAIN_POSITIVE_TTL'],
+                                 config['EMAIL_DOMAIN_NEGATIVE_TTL'])
+        return _cache
+
+
+async def validate_signup_email(email):
+    """
+    Validate an address for signup without letting DNS set the pace.
+
+    Args:
+        email (str): Address as typed
+
+    Returns:
+        str: Normalized address
+
+    Raises:
+        EmailNotValidError: Bad syntax, or a domain known not to accept mail
+    """
+    validated = validate_email(email, check_deliverability=False)
+    config = current_app.config
+    if config['EMAIL_DELIVERABILITY'] == 'local':
+        return validated.normalized
+
+    deliverable = await get_domain_cache().deliverable(
+        validated.ascii_domain, config['EMAIL_DNS_TIMEOUT'], config['EMAIL_DNS_WAIT']
+    )
+    if deliverable is False:
+        raise EmailUndeliverableError(f"The domain name {validated.domain} does not accept email.")
+    return validated.normalized
@@ -1,52 +1,195 @@
 """
 Email sending utility using Brevo (SendinBlue) for transactional emails.
+
+Brevo calls run under the 'brevo' circuit breaker. When Brevo is failing,
+rejects the API key (401/403, e.g. none configured) or its breaker is
+open, mail fails over to the SMTP relay (smtp_relay_server.py) if
+SMTP_RELAY_HOST is configured.
+
+The Brevo SDK is imported on first use to keep it out of worker boot.
 """
-import sib_api_v3_sdk
+import asyncio
+import logging
+import smtplib
+from email.message import EmailMessage
+from email.utils import formataddr
+
 from flask import current_app
 
+from app.utils import tracing
+from app.utils.breaker import get_breaker, CircuitOpenError
+from app.utils.http import provider_client
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_SUBJECT = "Verify Your Email - BBA Services"
+
+# Brevo refusing our credentials: nothing wrong with the message, so fail over like an outage
+AUTH_FAILURE_STATUSES = (401, 403)
+
+
+class ProviderClientError(Exception):
+    """Provider rejected the request itself (4xx); not a provider outage."""
+
+
+def _verification_html(verification_code):
+    return f"""
+    <h2>Welcome to BBA Services!</h2>
+    <p>Your verification code is: <strong>{verification_code}</strong></p>
+    <p>Enter this code to verify your email address.</p>
+    """
+
+
+def _sender():
+    return {
+        "name": current_app.config['SENDER_NAME'],
+        "email": current_app.config['SENDER_EMAIL']
+    }
+
+
+def _relay_settings():
+    """SMTP relay target, or None when failover is not configured."""
+    host = current_app.config.get('SMTP_RELAY_HOST')
+    if not host:
+        return None
+    return host, current_app.config['SMTP_RELAY_PORT'], current_app.config['PROVIDER_TIMEOUT']
+
+
+def _send_via_smtp_relay(relay, sender, user_email, subject, html_content):
+    """Deliver one message through the SMTP relay. Runs without app context."""
+    host, port, timeout = relay
+    message = EmailMessage()
+    message['Subject'] = subject
+    message['From'] = formataddr((sender['name'], sender['email']))
+    message['To'] = user_email
+    message.set_content(html_content, subtype='html')
+
+    try:
+        with tracing.span('smtp.send', 'client', **{'peer.service': 'smtp-relay', 'net.peer.name': host}):
+            with smtplib.SMTP(host, port, timeout=timeout) as server:
+                server.send_message(message)
+        logger.info("Email sent via SMTP relay to %s", user_email)
+        return True
+    except Exception as e:
+        logger.warning("Failed to send email via SMTP relay: %s", e)
+        return False
+
 
 def send_verification_email(user_email, verification_code):
     """
     Send email verification code using Brevo.
-    
+
     Args:
         user_email (str): Recipient email address
         verification_code (str): Verification code
-        
+
     Returns:
         bool: Success status
     """
-    subject = "Verify Your Email - BBA Services"
-    html_content = f"""
-    <h2>Welcome to BBA Services!</h2>
-    <p>Your verification code is: <strong>{verification_code}</strong></p>
-    <p>Enter this code to verify your email address.</p>
-    """
-    
+    import sib_api_v3_sdk
+    from sib_api_v3_sdk.rest import ApiException
+
+    html_content = _verification_html(verification_code)
+
     try:
         configuration = sib_api_v3_sdk.Configuration()
         configuration.api_key['api-key'] = current_app.config['BREVO_API_KEY']
-        
+
         api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-        
-        sender = {
-            "name": current_app.config['SENDER_NAME'],
-            "email": current_app.config['SENDER_EMAIL']
-        }
-        
+
         to = [{"email": user_email}]
-        
+
         send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
             to=to,
             html_content=html_content,
-            sender=sender,
-            subject=subject
+            sender=_sender(),
+            subject=VERIFICATION_SUBJECT
         )
-        
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"Email sent via Brevo to {user_email}")
+
+        with get_breaker('brevo').guard(ignore=(ProviderClientError,)):
+            try:
+                with tracing.span('brevo.send', 'client', **{'peer.service': 'brevo'}):
+                    api_instance.send_transac_email(
+                        send_smtp_email,
+                        _request_timeout=current_app.config['PROVIDER_TIMEOUT']
+                    )
+            except ApiException as e:
+                if e.status and e.status < 500 and e.status not in AUTH_FAILURE_STATUSES:
+                    raise ProviderClientError(str(e)) from e
+                raise
+        logger.info("Email sent via Brevo to %s", user_email)
+        return True
+
+    except CircuitOpenError:
+        logger.info("Brevo circuit open, skipping Brevo")
+    except ProviderClientError as e:
+        logger.warning("Failed to send email via Brevo: %s", e)
+        return False
+    except Exception as e:
+        logger.warning("Failed to send email via Brevo: %s", e)
+
+    relay = _relay_settings()
+    if relay is None:
+        return False
+    return _send_via_smtp_relay(relay, _sender(), user_email, VERIFICATION_SUBJECT, html_content)
+
+
+async def send_verification_email_async(user_email, verification_code):
+    """
+    Send email verification code through Brevo's REST API without
+    blocking a worker thread while the request is in flight.
+
+    Args:
+        user_email (str): Recipient email address
+        verification_code (str): Verification code
+
+    Returns:
+        bool: Success status
+    """
+    html_content = _verification_html(verification_code)
+    payload = {
+        "sender": _sender(),
+        "to": [{"email": user_email}],
+        "subject": VERIFICATION_SUBJECT,
+        "htmlContent": html_content,
+    }
+    headers = {
+        "api-key": current_app.config['BREVO_API_KEY'] or '',
+        "accept": "application/json",
+    }
+
+    try:
+        async with provider_client() as client:
+            with get_breaker('brevo').guard(ignore=(ProviderClientError,)):
+                with tracing.span('brevo.send', 'client', **{'peer.service': 'brevo'}) as span:
+                    response = await asyncio.wait_for(
+                        client.post(
+                            f"{current_app.config['BREVO_API_URL']}/smtp/email",
+                            json=payload,
+                            headers=tracing.inject(headers)
+                        ),
+                        current_app.config['PROVIDER_TIMEOUT']
+                    )
+                    if span is not None:
+                        span.set(**{'http.status_code': response.status_code})
+                if response.is_server_error or response.status_code in AUTH_FAILURE_STATUSES:
+                    response.raise_for_status()
+                if response.is_client_error:
+                    raise ProviderClientError(f"{response.status_code} {response.text}")
+        logger.info("Email sent via Brevo to %s", user_email)
         return True
-        
+
+    except CircuitOpenError:
+        logger.info("Brevo circuit open, skipping Brevo")
+    except ProviderClientError as e:
+        logger.warning("Failed to send email via Brevo: %s", e)
+        return False
     except Exception as e:
-        print(f"Failed to send email via Brevo: {str(e)}")
-        return False
\ No newline at end of file
+        logger.warning("Failed to send email via Brevo: %s", str(e) or type(e).__name__)
+
+    relay = _relay_settings()
+    if relay is None:
+        return False
+    return await asyncio.to_thread(
+        _send_via_smtp_relay, relay, _sender(), user_email, VERIFICATION_SUBJECT, html_content
+    )
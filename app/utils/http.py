@@ -0,0 +1,100 @@
+"""
+Async HTTP plumbing for provider APIs (Brevo, Vonage).
+
+Provider SDKs and httpx are imported where they are used rather than at
+module level, so create_app() stays cheap; preload_provider_sdks() pulls
+them in ahead of the first provider call.
+"""
+import asyncio
+import functools
+import ssl
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from flask import current_app
+
+# Pooled client per long-lived loop; httpx connections cannot cross loops.
+_clients = weakref.WeakKeyDictionary()
+_local = threading.local()
+
+
+def _thread_loop():
+    loop = getattr(_local, 'loop', None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+        _clients[loop] = None
+    return loop
+
+
+def run_on_thread_loop(func):
+    """Drop-in for ``Flask.async_to_sync``.
+
+    Flask's default spins up a new thread and event loop for every async
+    view. Here each server thread keeps one loop, and with it one pooled
+    provider client, for its whole lifetime. The view's sync work (DB,
+    PBKDF2) stays on the server thread instead of a shared event loop.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _thread_loop().run_until_complete(func(*args, **kwargs))
+    return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def provider_ssl_context():
+    """One TLS context for all provider clients; loading the CA bundle per client costs ~30ms."""
+    import certifi
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+def _new_client():
+    import httpx
+
+    config = current_app.config
+    return httpx.AsyncClient(timeout=config['PROVIDER_TIMEOUT'], verify=provider_ssl_context(),
+                             limits=httpx.Limits(keepalive_expiry=config['PROVIDER_KEEPALIVE']))
+
+
+@asynccontextmanager
+async def provider_client():
+    """Yield the loop's pooled client, or a one-off client on a short-lived loop."""
+    loop = asyncio.get_running_loop()
+
+    if loop in _clients:
+        if _clients[loop] is None:
+            _clients[loop] = _new_client()
+        yield _clients[loop]
+        return
+
+    async with _new_client() as client:
+        yield client
+
+
+async def open_provider_connections(urls):
+    """
+    Connect this thread loop's client to each provider base URL (DNS, TCP
+    and TLS), so its first real call reuses the open connection.
+
+    Returns:
+        dict: url -> milliseconds, or the error for unreachable ones
+    """
+    async def touch(client, url):
+        started = time.perf_counter()
+        try:
+            await client.head(url)
+        except Exception as e:
+            return url, f'{type(e).__name__}: {e}'
+        return url, round((time.perf_counter() - started) * 1000, 1)
+
+    async with provider_client() as client:
+        return dict(await asyncio.gather(*(touch(client, url) for url in urls)))
+
+
+def preload_provider_sdks():
+    """Import the provider SDKs now (e.g. at warm-up) instead of on first use."""
+    import httpx  # noqa: F401
+    import sib_api_v3_sdk  # noqa: F401
+    import vonage  # noqa: F401
+    import vonage_verify_legacy  # noqa: F401
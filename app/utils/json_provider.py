@@ -0,0 +1,122 @@
+"""
+JSON provider for API responses and request bodies.
+
+With JSON_PROVIDER=auto (the default) responses are encoded and request
+bodies decoded with orjson when it is installed, falling back to the
+standard library otherwise; 'orjson' or 'stdlib' force one. Both
+providers produce the same output for the types the app returns:
+
+- datetime/date as ISO 8601 (naive datetimes are UTC here and get no
+  offset), instead of Flask's RFC 822 dates
+- Decimal and UUID as strings, dataclasses as objects
+- keys in insertion order, compact separators
+
+json_array_response() streams large lists in chunks so a big payload
+is never built as one string.
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime
+
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+
+def _default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's provider with ISO 8601 dates and unsorted keys."""
+
+    default = staticmethod(_default)
+    ensure_ascii = False
+    sort_keys = False
+
+    def encode(self, obj, indent=False):
+        kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+        return self.dumps(obj, **kwargs).encode()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson-backed provider; responses are built from bytes without a str round trip."""
+
+    sort_keys = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def encode(self, obj, indent=False):
+        options = self._options | (self._orjson.OPT_INDENT_2 if indent else 0)
+        if self.sort_keys:
+            options |= self._orjson.OPT_SORT_KEYS
+        return self._orjson.dumps(obj, default=_default, option=options)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'indent', 'separators'}:
+            return json.dumps(obj, **{'default': _default, **kwargs})
+        return self.encode(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        # Flask's session serializer passes object_hook, which orjson has no equivalent for
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.encode(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+def make_json_provider(app):
+    """The provider selected by JSON_PROVIDER."""
+    choice = app.config['JSON_PROVIDER']
+    if choice in ('auto', 'orjson'):
+        try:
+            return OrjsonProvider(app)
+        except ImportError:
+            if choice == 'orjson':
+                raise
+    return StdlibJSONProvider(app)
+
+
+def json_array_response(items, status=200):
+    """
+    JSON array response, streamed in chunks of JSON_STREAM_CHUNK items
+    once the list is longer than one chunk.
+
+    Args:
+        items (list): JSON-serializable items
+        status (int): HTTP status
+
+    Returns:
+        Response
+    """
+    provider = current_app.json
+    chunk = current_app.config['JSON_STREAM_CHUNK']
+    if len(items) <= chunk:
+        return provider.response(items), status
+
+    def generate():
+        yield b'['
+        for start in range(0, len(items), chunk):
+            body = provider.encode(items[start:start + chunk])[1:-1]
+            yield body if start == 0 else b',' + body
+        yield b']\n'
+
+    return current_app.response_class(stream_with_context(generate()), status=status,
+                                      mimetype=provider.mimetype)
@@ -0,0 +1,225 @@
+"""
+Structured logging that keeps log I/O off the request path.
+
+init_logging() gives the root logger one QueueHandler. The thread that
+logs only filters the record, stamps it and puts it on a queue. A
+QueueListener thread formats each record as a JSON object on one line
+(LOG_FORMAT=text for a plain line) and writes it to stdout. A record
+carries:
+
+- ts, level, logger and message, plus any ``extra`` fields of the call:
+  logger.info('SMS sent', extra={'challenge_id': challenge_id})
+- request_id: the request's X-Request-ID header if it looks sane, a
+  new id otherwise; echoed on the response
+- trace_id of the current span, when the request is traced
+
+Levels are LOG_LEVEL overall, with per-logger overrides in LOG_LEVELS
+("httpx=WARNING,app.utils.query_stats=ERROR"). LOG_SAMPLING
+("app.utils.sms=0.1") keeps only that fraction of a logger's records
+below WARNING. Kept records carry sample_rate so counts can be scaled
+back up. Warnings and errors are never sampled.
+
+The queue holds LOG_QUEUE_SIZE records. If the writer falls behind (a
+slow log collector behind stdout), new records are dropped and counted,
+never waited on. /health/logs shows the counts.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request
+
+from app.utils import tracing
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+_request_id = ContextVar('request_id', default=None)
+_valid_request_id = re.compile(r'[A-Za-z0-9._:-]{1,64}')
+
+# LogRecord attributes, i.e. everything that is not an ``extra`` field
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'trace_id', 'sample_rate'}
+
+
+def parse_settings(spec, convert):
+    """{'name': convert(value)} from 'name=value,name=value'."""
+    pairs = (entry.split('=', 1) for entry in (spec or '').split(',') if '=' in entry)
+    return {name.strip(): convert(value.strip()) for name, value in pairs}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class ContextFilter(logging.Filter):
+    """Sampling plus request and trace ids; runs in the logging thread, before the record is queued."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+        self._resolved = {}  # logger name -> rate of its closest configured ancestor
+
+    def _rate(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            parts = name.split('.')
+            rate = next((self.rates[prefix] for prefix in ('.'.join(parts[:n]) for n in range(len(parts), 0, -1))
+                         if prefix in self.rates), 1.0)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            rate = self._rate(record.name)
+            if rate < 1.0:
+                if random.random() >= rate:
+                    self.sampled_out += 1
+                    return False
+                record.sample_rate = rate
+        record.request_id = _request_id.get()
+        context = tracing.current_context()
+        record.trace_id = context[0] if context else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('request_id', 'trace_id', 'sample_rate'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when its queue is full, with a listener per process."""
+
+    def __init__(self, capacity, target):
+        super().__init__(queue.Queue(capacity))
+        self.target = target
+        self.counts = {'queued': 0, 'dropped_full': 0}
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Message and traceback are rendered here, while the arguments are what they were at the call
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.counts['dropped_full'] += 1
+            return
+        self.counts['queued'] += 1
+
+    def _ensure_listener(self):
+        # Started on first use so each forked worker gets its own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent's queue may hold its records, or a lock its listener had
+                self.queue = queue.Queue(self.queue.maxsize)
+            self._pid = os.getpid()
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+
+    def stop(self):
+        """Write what is queued and stop the listener."""
+        if self._listener is None or self._pid != os.getpid():
+            return
+        try:
+            self._listener.stop()
+        except queue.Full:  # no room for the stop sentinel; the daemon thread dies with the process
+            pass
+        self._listener = None
+        self._pid = None
+
+
+_handler = None
+_filter = None
+
+
+def get_log_stats():
+    return {**_handler.counts, 'pending': _handler.queue.qsize(), 'capacity': _handler.queue.maxsize,
+            'sampled_out': _filter.sampled_out}
+
+
+def init_logging(app):
+    """Route all logging through the queue pipeline and stamp request ids on ``app``'s requests."""
+    global _handler, _filter
+    config = app.config
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+        _handler.stop()
+    else:
+        atexit.register(lambda: _handler.stop())
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if config['LOG_FORMAT'] == 'json' else logging.Formatter(TEXT_FORMAT))
+    _filter = ContextFilter(parse_settings(config['LOG_SAMPLING'], float))
+    _handler = NonBlockingQueueHandler(config['LOG_QUEUE_SIZE'], stream)
+    _handler.addFilter(_filter)
+    root.addHandler(_handler)
+    root.setLevel(config['LOG_LEVEL'].upper())
+    for name, level in parse_settings(config['LOG_LEVELS'], str.upper).items():
+        logging.getLogger(name).setLevel(level)
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming if _valid_request_id.fullmatch(incoming) else uuid.uuid4().hex
+        g.request_id_token = _request_id.set(g.request_id)
+
+    @app.after_request
+    def echo_request_id(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is None:
+            return
+        try:
+            _request_id.reset(token)
+        except ValueError:  # torn down in another context than the one it started in
+            _request_id.set(None)
+
+    return _handler
@@ -0,0 +1,71 @@
+"""
+Optimistic concurrency for users rows.
+
+User maps users.version_id as SQLAlchemy's version_id_col: every ORM
+UPDATE of a user is `... WHERE id = :id AND version_id = :seen` and
+bumps the version. A commit based on a row that another request changed
+after it was read therefore fails with StaleDataError instead of
+silently overwriting that change (e.g. a login clearing the SMS
+challenge that request_sms_code has just replaced). No row lock is held
+while a request awaits a provider, so concurrent requests for one
+account never queue behind each other.
+
+update_user() turns the conflict into a retry: the row is reloaded and
+the change applied again, so changes that still make sense go through
+and ones that depended on what was overwritten can back out. The reload
+reads the primary, since a lagging replica would hand back the version
+that just lost, and attempts are spaced by a short jittered backoff
+(USER_UPDATE_BACKOFF) so racing requests do not collide again at once.
+"""
+import random
+import time
+
+from flask import current_app
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db
+from app.utils.replicas import stick_to_primary
+
+stats = {'commits': 0, 'conflicts': 0, 'declined': 0}
+
+
+def update_user(user, change, attempts=None):
+    """
+    Apply ``change(user)`` and commit, retrying if the row changed underneath.
+
+    ``change`` is called with the current row on every attempt (after a
+    conflict the row has been reloaded) and returns False to leave it
+    alone, e.g. when the challenge it meant to clear has been replaced.
+    It must only touch the session through ``user``: a conflict rolls
+    back the whole transaction.
+
+    Args:
+        user (User): Row to update (current_user works too)
+        change (callable): Mutates the user; False declines
+        attempts (int): Tries before giving up (default USER_UPDATE_ATTEMPTS)
+
+    Returns:
+        bool: True if committed, False if ``change`` declined
+
+    Raises:
+        StaleDataError: Still conflicting after ``attempts`` tries
+    """
+    attempts = attempts or current_app.config['USER_UPDATE_ATTEMPTS']
+    for attempt in range(1, attempts + 1):
+        if change(user) is False:
+            db.session.rollback()
+            stats['declined'] += 1
+            return False
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # rollback() expires the user, so the next attempt reads the winner's row
+            db.session.rollback()
+            stats['conflicts'] += 1
+            if attempt == attempts:
+                raise
+            stick_to_primary(db.session)
+            time.sleep(random.uniform(0, current_app.config['USER_UPDATE_BACKOFF'] * 2 ** (attempt - 1)))
+            continue
+        stats['commits'] += 1
+        return True
@@ -0,0 +1,153 @@
+"""
+Opt-in statistical profiler for individual requests.
+
+A request is profiled when it carries a valid X-Profile header (see
+profile_token) or is picked by PROFILE_SAMPLE_RATE. A sampler thread then
+reads the request thread's stack every PROFILE_INTERVAL seconds, and the
+samples are written in collapsed-stack format ("outer;inner count" per
+line, ready for flamegraph.pl or speedscope) to PROFILE_DIR, which keeps
+the newest PROFILE_MAX_FILES dumps. Unprofiled requests only pay for a
+header lookup and a random() call.
+
+Time spent awaiting Brevo/Vonage shows up as the event loop's select().
+"""
+import hashlib
+import hmac
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def profile_token(secret_key, ttl=600, now=None):
+    """X-Profile header value that enables profiling until it expires."""
+    expires = int((time.time() if now is None else now) + ttl)
+    signature = hmac.new(secret_key.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def token_valid(secret_key, token, now=None):
+    expires, _, signature = (token or '').partition('.')
+    if not expires.isdigit() or int(expires) < (time.time() if now is None else now):
+        return False
+    expected = hmac.new(secret_key.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestSampler:
+    """Samples one thread's stack on a background thread until stopped."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+def write_dump(directory, name, samples, max_files):
+    """Write collapsed stacks to ``directory`` and drop the oldest dumps."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.collapsed")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    dumps = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.collapsed')),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in dumps[:max(0, len(dumps) - max_files)]:
+        os.remove(entry.path)
+    return path
+
+
+def init_profiler(app):
+    """Profile requests chosen by signed header or sampling rate."""
+
+    @app.before_request
+    def start_profiler():
+        sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        token = request.headers.get(PROFILE_HEADER)
+        if not (token and token_valid(app.config['SECRET_KEY'], token)) and not (
+                sample_rate and random.random() < sample_rate):
+            return
+        g.profiler = RequestSampler(threading.get_ident(), app.config['PROFILE_INTERVAL']).start()
+        g.profile_started = time.perf_counter()
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        sampler = g.pop('profiler', None)
+        if sampler is None:
+            return
+        samples = sampler.stop()
+        elapsed_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+        endpoint = (request.endpoint or 'unknown').replace('.', '-')
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint}-{elapsed_ms:.0f}ms-{secrets.token_hex(3)}"
+        try:
+            path = write_dump(app.config['PROFILE_DIR'], name, samples, app.config['PROFILE_MAX_FILES'])
+            logger.info("Profile written to %s (%d samples)", path, sum(samples.values()))
+        except OSError as e:
+            logger.warning("Failed to write profile: %s", e)
+
+
+def read_dumps(directory, endpoint=None):
+    """Yield (stack frames, count) from every dump, optionally for one endpoint."""
+    if not os.path.isdir(directory):
+        return
+    marker = f"-{endpoint.replace('.', '-')}-" if endpoint else None
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.collapsed') or (marker and marker not in entry.name):
+            continue
+        with open(entry.path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    yield stack.split(';'), int(count)
+
+
+def hot_functions(dumps):
+    """Aggregate samples into (total samples, self Counter, inclusive Counter)."""
+    total = 0
+    self_samples = Counter()
+    inclusive = Counter()
+    for frames, count in dumps:
+        total += count
+        self_samples[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+    return total, self_samples, inclusive
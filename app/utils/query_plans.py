@@ -0,0 +1,81 @@
+"""
+Query-plan checks for the hot lookups.
+
+Each hot query is EXPLAINed against the configured database and any
+sequential scan of a table is reported, so a dropped or missing index
+fails CI instead of showing up as login latency. PostgreSQL is asked to
+avoid sequential scans (enable_seqscan = off), so one still appearing
+means no usable index exists regardless of how small the seeded tables
+are.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, text
+from werkzeug.security import generate_password_hash
+
+from app.models import db, User, QuestionnaireResponse, WaveToken
+
+# name -> statement; keep in step with the lookups the views and jobs run
+HOT_QUERIES = {
+    'user by email': lambda: select(User).where(User.email == 'user1@example.com'),
+    'user by phone': lambda: select(User).where(User.phone == '+15550000001'),
+    'questionnaire responses by user': lambda: select(QuestionnaireResponse).where(
+        QuestionnaireResponse.user_id == 1),
+    'wave token by user': lambda: select(WaveToken).where(WaveToken.user_id == 1),
+}
+
+
+def seed(count):
+    """Insert ``count`` users with a response and a Wave token each into empty tables."""
+    password_hash = generate_password_hash('seeded', method='pbkdf2:sha256:1000')
+    now = datetime.utcnow()
+    db.session.execute(db.insert(User), [
+        {'id': i, 'email': f'user{i}@example.com', 'password_hash': password_hash,
+         'is_verified': True, 'mfa_enabled': False, 'phone': f'+1555{i:07d}', 'created_at': now}
+        for i in range(1, count + 1)
+    ])
+    db.session.execute(db.insert(QuestionnaireResponse), [
+        {'user_id': i, 'answers': {'q1': 'a'}, 'score': 1.0, 'created_at': now}
+        for i in range(1, count + 1)
+    ])
+    db.session.execute(db.insert(WaveToken), [
+        {'user_id': i, 'access_token': f'token-{i}'} for i in range(1, count + 1)
+    ])
+    db.session.commit()
+
+
+def _sql(statement):
+    return str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+
+
+def _postgres_seq_scans(node):
+    scans = []
+    if node.get('Node Type') == 'Seq Scan':
+        scans.append(f"Seq Scan on {node.get('Relation Name')}")
+    for child in node.get('Plans', []):
+        scans.extend(_postgres_seq_scans(child))
+    return scans
+
+
+def explain(statement):
+    """Return (plan lines, sequential scans) for one statement."""
+    sql = _sql(statement)
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()[0]['Plan']
+        lines = list(db.session.execute(text(f'EXPLAIN {sql}')).scalars())
+        db.session.rollback()
+        return lines, _postgres_seq_scans(plan)
+
+    if db.engine.dialect.name == 'sqlite':
+        lines = [row[3] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+        db.session.rollback()
+        # SEARCH uses an index; SCAN reads the whole table (or a whole index)
+        return lines, [line for line in lines if line.startswith('SCAN ')]
+
+    raise NotImplementedError(f"No plan check for {db.engine.dialect.name}")
+
+
+def check_hot_queries():
+    """EXPLAIN every hot query; returns {name: (plan lines, seq scans)}."""
+    return {name: explain(build()) for name, build in HOT_QUERIES.items()}
@@ -0,0 +1,147 @@
+"""
+Per-request SQL query accounting.
+
+SQLAlchemy cursor events count the statements each request runs, their
+total time, and how often the same statement text repeats (the N+1
+signature: one parametrized SELECT issued once per row). In debug and
+testing the numbers are returned as X-DB-* response headers; otherwise
+requests over QUERY_STATS_LOG_THRESHOLD queries, or with a repeated
+statement, are logged, and every request feeds per-endpoint totals
+served at /health/queries.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Endpoint -> budget; `flask check-query-budgets` fails CI when exceeded
+QUERY_BUDGETS = {
+    'main.health': 0,
+    'main.index': 1,
+    'main.dashboard': 1,
+    'main.enable_totp': 3,
+    'auth.verify_email': 1,
+}
+
+_endpoint_totals = {}
+_totals_lock = threading.Lock()
+
+
+class QueryStats:
+    """Queries seen during one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """Statements run at least ``threshold`` times, most frequent first."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _current_stats():
+    try:
+        return g.get('query_stats')
+    except RuntimeError:  # no app context (CLI, scripts)
+        return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = _current_stats()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A statement that raised gets no after_cursor_execute; take its start off the stack all the same
+    connection = exception_context.connection
+    started = connection.info.get('query_started') if connection is not None else None
+    if exception_context.execution_context is None or not started:
+        return
+    started = started.pop()
+    stats = _current_stats()
+    if stats is not None:
+        stats.record(exception_context.statement, time.perf_counter() - started)
+
+
+def endpoint_totals():
+    """Per-endpoint request, query and N+1 counts since startup."""
+    with _totals_lock:
+        return {endpoint: dict(totals) for endpoint, totals in _endpoint_totals.items()}
+
+
+def _add_to_totals(endpoint, stats, suspected_n_plus_one):
+    with _totals_lock:
+        totals = _endpoint_totals.setdefault(
+            endpoint, {'requests': 0, 'queries': 0, 'db_ms': 0.0, 'max_queries': 0, 'n_plus_one': 0}
+        )
+        totals['requests'] += 1
+        totals['queries'] += stats.count
+        totals['db_ms'] = round(totals['db_ms'] + stats.seconds * 1000, 3)
+        totals['max_queries'] = max(totals['max_queries'], stats.count)
+        totals['n_plus_one'] += bool(suspected_n_plus_one)
+
+
+def init_query_stats(app):
+    """Start counting queries for every request handled by ``app``."""
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        repeated = stats.repeated(app.config['QUERY_STATS_REPEAT_THRESHOLD'])
+        endpoint = request.endpoint or request.path
+        _add_to_totals(endpoint, stats, repeated)
+
+        if app.debug or app.testing:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-ms'] = f"{stats.seconds * 1000:.2f}"
+            response.headers['X-DB-Repeated'] = str(sum(n for _, n in repeated))
+        elif repeated or stats.count > app.config['QUERY_STATS_LOG_THRESHOLD']:
+            logger.info("Query stats %s %s: %d queries %.1fms", request.method, endpoint, stats.count,
+                        stats.seconds * 1000, extra={'repeated': [{'sql': sql[:200], 'count': n}
+                                                                  for sql, n in repeated]})
+        return response
+
+
+def assert_query_budget(client, path, max_queries, method='GET', **kwargs):
+    """
+    Request ``path`` with a Flask test client and fail if it ran more than
+    ``max_queries`` queries. The app must be in testing or debug mode.
+
+    Returns:
+        Response: the test client response
+    """
+    response = client.open(path, method=method, **kwargs)
+    count = response.headers.get('X-DB-Query-Count')
+    assert count is not None, 'X-DB-Query-Count missing; enable app.testing'
+    assert int(count) <= max_queries, (
+        f"{method} {path} ran {count} queries (budget {max_queries}, "
+        f"{response.headers['X-DB-Repeated']} repeated)"
+    )
+    return response
@@ -0,0 +1,299 @@
+"""
+Monthly questionnaire storage: partitions, archival and the archived read path.
+
+On PostgreSQL questionnaire_response is partitioned by month on
+created_at (migration 006). ensure_partitions() creates the months ahead;
+rows for a month without a partition land in the default partition and
+are moved when the month is created.
+
+archive_old_months() writes every month older than
+QUESTIONNAIRE_RETENTION_MONTHS to QUESTIONNAIRE_ARCHIVE_DIR as
+gzip-compressed NDJSON, one file per month. Rows are sorted by user and
+compressed in blocks of ARCHIVE_BLOCK_ROWS, each its own gzip member, so
+the file still reads with zcat while a sidecar index of
+(first user, last user, offset, length) per block lets one user's rows
+be read without decompressing the month. Only once the file is complete
+and its row count matches the database is the month's partition dropped
+(PostgreSQL) or its rows deleted (other databases).
+
+list_responses() reads the live table and, when asked, the archive
+files for the requested period, newest first.
+"""
+import bisect
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import delete, func, select, text
+
+from app.models import db, QuestionnaireResponse
+from app.utils.sqlite import read_engine, will_write
+
+logger = logging.getLogger(__name__)
+
+TABLE = QuestionnaireResponse.__tablename__
+_PARTITION = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+_ARCHIVE = re.compile(rf'^{TABLE}-(\d{{4}})-(\d{{2}})\.ndjson\.gz$')
+COLUMNS = ('id', 'user_id', 'answers', 'score', 'created_at', 'rubric_version')
+ARCHIVE_BLOCK_ROWS = 1000
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partitioned():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def partitions():
+    """Months that have their own partition, oldest first (empty unless on PostgreSQL)."""
+    if not _partitioned():
+        return []
+    with db.engine.connect() as connection:
+        names = connection.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass)"
+        ), {'table': TABLE}).scalars()
+        matches = [_PARTITION.match(name) for name in names]
+    return sorted(date(int(m.group(1)), int(m.group(2)), 1) for m in matches if m)
+
+
+def ensure_partitions(months_ahead=None, today=None):
+    """
+    Create monthly partitions from the current month to ``months_ahead`` months out.
+
+    Rows already sitting in the default partition for a new month are
+    moved into it in the same transaction.
+
+    Returns:
+        list: Months created
+    """
+    if not _partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = current_app.config['QUESTIONNAIRE_PARTITIONS_AHEAD']
+    existing = set(partitions())
+    current = month_start(today or date.today())
+    columns = ', '.join(COLUMNS)
+    created = []
+    for month in (add_months(current, i) for i in range(months_ahead + 1)):
+        if month in existing:
+            continue
+        name, bounds = partition_name(month), {'start': month, 'end': add_months(month, 1)}
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            connection.execute(text(
+                f"WITH moved AS (DELETE FROM {TABLE}_default WHERE created_at >= :start AND created_at < :end "
+                f"RETURNING {columns}) INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+            ), bounds)
+            # Indexes are created on the partition as it is attached
+            connection.execute(text(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+            ))
+        created.append(month)
+    return created
+
+
+def archive_path(directory, month):
+    return os.path.join(directory, f"{TABLE}-{month:%Y-%m}.ndjson.gz")
+
+
+def _index_path(path):
+    return path[:-len('.ndjson.gz')] + '.index.json'
+
+
+def archived_months(directory):
+    """Months present in the archive directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    matches = [_ARCHIVE.match(name) for name in os.listdir(directory)]
+    return sorted(date(int(m.group(1)), int(m.group(2)), 1) for m in matches if m)
+
+
+def _month_range(month):
+    start, end = datetime(month.year, month.month, 1), add_months(month, 1)
+    return (QuestionnaireResponse.created_at >= start,
+            QuestionnaireResponse.created_at < datetime(end.year, end.month, 1))
+
+
+def _export_month(month, path, batch_size):
+    """Stream one month to ``path`` and its block index; returns the number of rows written."""
+    columns = [getattr(QuestionnaireResponse, c) for c in COLUMNS]
+    statement = (select(*columns).where(*_month_range(month))
+                 .order_by(QuestionnaireResponse.user_id, QuestionnaireResponse.id))
+    rows, blocks, block, offset = 0, [], [], 0
+    partial = path + '.partial'
+
+    def write_block(f):
+        nonlocal offset, block
+        data = gzip.compress(''.join(line for _, line in block).encode(), compresslevel=6)
+        f.write(data)
+        blocks.append([block[0][0], block[-1][0], offset, len(data)])
+        offset += len(data)
+        block = []
+
+    # On the primary (or the SQLite readers), with a server-side cursor where the driver has one
+    with read_engine(db).connect() as connection, open(partial, 'wb') as f:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for row in result:
+            record = dict(zip(COLUMNS, row))
+            record['created_at'] = record['created_at'].isoformat()
+            block.append((record['user_id'], json.dumps(record, separators=(',', ':')) + '\n'))
+            rows += 1
+            if len(block) >= ARCHIVE_BLOCK_ROWS:
+                write_block(f)
+        if block:
+            write_block(f)
+    with open(_index_path(path), 'w') as f:
+        json.dump({'rows': rows, 'blocks': blocks}, f)
+    os.replace(partial, path)
+    return rows
+
+
+def _drop_month(month, expected):
+    """Remove an archived month from the database if it still holds ``expected`` rows."""
+    with db.engine.begin() as connection:
+        will_write(connection)
+        count = connection.execute(
+            select(func.count()).select_from(QuestionnaireResponse).where(*_month_range(month))
+        ).scalar()
+        if count != expected:
+            raise RuntimeError(f"{month:%Y-%m} has {count} rows, archived {expected}; left in place")
+        if _partitioned() and month in partitions():
+            name = partition_name(month)
+            connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            connection.execute(text(f"DROP TABLE {name}"))
+        # Rows that went to the default partition (or the single table elsewhere)
+        connection.execute(delete(QuestionnaireResponse).where(*_month_range(month)))
+
+
+def archive_old_months(retention_months=None, directory=None, batch_size=5000, dry_run=False, today=None):
+    """
+    Archive and remove every month older than the retention horizon.
+
+    Returns:
+        dict: month (YYYY-MM) -> rows archived
+    """
+    config = current_app.config
+    retention_months = config['QUESTIONNAIRE_RETENTION_MONTHS'] if retention_months is None else retention_months
+    directory = directory or config['QUESTIONNAIRE_ARCHIVE_DIR']
+    horizon = add_months(month_start(today or date.today()), -retention_months)
+
+    oldest = db.session.scalar(select(func.min(QuestionnaireResponse.created_at)))
+    db.session.rollback()
+    months = set(m for m in partitions() if m < horizon)
+    if oldest is not None:
+        month = month_start(oldest)
+        while month < horizon:
+            months.add(month)
+            month = add_months(month, 1)
+
+    archived = {}
+    os.makedirs(directory, exist_ok=True)
+    for month in sorted(months):
+        path = archive_path(directory, month)
+        if os.path.exists(path):
+            # Never overwrite an archive; a month re-filled after archiving needs a look
+            logger.warning("Questionnaire archive %s already exists; skipping %s", path, f"{month:%Y-%m}")
+            continue
+        if dry_run:
+            archived[f"{month:%Y-%m}"] = db.session.scalar(
+                select(func.count()).select_from(QuestionnaireResponse).where(*_month_range(month)))
+            continue
+        rows = _export_month(month, path, batch_size)
+        try:
+            _drop_month(month, rows)
+        except Exception:
+            os.remove(path)
+            os.remove(_index_path(path))
+            raise
+        archived[f"{month:%Y-%m}"] = rows
+        logger.info("Archived %d questionnaire responses for %s to %s", rows, f"{month:%Y-%m}", path)
+    return archived
+
+
+@lru_cache(maxsize=256)
+def _block_index(index_path, mtime):
+    with open(index_path) as f:
+        blocks = json.load(f)['blocks']
+    return [block[1] for block in blocks], blocks
+
+
+def _read_archive(directory, month, user_id):
+    """One user's rows from an archived month, decompressing only the blocks that hold them."""
+    path = archive_path(directory, month)
+    index_path = _index_path(path)
+    last_users, blocks = _block_index(index_path, os.path.getmtime(index_path))
+    needle = f'"user_id":{user_id},'
+    with open(path, 'rb') as f:
+        for first, last, offset, length in blocks[bisect.bisect_left(last_users, user_id):]:
+            if first > user_id:
+                break
+            f.seek(offset)
+            for line in gzip.decompress(f.read(length)).decode().splitlines():
+                if needle not in line:  # skip parsing other users' rows
+                    continue
+                record = json.loads(line)
+                if record['user_id'] == user_id:
+                    record['created_at'] = datetime.fromisoformat(record['created_at'])
+                    record.setdefault('rubric_version', None)  # archived before it was exported
+                    record['archived'] = True
+                    yield record
+
+
+def list_responses(user_id, since=None, limit=None, include_archived=False):
+    """
+    A user's questionnaire responses, newest first.
+
+    Args:
+        user_id (int): Whose responses
+        since (datetime): Only responses created at or after this
+        limit (int): At most this many
+        include_archived (bool): Also read archive files; slower, one
+            block decompressed per archived month in range
+
+    Returns:
+        list: dicts of id, user_id, answers, score, created_at, rubric_version, archived
+    """
+    user_id = int(user_id)  # JWT identities arrive as strings
+    statement = (select(*(getattr(QuestionnaireResponse, c) for c in COLUMNS))
+                 .where(QuestionnaireResponse.user_id == user_id)
+                 .order_by(QuestionnaireResponse.created_at.desc(), QuestionnaireResponse.id.desc()))
+    if since is not None:
+        statement = statement.where(QuestionnaireResponse.created_at >= since)
+    if limit is not None:
+        statement = statement.limit(limit)
+    responses = [{**dict(zip(COLUMNS, row)), 'archived': False} for row in db.session.execute(statement)]
+
+    if not include_archived or (limit is not None and len(responses) >= limit):
+        return responses
+
+    directory = current_app.config['QUESTIONNAIRE_ARCHIVE_DIR']
+    first = month_start(since) if since is not None else None
+    for month in reversed(archived_months(directory)):
+        if first is not None and month < first:
+            break
+        older = [r for r in _read_archive(directory, month, user_id)
+                 if since is None or r['created_at'] >= since]
+        responses.extend(sorted(older, key=lambda r: (r['created_at'], r['id']), reverse=True))
+        if limit is not None and len(responses) >= limit:
+            return responses[:limit]
+    return responses
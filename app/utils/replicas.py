@@ -0,0 +1,164 @@
+"""
+Read-replica routing for the SQLAlchemy session.
+
+With SQLALCHEMY_REPLICA_URIS set, plain SELECTs go to a replica and
+everything else stays on the primary:
+
+- flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE and raw SQL
+- every statement after the first write in a transaction
+- reads within REPLICA_READ_YOUR_WRITES seconds of a committed write,
+  tracked per session and, across requests, in the user's Flask session
+- reads while no replica is within REPLICA_MAX_LAG seconds of the
+  primary or reachable; lag is probed at most every
+  REPLICA_CHECK_INTERVAL seconds per replica
+
+Without replicas configured the session behaves exactly as before.
+"""
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = 'replica_'
+_WRITE_COOKIE_KEY = '_db_wrote_at'
+
+
+def replica_binds(uris):
+    """SQLALCHEMY_BINDS entries for a comma-separated list of replica URIs."""
+    binds = {}
+    for i, uri in enumerate(u.strip() for u in (uris or '').split(',') if u.strip()):
+        if uri.startswith('postgres://'):
+            uri = uri.replace('postgres://', 'postgresql://', 1)
+        binds[f'{REPLICA_BIND_PREFIX}{i}'] = uri
+    return binds
+
+
+def _postgres_lag(connection):
+    # NULL on a primary, or on a standby that has replayed everything it has received
+    return connection.execute(text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )).scalar() or 0.0
+
+
+# Dialect name -> function(connection) returning replication lag in seconds.
+# Dialects without a probe are assumed current as long as they answer.
+LAG_PROBES = {
+    'postgresql': _postgres_lag,
+}
+
+
+class ReplicaHealth:
+    """Cached lag per replica engine, re-probed every ``check_interval`` seconds."""
+
+    def __init__(self):
+        self._checked = {}  # engine url -> (checked at, lag or None if unreachable)
+        self._lock = threading.Lock()
+
+    def lag(self, engine, check_interval):
+        key = str(engine.url)
+        now = time.monotonic()
+        with self._lock:
+            checked_at, lag = self._checked.get(key, (None, None))
+            if checked_at is not None and now - checked_at < check_interval:
+                return lag
+            # Claim this probe so concurrent requests keep using the cached value
+            self._checked[key] = (now, lag)
+
+        probe = LAG_PROBES.get(engine.dialect.name, lambda connection: 0.0)
+        try:
+            with engine.connect() as connection:
+                lag = float(probe(connection))
+        except Exception as e:
+            logger.warning("Replica %s unavailable: %s", engine.url.render_as_string(hide_password=True), e)
+            lag = None
+        with self._lock:
+            self._checked[key] = (now, lag)
+        return lag
+
+    def snapshot(self):
+        with self._lock:
+            return {url: lag for url, (_, lag) in self._checked.items()}
+
+
+replica_health = ReplicaHealth()
+_round_robin = itertools.count()
+
+
+def _recent_write(session, window):
+    if not window:
+        return False
+    now = time.time()
+    last_write = session.info.get('last_write', 0.0)
+    if has_request_context():
+        last_write = max(last_write, flask_session.get(_WRITE_COOKIE_KEY, 0.0))
+    return now - last_write < window
+
+
+def _is_plain_read(clause):
+    return (clause is not None
+            and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None
+            and not getattr(clause, 'is_text', False))
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible reads to a replica."""
+
+    def replicas(self):
+        return [engine for key, engine in self._db.engines.items()
+                if key and key.startswith(REPLICA_BIND_PREFIX)]
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return primary
+
+        replicas = self.replicas()
+        if not replicas:
+            return primary
+
+        if self._flushing or not _is_plain_read(clause):
+            if clause is not None and getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+            return primary
+        config = current_app.config
+        if self.info.get('wrote') or _recent_write(self, config['REPLICA_READ_YOUR_WRITES']):
+            return primary
+
+        start = next(_round_robin)
+        for i in range(len(replicas)):
+            replica = replicas[(start + i) % len(replicas)]
+            lag = replica_health.lag(replica, config['REPLICA_CHECK_INTERVAL'])
+            if lag is not None and lag <= config['REPLICA_MAX_LAG']:
+                return replica
+        return primary
+
+
+def stick_to_primary(session):
+    """Send the rest of ``session``'s transaction to the primary, as if it had written."""
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _record_write(session):
+    if session.info.pop('wrote', False):
+        session.info['last_write'] = time.time()
+        if has_request_context() and session.replicas() and current_app.config['REPLICA_READ_YOUR_WRITES']:
+            flask_session[_WRITE_COOKIE_KEY] = session.info['last_write']
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
@@ -0,0 +1,195 @@
+"""
+JWT revocation without a database round trip per request.
+
+Revoked token ids (jti) are stored in the revoked_token table. Each
+process keeps a Bloom filter and an exact set of the unexpired ones:
+
+- a token whose jti misses the Bloom filter is not revoked (the common
+  path: a few bit tests, no set or DB lookup);
+- a hit is confirmed against the exact set, so false positives never
+  reject a valid token.
+
+Rows revoked by other processes are picked up incrementally, at most
+every REVOCATION_SYNC_INTERVAL seconds, by reading rows newer than the
+last sync. Tokens revoked in this process take effect immediately.
+Since entries cannot be removed from a Bloom filter, it is rebuilt from
+the unexpired rows every REVOCATION_REBUILD_INTERVAL seconds, or at the
+next sync once it holds more entries than it was sized for (at least
+REVOCATION_BLOOM_CAPACITY, twice the unexpired rows of the last rebuild).
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+
+from app.models import db, RevokedToken
+from app.utils.sqlite import read_engine, will_write
+
+logger = logging.getLogger(__name__)
+
+# Revocations committed this long before the last sync are re-read, in
+# case their transaction committed after a later one that was synced
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for ``capacity`` items at ``error_rate``."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """Per-process view of revoked_token: Bloom filter in front of an exact set."""
+
+    def __init__(self, capacity, sync_interval, rebuild_interval):
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.stats = {'checks': 0, 'filter_hits': 0, 'revoked': 0, 'syncs': 0, 'rebuilds': 0}
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity)
+        self._exact = set()
+        self._synced_at = None  # DB time covered by the last sync
+        self._next_sync = 0.0
+        self._next_rebuild = 0.0
+
+    def _add(self, jti):
+        if jti not in self._exact:
+            self._exact.add(jti)
+            self._bloom.add(jti)
+
+    def _rebuild(self, now):
+        with read_engine(db).connect() as connection:
+            exact = set(connection.execute(
+                select(RevokedToken.jti).where(RevokedToken.expires_at > now)).scalars())
+        # Room to double before the next size-triggered rebuild
+        bloom = BloomFilter(max(self.capacity, 2 * len(exact)))
+        for jti in exact:
+            bloom.add(jti)
+        with self._lock:
+            self._bloom, self._exact = bloom, exact
+            self._synced_at = now
+            self.stats['rebuilds'] += 1
+
+    def _sync(self, now):
+        with read_engine(db).connect() as connection:
+            jtis = connection.execute(select(RevokedToken.jti).where(
+                RevokedToken.revoked_at >= self._synced_at - SYNC_OVERLAP,
+                RevokedToken.expires_at > now,
+            )).scalars().all()
+        with self._lock:
+            for jti in jtis:
+                self._add(jti)
+            self._synced_at = now
+            self.stats['syncs'] += 1
+
+    def refresh(self, force=False):
+        """Pick up revocations from other processes if the sync interval has passed."""
+        clock = time.monotonic()
+        with self._lock:
+            if not force and clock < self._next_sync and clock < self._next_rebuild:
+                return
+            oversized = self._bloom.count > self._bloom.capacity
+            rebuild = force or clock >= self._next_rebuild or oversized
+            # Claim the refresh so concurrent requests keep using the current view
+            self._next_sync = clock + self.sync_interval
+            if rebuild:
+                self._next_rebuild = clock + self.rebuild_interval
+        now = datetime.utcnow()
+        try:
+            if rebuild or self._synced_at is None:
+                self._rebuild(now)
+            else:
+                self._sync(now)
+        except Exception as e:
+            # Keep serving the last known list; retried after the next interval
+            logger.warning("Token revocation sync failed: %s", e)
+
+    def is_revoked(self, jti):
+        self.refresh()
+        self.stats['checks'] += 1
+        if jti not in self._bloom:
+            return False
+        self.stats['filter_hits'] += 1
+        if jti in self._exact:
+            self.stats['revoked'] += 1
+            return True
+        return False
+
+    def revoke(self, jti, token_type, user_id, expires_at):
+        """Record a revocation; effective here at once, elsewhere after their next sync."""
+        with db.engine.begin() as connection:
+            connection.execute(insert(RevokedToken).values(
+                jti=jti, token_type=token_type, user_id=user_id,
+                revoked_at=datetime.utcnow(), expires_at=expires_at,
+            ))
+        with self._lock:
+            self._add(jti)
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'size': len(self._exact), 'bloom_bits': self._bloom.size,
+                    'bloom_hashes': self._bloom.hashes}
+
+
+_revocations = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocation_list():
+    """The process-wide revocation list, sized from the app config on first use."""
+    global _revocations
+    with _revocations_lock:
+        if _revocations is None:
+            config = current_app.config
+            _revocations = RevocationList(config['REVOCATION_BLOOM_CAPACITY'],
+                                          config['REVOCATION_SYNC_INTERVAL'],
+                                          config['REVOCATION_REBUILD_INTERVAL'])
+        return _revocations
+
+
+def revoke_token(decoded):
+    """Revoke a decoded JWT (as returned by get_jwt() or decode_token())."""
+    get_revocation_list().revoke(decoded['jti'], decoded['type'], int(decoded['sub']),
+                                 datetime.utcfromtimestamp(decoded['exp']))
+
+
+def purge_expired(batch_size=1000, pause=0):
+    """Delete revocations of expired tokens, pausing between batches; returns rows deleted."""
+    deleted = 0
+    while True:
+        with db.engine.begin() as connection:
+            will_write(connection)
+            ids = connection.execute(select(RevokedToken.id).where(
+                RevokedToken.expires_at <= datetime.utcnow()).limit(batch_size)).scalars().all()
+            if not ids:
+                return deleted
+            connection.execute(delete(RevokedToken).where(RevokedToken.id.in_(ids)))
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,222 @@
+"""
+Server-side questionnaire scoring.
+
+Rubrics are versioned JSON files in app/rubrics/ (<version>.json). Each
+question is one of:
+
+- choice:  one string answer, scored by its entry in "points"
+- multi:   a list of strings, their "points" summed up to "cap"
+- number:  clipped to [min, max] and scaled to 0..weight ("invert"
+           scores min highest)
+- boolean: weight when the answer is true/"yes"
+
+Unknown or malformed answers score 0. Scores are 0-100: the points
+earned over the points possible.
+
+A rubric is compiled once into NumPy arrays: every numeric/boolean
+question and every choice/multi option is a feature column with a
+weight, and a column-to-question matrix sums the weighted features per
+question so multi caps apply. A batch of answers is encoded column by
+column into a feature matrix and scored with two matrix products, so
+scoring one submission inline and re-scoring the whole table share the
+same code.
+
+NumPy is imported with this module, which the views import on first
+submission rather than at boot.
+"""
+import json
+import math
+import os
+import threading
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, or_, select, update
+
+from app.models import db, QuestionnaireResponse
+from app.utils.sqlite import will_write
+
+RUBRIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'rubrics')
+
+QUESTION_TYPES = ('choice', 'multi', 'number', 'boolean')
+TRUE_ANSWERS = (True, 'yes', 'true')
+
+
+class RubricError(ValueError):
+    """A rubric file is missing or malformed."""
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class CompiledRubric:
+    """A rubric as weight arrays; score() takes a list of answer dicts."""
+
+    def __init__(self, rubric):
+        self.version = rubric['version']
+        columns = 0
+        weights, column_question, caps = [], [], []
+        self._numbers, self._booleans, self._choices, self._multis = [], [], [], []
+
+        for q, question in enumerate(rubric['questions']):
+            kind = question.get('type')
+            if kind not in QUESTION_TYPES:
+                raise RubricError(f"{self.version}: question {question.get('id')!r} has unknown type {kind!r}")
+            if kind in ('number', 'boolean'):
+                weights.append(float(question['weight']))
+                column_question.append(q)
+                caps.append(float(question['weight']))
+                if kind == 'number':
+                    low, high = float(question['min']), float(question['max'])
+                    if high <= low:
+                        raise RubricError(f"{self.version}: {question['id']} needs max > min")
+                    self._numbers.append((question['id'], columns, low, high, bool(question.get('invert'))))
+                else:
+                    self._booleans.append((question['id'], columns))
+                columns += 1
+                continue
+
+            options = {option: columns + i for i, option in enumerate(question['points'])}
+            points = [float(p) for p in question['points'].values()]
+            weights.extend(points)
+            column_question.extend([q] * len(points))
+            if kind == 'choice':
+                caps.append(max(points))
+                self._choices.append((question['id'], options))
+            else:
+                caps.append(float(question.get('cap', sum(p for p in points if p > 0))))
+                self._multis.append((question['id'], options))
+            columns += len(points)
+
+        self.columns = columns
+        self.weights = np.array(weights)
+        # Column -> question incidence, so per-question sums are one matmul
+        self.membership = np.zeros((columns, len(caps)))
+        self.membership[np.arange(columns), column_question] = 1.0
+        self.caps = np.array(caps)
+        self.possible = self.caps.sum()
+
+    def encode(self, answers):
+        """Feature matrix (len(answers) x columns) for a list of answer dicts."""
+        n = len(answers)
+        features = np.zeros((n, self.columns))
+        for qid, column, low, high, invert in self._numbers:
+            values = np.fromiter((_number(a.get(qid)) for a in answers), float, n)
+            scaled = (np.clip(values, low, high) - low) / (high - low)
+            features[:, column] = np.nan_to_num(1.0 - scaled if invert else scaled)
+        for qid, column in self._booleans:
+            features[:, column] = np.fromiter((a.get(qid) in TRUE_ANSWERS for a in answers), float, n)
+        for qid, options in self._choices:
+            picked = np.fromiter((options.get(v, -1) if isinstance(v, str) else -1
+                                  for v in (a.get(qid) for a in answers)), np.int64, n)
+            rows = np.flatnonzero(picked >= 0)
+            features[rows, picked[rows]] = 1.0
+        for qid, options in self._multis:
+            rows, cols = [], []
+            for i, a in enumerate(answers):
+                selected = a.get(qid)
+                if isinstance(selected, list):
+                    for v in set(v for v in selected if isinstance(v, str)):
+                        if v in options:
+                            rows.append(i)
+                            cols.append(options[v])
+            features[rows, cols] = 1.0
+        return features
+
+    def score(self, answers):
+        """Scores (0-100, 2 decimals) for a list of answer dicts, as a float array."""
+        answers = [a if isinstance(a, dict) else {} for a in answers]
+        per_question = (self.encode(answers) * self.weights) @ self.membership
+        earned = np.minimum(per_question, self.caps).sum(axis=1)
+        return np.round(earned * (100.0 / self.possible), 2)
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def load_rubric(version):
+    """Read and validate app/rubrics/<version>.json."""
+    path = os.path.join(RUBRIC_DIR, f'{version}.json')
+    try:
+        with open(path) as f:
+            rubric = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise RubricError(f"Cannot load rubric {version!r}: {e}")
+    if rubric.get('version') != version:
+        raise RubricError(f"{path} declares version {rubric.get('version')!r}")
+    return rubric
+
+
+def get_rubric(version=None):
+    """The compiled rubric for ``version`` (default QUESTIONNAIRE_RUBRIC), compiled once per process."""
+    version = version or current_app.config['QUESTIONNAIRE_RUBRIC']
+    with _compiled_lock:
+        if version not in _compiled:
+            _compiled[version] = CompiledRubric(load_rubric(version))
+        return _compiled[version]
+
+
+def score_answers(answers, version=None):
+    """
+    Score one submission.
+
+    Returns:
+        tuple: (score, rubric version)
+    """
+    rubric = get_rubric(version)
+    return float(rubric.score([answers])[0]), rubric.version
+
+
+def rescore_responses(version=None, chunk_size=10000, everything=False, progress=None):
+    """
+    Re-score stored questionnaire responses with a rubric.
+
+    Rows are read in id order, chunk_size at a time (keyset pagination,
+    so memory stays flat and each chunk is its own transaction), scored
+    as one array and written back with one executemany UPDATE per chunk.
+    By default only rows not yet scored with ``version`` are touched, so
+    an interrupted run picks up where it stopped. Archived months are
+    not re-scored.
+
+    Args:
+        version (str): Rubric version (default QUESTIONNAIRE_RUBRIC)
+        chunk_size (int): Rows per read/score/write round
+        everything (bool): Also re-score rows already on ``version``
+        progress (callable): Called with a message after each chunk
+
+    Returns:
+        dict: counts of scanned and changed (score differed) rows
+    """
+    rubric = get_rubric(version)
+    table = QuestionnaireResponse
+    statement = select(table.id, table.answers, table.score).order_by(table.id).limit(chunk_size)
+    if not everything:
+        statement = statement.where(or_(table.rubric_version.is_(None), table.rubric_version != rubric.version))
+    write = (update(table.__table__)
+             .where(table.__table__.c.id == bindparam('_id'))
+             .values(score=bindparam('_score'), rubric_version=rubric.version))
+
+    counts = {'scanned': 0, 'changed': 0}
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            will_write(connection)
+            rows = connection.execute(statement.where(table.id > last_id)).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            scores = rubric.score([row.answers for row in rows]).tolist()
+            connection.execute(write, [{'_id': i, '_score': s} for i, s in zip(ids, scores)])
+        last_id = ids[-1]
+        counts['scanned'] += len(ids)
+        counts['changed'] += sum(row.score != s for row, s in zip(rows, scores))
+        if progress:
+            progress(f"{counts['scanned']} responses re-scored with {rubric.version} (up to id {last_id})")
+    return counts
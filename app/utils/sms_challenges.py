@@ -0,0 +1,233 @@
+"""
+Single-flight SMS challenges per user and phone number.
+
+Double-clicks, retries and the resend endpoint all ask for a challenge.
+Instead of each one starting a new provider verification (paying for it,
+tripping Vonage's "concurrent verifications" error and overwriting the
+stored request id with one whose code the user never saw):
+
+- a challenge sent to the same number within SMS_CODE_TTL is reused;
+- concurrent requests for the same user and number share the one send
+  in flight, even across server threads.
+
+The stored challenge is only ever replaced or cleared by a
+compare-and-set on the users row (store_sms_challenge,
+clear_answered_challenge), so a request acting on what it read before
+awaiting the provider cannot clobber a challenge stored meanwhile by
+another process.
+
+Challenges that are superseded, or never answered within
+SMS_CHALLENGE_ABANDON_AFTER seconds, are cancelled in batches by
+`flask cancel-sms-challenges`.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db, User
+from app.utils.optimistic import update_user
+from app.utils.replicas import stick_to_primary
+from app.utils.sms import send_sms_code_async
+from app.utils.sms_providers import get_router
+
+logger = logging.getLogger(__name__)
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Challenge ids replaced before they expired; cancelled with the next batch
+_superseded = []
+_superseded_lock = threading.Lock()
+
+
+def active_challenge(user, phone_number, now=None):
+    """The user's stored challenge id if it went to ``phone_number`` and is still valid."""
+    if not (user.vonage_request_id and user.sms_challenge_sent_at
+            and user.sms_challenge_phone == phone_number):
+        return None
+    age = ((now or datetime.utcnow()) - user.sms_challenge_sent_at).total_seconds()
+    if age >= current_app.config['SMS_CODE_TTL']:
+        return None
+    return user.vonage_request_id
+
+
+def abandoned_challenges(sent_before):
+    """
+    Filter for users holding a challenge sent before ``sent_before``.
+
+    Challenges stored before migration 004 have no send time; they are
+    never reused (active_challenge), so they count as abandoned.
+    """
+    return (User.vonage_request_id.is_not(None),
+            or_(User.sms_challenge_sent_at.is_(None), User.sms_challenge_sent_at < sent_before))
+
+
+async def request_sms_challenge(user_id, phone_number, active=None, previous=None):
+    """
+    Start an SMS challenge, or join/reuse one for the same user and number.
+
+    Call after release_connection(); only plain values are passed in.
+
+    Args:
+        user_id (int): User the challenge is for
+        phone_number (str): E.164 destination
+        active (str): Still-valid stored challenge for this number (see active_challenge)
+        previous (str): Stored challenge being replaced, to cancel later
+
+    Returns:
+        tuple: (challenge_id or None, reused). reused is True when no new
+            SMS was sent because an active or in-flight challenge was joined.
+    """
+    if active:
+        return active, True
+
+    key = (user_id, phone_number)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        challenge_id = await asyncio.wrap_future(future)
+        return challenge_id, challenge_id is not None
+
+    try:
+        challenge_id = await send_sms_code_async(phone_number, None)
+        future.set_result(challenge_id)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    if challenge_id and previous and previous != challenge_id:
+        _supersede(previous)
+    return challenge_id, False
+
+
+def _supersede(challenge_id):
+    with _superseded_lock:
+        _superseded.append(challenge_id)
+
+
+def store_sms_challenge(user, challenge_id, phone_number, previous):
+    """
+    Record a newly sent challenge on the user.
+
+    If another request stored a different challenge for the same number
+    since ``previous`` was read and it is still valid, that one stands
+    and ours is queued for cancellation, so the user is asked for the
+    code of the challenge that was stored.
+
+    Returns:
+        bool: True if ours was stored
+    """
+    replaced = []
+
+    def change(user):
+        stored = user.vonage_request_id
+        replaced[:] = [stored] if stored not in (None, previous, challenge_id) else []
+        if replaced and active_challenge(user, phone_number):
+            return False
+        user.set_sms_challenge(challenge_id, phone_number, datetime.utcnow())
+
+    stored = update_user(user, change)
+    for superseded in replaced if stored else [challenge_id]:
+        _supersede(superseded)
+    return stored
+
+
+def clear_answered_challenge(user, challenge_id):
+    """Clear the answered challenge, unless a newer one has replaced it since."""
+    def change(user):
+        if user.vonage_request_id != challenge_id:
+            return False
+        user.clear_sms_challenge()
+
+    return update_user(user, change)
+
+
+async def _cancel_all(challenge_ids, concurrency):
+    router = get_router()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def cancel(challenge_id):
+        async with semaphore:
+            return await router.acancel(challenge_id)
+
+    return await asyncio.gather(*(cancel(challenge_id) for challenge_id in challenge_ids))
+
+
+def cancel_abandoned_challenges(abandon_after=None, batch_size=500, concurrency=10, pause=0):
+    """
+    Cancel SMS challenges nobody answered, in batches.
+
+    A stored challenge is abandoned once it is older than
+    SMS_CHALLENGE_ABANDON_AFTER. Ones past SMS_CODE_TTL, or without a
+    send time, have already expired at the provider and are only
+    cleared locally. ``pause`` seconds are slept between batches to
+    leave room for live traffic. A batch that conflicted with a login
+    is reselected from the primary after the same pause, plus a jittered
+    backoff that grows with each conflict in a row.
+
+    Returns:
+        dict: cleared, cancelled and failed counts
+    """
+    config = current_app.config
+    abandon_after = config['SMS_CHALLENGE_ABANDON_AFTER'] if abandon_after is None else abandon_after
+    now = datetime.utcnow()
+    expired_before = now - timedelta(seconds=config['SMS_CODE_TTL'])
+    counts = {'cleared': 0, 'cancelled': 0, 'failed': 0}
+    conflicts = 0
+
+    with _superseded_lock:
+        to_cancel = _superseded[:]
+        _superseded.clear()
+
+    while True:
+        users = db.session.scalars(
+            db.select(User)
+            .where(*abandoned_challenges(now - timedelta(seconds=abandon_after)))
+            .limit(batch_size)
+        ).all()
+        if not users:
+            break
+        cancel = []
+        for user in users:
+            if user.sms_challenge_sent_at is not None and user.sms_challenge_sent_at > expired_before:
+                cancel.append(user.vonage_request_id)
+            user.clear_sms_challenge()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # A user in the batch logged in meanwhile; reselect what is still abandoned from the
+            # primary, since a lagging replica would hand back the versions that just lost
+            db.session.rollback()
+            stick_to_primary(db.session)
+            conflicts += 1
+            time.sleep(pause + random.uniform(0, config['USER_UPDATE_BACKOFF'] * 2 ** min(conflicts, 10)))
+            continue
+        conflicts = 0
+        to_cancel.extend(cancel)
+        counts['cleared'] += len(users)
+        if pause:
+            time.sleep(pause)
+
+    for start in range(0, len(to_cancel), batch_size):
+        results = asyncio.run(_cancel_all(to_cancel[start:start + batch_size], concurrency))
+        counts['cancelled'] += sum(results)
+        counts['failed'] += len(results) - sum(results)
+
+    logger.info("SMS challenges: %d abandoned cleared, %d cancelled, %d could not be cancelled",
+                counts['cleared'], counts['cancelled'], counts['failed'])
+    return counts
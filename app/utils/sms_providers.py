@@ -0,0 +1,394 @@
+"""
+SMS challenge providers and latency-aware routing.
+
+A provider starts a verification challenge for a phone number and later
+checks the code the user typed in. Two backends exist:
+
+- VonageVerifyProvider: Vonage Verify (legacy); Vonage generates and
+  checks the code.
+- HttpSmsProvider: any HTTP SMS gateway that accepts {"to", "text"}.
+  The code is derived from an HMAC of the challenge id, so it can be
+  checked locally by any worker without storing it.
+
+SmsRouter keeps a rolling window of send latency and success per
+(provider, destination country) and sends through the provider with the
+lowest expected delivery time. Challenge ids are prefixed with the
+provider name ("vonage:<request_id>") so a code is always checked against
+the provider that issued it.
+
+The Vonage SDK and httpx are imported on first use: they are the bulk of
+worker boot time and most requests never send an SMS.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import math
+import random
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import current_app
+
+from app.utils import tracing
+from app.utils.breaker import get_breaker, OPEN
+from app.utils.http import provider_client
+
+logger = logging.getLogger(__name__)
+
+# ITU country calling codes are prefix-free: 1 and 7 are one digit, these
+# are two digits, everything else is three.
+TWO_DIGIT_CALLING_CODES = {
+    '20', '27', '30', '31', '32', '33', '34', '36', '39', '40', '41', '43', '44',
+    '45', '46', '47', '48', '49', '51', '52', '53', '54', '55', '56', '57', '58',
+    '60', '61', '62', '63', '64', '65', '66', '81', '82', '84', '86', '90', '91',
+    '92', '93', '94', '95', '98',
+}
+
+
+def country_of(phone_number):
+    """Country calling code of an E.164 number (e.g. '+447700900123' -> '44')."""
+    digits = phone_number.lstrip('+')
+    if digits[:1] in ('1', '7'):
+        return digits[:1]
+    if digits[:2] in TWO_DIGIT_CALLING_CODES:
+        return digits[:2]
+    return digits[:3]
+
+
+class VonageVerifyProvider:
+    """Vonage Verify (legacy), SMS-only workflow."""
+
+    def __init__(self, config, name='vonage'):
+        self.name = name
+        self.api_key = config.get('VONAGE_API_KEY')
+        self.api_secret = config.get('VONAGE_API_SECRET')
+        self.brand = config.get('VONAGE_BRAND_NAME', 'BBA Services')
+        self.api_url = config['VONAGE_API_URL']
+        self.timeout = config['PROVIDER_TIMEOUT']
+
+    @property
+    def configured(self):
+        return bool(self.api_key and self.api_secret)
+
+    def _client(self):
+        from vonage import Auth, Vonage, HttpClientOptions
+
+        auth = Auth(api_key=self.api_key, api_secret=self.api_secret)
+        timeout = max(1, math.ceil(self.timeout))
+        return Vonage(auth=auth, http_client_options=HttpClientOptions(timeout=timeout))
+
+    def start(self, phone_number):
+        """Start a verification; returns Vonage's request_id or None if rejected."""
+        from vonage_verify_legacy import VerifyRequest, VerifyError
+
+        verify_request = VerifyRequest(
+            number=phone_number.lstrip('+'),  # Vonage expects digits only
+            brand=self.brand,
+            code_length=6,
+            workflow_id=1  # SMS only (1=SMS, 6=SMS->TTS, 7=SMS->TTS->TTS)
+        )
+        try:
+            with get_breaker(self.name).guard(ignore=(VerifyError,)):
+                with tracing.span('vonage.verify.start', 'client', **{'peer.service': self.name}):
+                    response = self._client().verify_legacy.start_verification(verify_request)
+        except VerifyError as e:
+            logger.warning("Vonage rejected verification: %s", e)
+            return None
+        return response.request_id
+
+    def check(self, request_id, code):
+        from vonage_verify_legacy import VerifyError
+
+        try:
+            with get_breaker(self.name).guard(ignore=(VerifyError,)):
+                with tracing.span('vonage.verify.check', 'client', **{'peer.service': self.name}):
+                    self._client().verify_legacy.check_code(request_id, code=code)
+        except VerifyError as e:
+            logger.info("Verification failed: %s", e)
+            return False
+        return True
+
+    async def _post(self, path, params):
+        params = {'api_key': self.api_key, 'api_secret': self.api_secret, **params}
+        async with provider_client() as client:
+            with get_breaker(self.name).guard():
+                with tracing.span(f'vonage {path}', 'client', **{'peer.service': self.name}) as span:
+                    response = await asyncio.wait_for(
+                        client.post(f"{self.api_url}{path}", data=params, headers=tracing.inject({})),
+                        self.timeout
+                    )
+                    if span is not None:
+                        span.set(**{'http.status_code': response.status_code})
+                if response.is_server_error:
+                    response.raise_for_status()
+        return response.json()
+
+    async def astart(self, phone_number):
+        body = await self._post('/verify/json', {
+            'number': phone_number.lstrip('+'),
+            'brand': self.brand,
+            'code_length': 6,
+            'workflow_id': 1,  # SMS only
+        })
+        if body.get('status') != '0':
+            logger.warning("Vonage rejected verification: %s", body.get('error_text', 'Unknown error'))
+            return None
+        return body['request_id']
+
+    async def acheck(self, request_id, code):
+        body = await self._post('/verify/check/json', {'request_id': request_id, 'code': code})
+        if body.get('status') != '0':
+            logger.info("Verification failed: %s", body.get('error_text', 'Invalid code'))
+            return False
+        return True
+
+    async def acancel(self, request_id):
+        """Cancel an unanswered verification so the number can be verified again."""
+        body = await self._post('/verify/control/json', {'request_id': request_id, 'cmd': 'cancel'})
+        if body.get('status') != '0':
+            logger.warning("Vonage did not cancel %s: %s", request_id, body.get('error_text', 'Unknown error'))
+            return False
+        return True
+
+
+class HttpSmsProvider:
+    """Generic HTTP SMS gateway with locally derived, stateless codes."""
+
+    configured = True
+    max_attempts = 5
+
+    def __init__(self, config, name, url):
+        self.name = name
+        self.url = url
+        self.token = config.get('SMS_HTTP_TOKEN')
+        self.brand = config.get('VONAGE_BRAND_NAME', 'BBA Services')
+        self.ttl = config['SMS_CODE_TTL']
+        self.timeout = config['PROVIDER_TIMEOUT']
+        self._secret = config['SECRET_KEY'].encode()
+        self._attempts = {}
+        self._attempts_lock = threading.Lock()
+
+    def _code(self, challenge):
+        digest = hmac.new(self._secret, f"{self.name}:{challenge}".encode(), hashlib.sha256).hexdigest()
+        return f"{int(digest, 16) % 1000000:06d}"
+
+    def _new_challenge(self):
+        challenge = f"{secrets.token_hex(8)}.{int(time.time()) + self.ttl}"
+        return challenge, self._code(challenge)
+
+    def _request(self, phone_number, code):
+        headers = {'Authorization': f"Bearer {self.token}"} if self.token else {}
+        payload = {
+            'to': phone_number,
+            'text': f"Your {self.brand} verification code is {code}",
+        }
+        return {'url': self.url, 'json': payload, 'headers': tracing.inject(headers)}
+
+    def _accepted(self, response):
+        if response.is_server_error:
+            response.raise_for_status()
+        if response.is_client_error:
+            logger.warning("%s rejected SMS: %s %s", self.name, response.status_code, response.text)
+            return False
+        return True
+
+    def start(self, phone_number):
+        import httpx
+
+        challenge, code = self._new_challenge()
+        with get_breaker(self.name).guard():
+            with tracing.span('sms.send', 'client', **{'peer.service': self.name}):
+                response = httpx.post(timeout=self.timeout, **self._request(phone_number, code))
+            accepted = self._accepted(response)
+        return challenge if accepted else None
+
+    async def astart(self, phone_number):
+        challenge, code = self._new_challenge()
+        async with provider_client() as client:
+            with get_breaker(self.name).guard():
+                with tracing.span('sms.send', 'client', **{'peer.service': self.name}):
+                    response = await asyncio.wait_for(
+                        client.post(**self._request(phone_number, code)),
+                        self.timeout
+                    )
+                accepted = self._accepted(response)
+        return challenge if accepted else None
+
+    def check(self, challenge, code):
+        try:
+            expires_at = int(challenge.rsplit('.', 1)[1])
+        except (IndexError, ValueError):
+            return False
+        now = time.time()
+        if expires_at < now:
+            logger.info("Verification failed: %s challenge expired", self.name)
+            return False
+
+        # Best-effort per-process brute-force limit
+        with self._attempts_lock:
+            for key in [k for k, (_, exp) in self._attempts.items() if exp < now]:
+                del self._attempts[key]
+            attempts, _ = self._attempts.get(challenge, (0, expires_at))
+            if attempts >= self.max_attempts:
+                logger.warning("Verification failed: too many attempts for %s challenge", self.name)
+                return False
+            self._attempts[challenge] = (attempts + 1, expires_at)
+
+        return hmac.compare_digest(self._code(challenge), str(code))
+
+    async def acheck(self, challenge, code):
+        return self.check(challenge, code)
+
+    async def acancel(self, challenge):
+        # Nothing is held at the gateway; the code simply expires
+        return True
+
+
+class SmsRouter:
+    """Pick an SMS provider per destination country from recent latency and success."""
+
+    def __init__(self, providers, window=50, min_samples=5, explore=0.05):
+        self.providers = {p.name: p for p in providers}
+        self.min_samples = min_samples
+        self.explore = explore
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def _expected_latency(self, name, country):
+        """Mean successful send latency divided by success rate; lower is better."""
+        with self._lock:
+            samples = list(self._samples[(name, country)])
+        if len(samples) < self.min_samples:
+            return -1.0  # not enough data yet: try it before trusting the others
+        ok_latencies = [latency for latency, ok in samples if ok]
+        if not ok_latencies:
+            return math.inf
+        success_rate = len(ok_latencies) / len(samples)
+        return (sum(ok_latencies) / len(ok_latencies)) / success_rate
+
+    def rank(self, phone_number):
+        """Providers to try for this number, best first; open breakers are skipped."""
+        country = country_of(phone_number)
+        candidates = [p for p in self.providers.values()
+                      if p.configured and get_breaker(p.name).state != OPEN]
+        ranked = sorted(candidates, key=lambda p: self._expected_latency(p.name, country))
+        if len(ranked) > 1 and random.random() < self.explore:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def record(self, name, phone_number, elapsed, ok):
+        with self._lock:
+            self._samples[(name, country_of(phone_number))].append((elapsed, ok))
+
+    def _parse(self, challenge_id):
+        name, sep, token = challenge_id.partition(':')
+        if not sep:
+            # Stored before routing existed: a bare Vonage request_id
+            return self.providers.get('vonage'), challenge_id
+        return self.providers.get(name), token
+
+    def send(self, phone_number):
+        """Start a challenge, failing over down the ranking; returns 'provider:token' or None."""
+        for provider in self.rank(phone_number):
+            started = time.perf_counter()
+            try:
+                token = provider.start(phone_number)
+            except Exception as e:
+                logger.warning("Failed to send SMS via %s: %s", provider.name, str(e) or type(e).__name__)
+                token = None
+            self.record(provider.name, phone_number, time.perf_counter() - started, token is not None)
+            if token:
+                return f"{provider.name}:{token}"
+        return None
+
+    async def asend(self, phone_number):
+        for provider in self.rank(phone_number):
+            started = time.perf_counter()
+            try:
+                token = await provider.astart(phone_number)
+            except Exception as e:
+                logger.warning("Failed to send SMS via %s: %s", provider.name, str(e) or type(e).__name__)
+                token = None
+            self.record(provider.name, phone_number, time.perf_counter() - started, token is not None)
+            if token:
+                return f"{provider.name}:{token}"
+        return None
+
+    def verify(self, challenge_id, code):
+        provider, token = self._parse(challenge_id)
+        if provider is None:
+            logger.warning("Verification failed: unknown SMS provider for %s", challenge_id)
+            return False
+        try:
+            return provider.check(token, code)
+        except Exception as e:
+            logger.warning("Failed to verify code via %s: %s", provider.name, str(e) or type(e).__name__)
+            return False
+
+    async def averify(self, challenge_id, code):
+        provider, token = self._parse(challenge_id)
+        if provider is None:
+            logger.warning("Verification failed: unknown SMS provider for %s", challenge_id)
+            return False
+        try:
+            return await provider.acheck(token, code)
+        except Exception as e:
+            logger.warning("Failed to verify code via %s: %s", provider.name, str(e) or type(e).__name__)
+            return False
+
+    async def acancel(self, challenge_id):
+        provider, token = self._parse(challenge_id)
+        if provider is None:
+            return False
+        try:
+            return await provider.acancel(token)
+        except Exception as e:
+            logger.warning("Failed to cancel challenge via %s: %s", provider.name, str(e) or type(e).__name__)
+            return False
+
+    def snapshot(self):
+        """Window stats per provider and country, for health checks and benchmarks."""
+        with self._lock:
+            windows = {key: list(samples) for key, samples in self._samples.items()}
+        report = {}
+        for (name, country), samples in sorted(windows.items()):
+            ok = [latency for latency, success in samples if success]
+            report.setdefault(name, {})[country] = {
+                'samples': len(samples),
+                'success_rate': len(ok) / len(samples) if samples else None,
+                'mean_latency_ms': round(1000 * sum(ok) / len(ok), 1) if ok else None,
+            }
+        return report
+
+
+def build_router(config):
+    """Create the router from SMS_PROVIDERS / SMS_HTTP_PROVIDERS config."""
+    http_urls = dict(
+        entry.split('=', 1) for entry in config['SMS_HTTP_PROVIDERS'].split(',') if '=' in entry
+    )
+    providers = []
+    for name in config['SMS_PROVIDERS'].split(','):
+        name = name.strip()
+        if name == 'vonage':
+            providers.append(VonageVerifyProvider(config))
+        elif name in http_urls:
+            providers.append(HttpSmsProvider(config, name, http_urls[name].strip()))
+        elif name:
+            logger.error("SMS provider %s has no SMS_HTTP_PROVIDERS entry", name)
+    return SmsRouter(
+        providers,
+        window=config['SMS_ROUTER_WINDOW'],
+        min_samples=config['SMS_ROUTER_MIN_SAMPLES'],
+        explore=config['SMS_ROUTER_EXPLORE'],
+    )
+
+
+def get_router():
+    """The app's SMS router, built on first use."""
+    router = current_app.extensions.get('sms_router')
+    if router is None:
+        router = current_app.extensions['sms_router'] = build_router(current_app.config)
+    return router
@@ -0,0 +1,144 @@
+"""
+SQLite profile for local and single-node deployments.
+
+With SQLITE_PROFILE=wal (the default) a file-backed SQLite database is
+opened with:
+
+- journal_mode=WAL, so readers never block the writer or each other,
+  plus synchronous, busy_timeout, cache_size, mmap_size and temp_store
+  from SQLITE_* settings, set on every new connection
+- one writer connection per process. Its BEGIN waits for the first
+  statement: a write, an ORM session's transaction or one marked with
+  will_write() starts BEGIN IMMEDIATE, so writers queue on the pool
+  instead of polling the file lock and never fail upgrading from read to
+  write; a plain read on its own connection starts a deferred BEGIN and
+  leaves the file's write lock to other processes
+- SQLITE_READERS query-only connections to the same file, registered
+  as a replica bind so RoutingSession (app/utils/replicas.py) sends plain
+  reads there, and read_engine() hands to code that reads on its own
+  connection. They see every commit at once, so read-your-writes
+  pinning to the writer is turned off
+
+SQLITE_PROFILE=default leaves SQLAlchemy's defaults (rollback journal,
+pysqlite's deferred transactions). Other databases are unaffected.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from app.utils.replicas import REPLICA_BIND_PREFIX, RoutingSession, _is_plain_read
+
+READER_BIND = f'{REPLICA_BIND_PREFIX}sqlite_reader'
+
+# connection.info keys of the writer's current transaction
+_BEGIN_PENDING = 'sqlite_begin_pending'
+_WILL_WRITE = 'sqlite_will_write'
+
+
+def _is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure_sqlite(app):
+    """Engine options and the reader bind for the profile; call before db.init_app()."""
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if config['SQLITE_PROFILE'] != 'wal' or not _is_file_sqlite(uri):
+        return False
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+        # Waiting for the writer connection is bounded like waiting for the file lock
+        'poolclass': QueuePool, 'pool_size': 1, 'max_overflow': 0,
+        'pool_timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+        'connect_args': {'check_same_thread': False},
+    }
+    config['SQLALCHEMY_BINDS'] = {
+        **config.get('SQLALCHEMY_BINDS', {}),
+        READER_BIND: {'url': uri, 'poolclass': QueuePool, 'pool_size': config['SQLITE_READERS'],
+                      'max_overflow': 0, 'connect_args': {'check_same_thread': False}},
+    }
+    config['REPLICA_READ_YOUR_WRITES'] = 0
+    return True
+
+
+def read_engine(db):
+    """Engine for reads on a connection of their own: the SQLite readers under the profile, else the primary."""
+    return db.engines.get(READER_BIND) or db.engine
+
+
+def will_write(connection):
+    """Mark a transaction that reads before it writes, so the SQLite writer begins it IMMEDIATE."""
+    connection.info[_WILL_WRITE] = True
+    return connection
+
+
+def _writes(connection, statement, context):
+    if connection.info.get(_WILL_WRITE):
+        return True
+    compiled = getattr(context, 'compiled', None)
+    clause = getattr(compiled, 'statement', None)
+    if clause is not None and not getattr(clause, 'is_text', False):
+        return not _is_plain_read(clause)
+    # Textual SQL: only a SELECT is known to read
+    return not statement.lstrip()[:6].upper() == 'SELECT'
+
+
+def _pragmas(config, dbapi_connection, query_only):
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        'journal_mode=WAL',
+        f"synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"busy_timeout={config['SQLITE_BUSY_TIMEOUT']}",
+        f"cache_size={-config['SQLITE_CACHE_MB'] * 1024}",  # negative: KiB
+        f"mmap_size={config['SQLITE_MMAP_MB'] * 1024 * 1024}",
+        'temp_store=MEMORY',
+        f"query_only={'ON' if query_only else 'OFF'}",
+    ):
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
+
+
+def init_sqlite(app, db):
+    """Attach the connection pragmas and writer transactions; call after db.init_app()."""
+    if READER_BIND not in app.config['SQLALCHEMY_BINDS']:
+        return
+    config = app.config
+    with app.app_context():
+        writer, reader = db.engines[None], db.engines[READER_BIND]
+
+    @event.listens_for(writer, 'connect')
+    def writer_connect(dbapi_connection, connection_record):
+        # Take over BEGIN from pysqlite so it can be IMMEDIATE
+        dbapi_connection.isolation_level = None
+        _pragmas(config, dbapi_connection, query_only=False)
+
+    @event.listens_for(writer, 'begin')
+    def writer_begin(connection):
+        # Sent with the first statement, once it shows whether the transaction writes
+        connection.info[_BEGIN_PENDING] = True
+
+    @event.listens_for(writer, 'before_cursor_execute')
+    def writer_first_statement(connection, cursor, statement, parameters, context, executemany):
+        if connection.info.pop(_BEGIN_PENDING, False):
+            # On the driver connection, like pysqlite's own BEGIN, so query stats don't count it
+            begin = 'BEGIN IMMEDIATE' if _writes(connection, statement, context) else 'BEGIN'
+            connection.connection.driver_connection.execute(begin)
+
+    @event.listens_for(writer, 'commit')
+    @event.listens_for(writer, 'rollback')
+    def writer_end(connection):
+        connection.info.pop(_BEGIN_PENDING, None)
+        connection.info.pop(_WILL_WRITE, None)
+
+    @event.listens_for(RoutingSession, 'after_begin')
+    def session_begin(session, transaction, connection):
+        # The session's plain reads go to the readers; it is on the writer to flush, to lock, to reload
+        # what it is about to change (stick_to_primary) or because no reader was known healthy yet,
+        # and each of those writes next, whatever it runs first
+        if connection.engine is writer:
+            will_write(connection)
+
+    @event.listens_for(reader, 'connect')
+    def reader_connect(dbapi_connection, connection_record):
+        _pragmas(config, dbapi_connection, query_only=True)
@@ -0,0 +1,99 @@
+"""
+Local TOTP (RFC 6238) second factor.
+
+Verification never touches the network: the codes valid for a user's
+drift window are computed once per time step and cached, so checking a
+login code is a set lookup. Accepted codes are remembered per user and
+time step until they can no longer be valid, so a code cannot be
+replayed within its window.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pyotp
+from flask import current_app
+
+
+def new_secret():
+    return pyotp.random_base32()
+
+
+def provisioning_uri(secret, email):
+    """otpauth:// URI for authenticator apps."""
+    return pyotp.TOTP(secret, interval=current_app.config['TOTP_INTERVAL']).provisioning_uri(
+        name=email, issuer_name=current_app.config['TOTP_ISSUER']
+    )
+
+
+class WindowCodeCache:
+    """Bounded LRU of {code: counter} for each (secret, current time step)."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def codes(self, secret, counter, drift, interval):
+        key = (secret, counter, drift)
+        with self._lock:
+            window = self._entries.get(key)
+            if window is not None:
+                self._entries.move_to_end(key)
+                return window
+
+        totp = pyotp.TOTP(secret, interval=interval)
+        window = {totp.generate_otp(c): c for c in range(counter - drift, counter + drift + 1)}
+
+        with self._lock:
+            self._entries[key] = window
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return window
+
+
+class ReplayCache:
+    """Remembers accepted (user, time step) pairs until they expire."""
+
+    def __init__(self):
+        self._used = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def claim(self, user_id, counter, ttl, now=None):
+        """Record a use; False if this user already used this time step."""
+        now = time.time() if now is None else now
+        key = (user_id, counter)
+        with self._lock:
+            if now >= self._next_purge:
+                self._used = {k: exp for k, exp in self._used.items() if exp > now}
+                self._next_purge = now + ttl
+            expires_at = self._used.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._used[key] = now + ttl
+            return True
+
+
+window_codes = WindowCodeCache()
+replay_cache = ReplayCache()
+
+
+def verify(user_id, secret, token, now=None):
+    """Check a 6-digit token for a user, rejecting replays within the window."""
+    if not secret or not token:
+        return False
+    token = str(token).strip()
+    if len(token) != 6 or not token.isdigit():
+        return False
+
+    config = current_app.config
+    interval = config['TOTP_INTERVAL']
+    drift = config['TOTP_DRIFT_STEPS']
+    now = time.time() if now is None else now
+
+    counter = window_codes.codes(secret, int(now // interval), drift, interval).get(token)
+    if counter is None:
+        return False
+    # A step stays acceptable for up to (2 * drift + 1) intervals
+    return replay_cache.claim(user_id, counter, (2 * drift + 1) * interval, now)
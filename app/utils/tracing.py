@@ -0,0 +1,412 @@
+"""
+Request tracing with head sampling.
+
+With TRACE_EXPORTER set to 'file' or 'otlp', a request is traced when
+it is sampled at its start: it carries a sampled W3C traceparent header,
+or it is picked at TRACE_SAMPLE_RATE. Either way, at most
+TRACE_MAX_PER_SECOND traces start per process and second. Inside a
+sampled request, spans are recorded for:
+
+- the request itself (server span)
+- every SQL statement (before/after_cursor_execute)
+- PBKDF2 hashing and verification
+- Brevo, Vonage, HTTP SMS, Wave and SMTP relay calls (client spans);
+  HTTP calls carry the traceparent on to the provider
+- work handed to background threads: bind() carries the context into
+  executors, and queued auth events are written under a span linked to
+  the requests that emitted them
+
+Anything outside a sampled trace costs one ContextVar lookup.
+
+Finished spans go into a ring buffer of TRACE_BUFFER spans. A background
+thread exports them in OTLP/JSON every TRACE_FLUSH_INTERVAL seconds:
+one ExportTraceServiceRequest per line in hourly files in TRACE_DIR
+(file), or POSTed to an OTLP/HTTP collector at TRACE_OTLP_URL (otlp).
+Like auth events, spans are dropped rather than waited on; counts are
+served at /health/traces.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SPAN_KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+STATEMENT_MAX = 1000  # characters of SQL kept on a span
+
+_current = ContextVar('trace_span', default=None)
+
+
+def _trace_id():
+    return f'{random.getrandbits(128):032x}'
+
+
+def _span_id():
+    return f'{random.getrandbits(64):016x}'
+
+
+def parse_traceparent(header):
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None if malformed."""
+    parts = (header or '').strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'error', 'links')
+
+    def __init__(self, name, kind='internal', trace_id=None, parent_id=None, attributes=None, links=()):
+        self.trace_id = trace_id or _trace_id()
+        self.span_id = _span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+        self.links = links
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.error = f'{type(error).__name__}: {error}'
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': SPAN_KINDS[self.kind],
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)}
+                           for key, value in self.attributes.items() if value is not None],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.links:
+            span['links'] = [{'traceId': trace_id, 'spanId': span_id} for trace_id, span_id in self.links]
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Tracer:
+    """Sampling decisions, plus the ring buffer and thread that export finished spans."""
+
+    def __init__(self, config):
+        self.exporter = config['TRACE_EXPORTER']
+        self.sample_rate = config['TRACE_SAMPLE_RATE']
+        self.max_per_second = config['TRACE_MAX_PER_SECOND']
+        self.service_name = config['TRACE_SERVICE_NAME']
+        self.directory = config['TRACE_DIR']
+        self.otlp_url = config['TRACE_OTLP_URL']
+        self.batch_size = config['TRACE_BATCH_SIZE']
+        self.flush_interval = config['TRACE_FLUSH_INTERVAL']
+        self._buffer = deque(maxlen=config['TRACE_BUFFER'])
+        self._window = (0, 0)  # (second, traces started in it)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self.counts = {'requests': 0, 'sampled': 0, 'capped': 0, 'spans': 0, 'exported': 0,
+                       'dropped_full': 0, 'dropped_failed': 0, 'export_errors': 0}
+
+    @property
+    def enabled(self):
+        return self.exporter in ('file', 'otlp')
+
+    def sample(self, parent_sampled=None):
+        """Head sampling: follow a propagated decision, else TRACE_SAMPLE_RATE; capped per second."""
+        self.counts['requests'] += 1
+        if parent_sampled is False or (parent_sampled is None and random.random() >= self.sample_rate):
+            return False
+        second = int(time.monotonic())
+        with self._lock:
+            window, started = self._window
+            started = started + 1 if window == second else 1
+            self._window = (second, started)
+            if started > self.max_per_second:
+                self.counts['capped'] += 1
+                return False
+            self.counts['sampled'] += 1
+        return True
+
+    def record(self, span):
+        span.end_ns = span.end_ns or time.time_ns()
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.counts['dropped_full'] += 1
+            self._buffer.append(span)
+            self.counts['spans'] += 1
+            pending = len(self._buffer)
+        self._ensure_exporter()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_exporter(self):
+        # Started on first use so each forked worker gets its own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Export everything buffered so far; returns the number of spans exported."""
+        exported = 0
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if not batch:
+                return exported
+            body = json.dumps(self._otlp_request(batch), separators=(',', ':'))
+            try:
+                if self.exporter == 'otlp':
+                    post = urllib.request.Request(self.otlp_url, data=body.encode(),
+                                                  headers={'Content-Type': 'application/json'})
+                    urllib.request.urlopen(post, timeout=5).close()
+                else:
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = os.path.join(self.directory, f'traces-{datetime.utcnow():%Y%m%d%H}.ndjson')
+                    with open(path, 'a', encoding='utf-8') as f:
+                        f.write(body + '\n')
+            except Exception as e:
+                with self._lock:
+                    self.counts['export_errors'] += 1
+                    self.counts['dropped_failed'] += len(batch)
+                logger.warning("Trace export of %d spans dropped: %s", len(batch), e)
+                return exported
+            exported += len(batch)
+            with self._lock:
+                self.counts['exported'] += len(batch)
+
+    def _otlp_request(self, spans):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}},
+                                        {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}],
+        }]}
+
+    def stop(self, timeout=5):
+        """Stop the exporter and send what is left."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'buffered': len(self._buffer), 'capacity': self._buffer.maxlen,
+                    'exporter': self.exporter, 'sample_rate': self.sample_rate}
+
+
+_tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextmanager
+def span(name, kind='internal', **attributes):
+    """
+    Child span of the current one for the duration of the block.
+
+    Yields None, at the cost of one ContextVar lookup, when the current
+    request is not sampled or tracing is off.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, kind, parent.trace_id, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        _tracer.record(child)
+
+
+def current_context():
+    """(trace id, span id) of the current span, or None outside a sampled trace."""
+    current = _current.get()
+    return (current.trace_id, current.span_id) if current is not None else None
+
+
+def inject(headers):
+    """``headers`` plus a traceparent for the current span, for outgoing HTTP calls."""
+    current = _current.get()
+    if current is None:
+        return headers
+    return {**headers, 'traceparent': current.traceparent}
+
+
+def bind(func):
+    """``func`` running under the caller's span, for work handed to another thread."""
+    current = _current.get()
+    if current is None:
+        return func
+
+    def run(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+@contextmanager
+def linked_span(name, contexts, kind='consumer', **attributes):
+    """
+    Root span for a batch of queued work, linked to the traces that queued it.
+
+    Args:
+        contexts: current_context() values captured when each item was
+            queued; None entries (unsampled) are skipped, and with none
+            left no span is recorded
+    """
+    links = [context for context in contexts if context]
+    if _tracer is None or not links:
+        yield None
+        return
+    root = Span(name, kind, attributes=attributes, links=links)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        _tracer.record(root)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is None:
+        conn.info.setdefault('trace_spans', []).append(None)
+        return
+    conn.info.setdefault('trace_spans', []).append(Span(
+        'db.query', 'client', parent.trace_id, parent.span_id,
+        {'db.system': conn.dialect.name, 'db.statement': statement[:STATEMENT_MAX],
+         'db.executemany': executemany or None},
+    ))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get('trace_spans')
+    query_span = spans.pop() if spans else None
+    if query_span is not None:
+        query_span.set(**{'db.rows': cursor.rowcount if cursor.rowcount >= 0 else None})
+        _tracer.record(query_span)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get('trace_spans') if connection is not None else None
+    query_span = spans.pop() if spans else None
+    if query_span is not None:
+        query_span.fail(exception_context.original_exception)
+        _tracer.record(query_span)
+
+
+def init_tracing(app):
+    """Trace sampled requests of ``app`` when TRACE_EXPORTER is 'file' or 'otlp'."""
+    global _tracer
+    _tracer = tracer = Tracer(app.config)
+    if not tracer.enabled:
+        return tracer
+    atexit.register(tracer.stop)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_request_span():
+        parent = parse_traceparent(request.headers.get('traceparent'))
+        if not tracer.sample(parent[2] if parent else None):
+            return
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        root = Span(f'{request.method} {rule}', 'server',
+                    trace_id=parent[0] if parent else None, parent_id=parent[1] if parent else None,
+                    attributes={'http.method': request.method, 'http.route': rule, 'http.target': request.path,
+                                'http.client_ip': request.remote_addr})
+        g.trace_span = root
+        g.trace_token = _current.set(root)
+
+    @app.after_request
+    def tag_request_span(response):
+        root = g.get('trace_span')
+        if root is not None:
+            root.set(**{'http.status_code': response.status_code})
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        root = g.pop('trace_span', None)
+        if root is None:
+            return
+        if exc is not None:
+            root.fail(exc)
+        try:
+            _current.reset(g.pop('trace_token'))
+        except ValueError:  # torn down in another context than the one it started in
+            _current.set(None)
+        tracer.record(root)
+
+    return tracer
@@ -0,0 +1,120 @@
+"""
+Worker warm-up.
+
+A fresh worker would otherwise make its first requests pay for creating
+tables, DB connects, Jinja compilation, lazy imports, the revocation
+list load, the scoring rubric and provider connections. warm_up() does
+all of that once, right after the worker forks (gunicorn.conf.py), and
+/ready answers 503 until it has finished, so the platform routes
+traffic only to warm workers.
+
+Under the ASGI entry point the warm-up runs on a view thread of the
+a2wsgi pool. That thread then keeps the provider connections opened by
+warm-up in its pooled client, and being idle it is the first one
+handed the next request.
+"""
+import logging
+import threading
+import time
+
+from app.models import db, ensure_tables
+
+logger = logging.getLogger(__name__)
+
+_state = {'status': 'cold', 'steps': {}, 'seconds': None, 'error': None}
+_state_lock = threading.Lock()
+
+
+def _fill_pool(engine, connections):
+    # Hold them all at once so the pool ends up with that many idle connections
+    size = engine.pool.size() if hasattr(engine.pool, 'size') else 1  # SQLite memory DBs share one
+    opened = [engine.connect() for _ in range(min(connections, size))]
+    for connection in opened:
+        connection.exec_driver_sql('SELECT 1')
+    for connection in opened:
+        connection.close()
+    return len(opened)
+
+
+def _provider_urls(app):
+    from app.utils.sms_providers import get_router
+
+    urls = {app.config['BREVO_API_URL']}
+    for provider in get_router().providers.values():
+        urls.add(getattr(provider, 'api_url', None) or provider.url)
+    return sorted(urls)
+
+
+def warm_up(app):
+    """
+    Run every warm-up step in this thread; returns the warm-up state.
+
+    DB steps must succeed for the worker to be ready. Provider
+    connections (WARMUP_PROVIDERS) are best effort: an unreachable
+    provider is recorded, not fatal.
+    """
+    from app.utils.http import open_provider_connections, preload_provider_sdks, run_on_thread_loop
+    from app.utils.revocation import get_revocation_list
+    from app.utils.scoring import get_rubric
+
+    config = app.config
+    steps = {}
+    started = time.perf_counter()
+
+    def step(name, func):
+        step_started = time.perf_counter()
+        result = func()
+        steps[name] = {'ms': round((time.perf_counter() - step_started) * 1000, 1)}
+        if result is not None:
+            steps[name]['result'] = result
+
+    with app.app_context():
+        try:
+            step('imports', preload_provider_sdks)
+            step('tables', lambda: ensure_tables(app))
+            step('db_pool', lambda: {str(bind): _fill_pool(engine, config['WARMUP_DB_CONNECTIONS'])
+                                     for bind, engine in db.engines.items()})
+            step('templates', lambda: len([app.jinja_env.get_template(name)
+                                           for name in app.jinja_env.list_templates()]))
+            step('revocation_list', lambda: get_revocation_list().refresh(force=True))
+            step('scoring_rubric', lambda: get_rubric().version)
+            if config['WARMUP_PROVIDERS']:
+                step('providers', lambda: run_on_thread_loop(open_provider_connections)(_provider_urls(app)))
+            # Routing, request context and before_request hooks, exercised once
+            step('request', lambda: app.test_client().get('/health').status_code)
+        except Exception as e:
+            status, error = 'failed', f'{type(e).__name__}: {e}'
+        else:
+            status, error = 'ready', None
+
+    with _state_lock:
+        _state.update(status=status, steps=steps, error=error,
+                      seconds=round(time.perf_counter() - started, 3))
+    logger.log(logging.WARNING if error else logging.INFO, "Warm-up %s in %ss: %s%s", status, _state['seconds'],
+               ', '.join(f"{name} {info['ms']}ms" for name, info in steps.items()), f' ({error})' if error else '',
+               extra={'steps': steps})
+    return warmup_state()
+
+
+def start_warm_up(app, executor=None):
+    """
+    Start warm-up in the background unless it is running or done.
+
+    Args:
+        app (Flask): The worker's app
+        executor: Thread pool that serves requests (a2wsgi's), so the
+            warmed thread is reused; a new thread otherwise
+    """
+    with _state_lock:
+        if not app.config['WARMUP_ENABLED'] or _state['status'] in ('warming', 'ready'):
+            return
+        _state['status'] = 'warming'
+    if executor is not None:
+        executor.submit(warm_up, app)
+    else:
+        threading.Thread(target=warm_up, args=(app,), name='warm-up', daemon=True).start()
+
+
+def warmup_state():
+    with _state_lock:
+        return {**_state, 'steps': dict(_state['steps'])}
@@ -0,0 +1,336 @@
+"""
+Wave GraphQL client with per-user response caching.
+
+wave_query() is what request handlers call. For each user it reuses one
+authenticated OAuth2Session (bounded LRU, WAVE_SESSION_CACHE), and all
+sessions share one HTTP connection pool. Tokens come from the user's
+latest WaveToken row and are refreshed shortly before they expire, or
+when Wave answers 401. The refreshed token is written back to the row.
+
+Responses are cached per user and query hash (the query text with its
+whitespace normalized, plus the variables):
+
+- younger than WAVE_CACHE_TTL: served from the cache
+- up to WAVE_CACHE_STALE seconds older than that: served from the cache
+  while one background query refreshes it
+- older, or missing: queried, and concurrent callers asking the same
+  thing wait for that one query instead of sending their own (for as
+  long as it may take, then they get the expired answer or WaveError)
+
+Only successful responses are cached. Upstream queries go through a
+token bucket (WAVE_RATE_LIMIT per second, per process). A 429 from Wave
+stops all queries until its Retry-After has passed. A caller that would
+wait longer than WAVE_RATE_WAIT gets WaveRateLimited, unless a stale
+answer is cached.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+
+from flask import current_app
+
+from app.utils import tracing
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='wave-refresh')
+
+# Refresh tokens this long before Wave would reject them
+TOKEN_REFRESH_MARGIN = 60
+
+
+class WaveError(Exception):
+    """Wave answered with an error, or could not be reached."""
+
+
+class WaveNotConnected(WaveError):
+    """The user has no stored Wave token."""
+
+
+class WaveRateLimited(WaveError):
+    """No query may be sent for ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Wave rate limit reached; retry in {retry_after:.1f}s')
+        self.retry_after = retry_after
+
+
+def query_key(query, variables=None):
+    """Cache key of a query: whitespace-insensitive in the query text, order-insensitive in variables."""
+    canonical = json.dumps({'query': ' '.join(query.split()), 'variables': variables or {}},
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class RateLimiter:
+    """Token bucket that also honours Retry-After from a 429."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token if one is free; otherwise seconds until one will be."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if not self.rate:
+                return 0.0
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, wait):
+        """Take a token, sleeping up to ``wait`` seconds for one; raises WaveRateLimited past that."""
+        deadline = time.monotonic() + wait
+        while True:
+            delay = self._reserve()
+            if not delay:
+                return
+            if time.monotonic() + delay > deadline:
+                raise WaveRateLimited(delay)
+            time.sleep(delay)
+
+    def block(self, seconds):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class WaveClient:
+    """Per-user sessions, response cache and rate limiter for one process."""
+
+    def __init__(self, app, config):
+        from requests.adapters import HTTPAdapter
+
+        self.app = app
+        self.graphql_url = config['WAVE_GRAPHQL_URL']
+        self.token_url = f"{config['WAVE_OAUTH_URL']}/token"
+        self.client_id = config['WAVE_CLIENT_ID']
+        self.client_secret = config['WAVE_CLIENT_SECRET']
+        self.timeout = config['WAVE_TIMEOUT']
+        self.ttl = config['WAVE_CACHE_TTL']
+        self.stale = config['WAVE_CACHE_STALE']
+        self.max_entries = config['WAVE_CACHE_SIZE']
+        self.max_sessions = config['WAVE_SESSION_CACHE']
+        self.rate_wait = config['WAVE_RATE_WAIT']
+        # A query's worst case: token refresh, post, refresh after a 401, post again
+        self.query_wait = 4 * self.timeout + 2 * self.rate_wait
+        self.limiter = RateLimiter(config['WAVE_RATE_LIMIT'], config['WAVE_RATE_BURST'])
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config['WAVE_POOL_SIZE'])
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'joined': 0, 'upstream': 0,
+                      'refreshes': 0, 'token_refreshes': 0, 'rate_limited': 0}
+        self._entries = OrderedDict()  # (user id, key) -> (data, fetched at)
+        self._pending = {}  # (user id, key) -> Future of the query in flight
+        self._sessions = OrderedDict()  # user id -> (OAuth2Session, lock)
+        self._lock = threading.Lock()
+
+    # Sessions and tokens
+
+    def _load_token(self, user_id):
+        from app.models import db, WaveToken
+
+        row = db.session.execute(db.select(WaveToken).where(WaveToken.user_id == user_id)
+                                 .order_by(WaveToken.id.desc()).limit(1)).scalar_one_or_none()
+        if row is None:
+            raise WaveNotConnected(f'User {user_id} has not connected Wave')
+        token = {'access_token': row.access_token, 'refresh_token': row.refresh_token, 'token_type': 'Bearer'}
+        if row.expires_at is not None:
+            token['expires_at'] = row.expires_at.timestamp()  # stored like wave_callback does
+        return row.id, token
+
+    def _session(self, user_id):
+        from requests_oauthlib import OAuth2Session
+
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is not None:
+                self._sessions.move_to_end(user_id)
+                return entry
+        token_id, token = self._load_token(user_id)
+        session = OAuth2Session(self.client_id, token=token)
+        # Shared pool; evicted sessions are dropped, not closed, since closing would close the pool
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        session.wave_token_id = token_id
+        with self._lock:
+            # Another thread may have built one meanwhile; keep the first
+            entry = self._sessions.setdefault(user_id, (session, threading.Lock()))
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return entry
+
+    def _refresh_token(self, session, lock, seen):
+        """Refresh the session's token unless another thread already replaced ``seen``."""
+        from app.models import db, WaveToken
+
+        with lock:
+            if session.token.get('access_token') != seen:
+                return
+            try:
+                token = session.refresh_token(self.token_url, client_id=self.client_id,
+                                              client_secret=self.client_secret, timeout=self.timeout)
+            except Exception as e:
+                raise WaveError(f'Wave token refresh failed: {e}') from e
+            self.stats['token_refreshes'] += 1
+            expires_at = token.get('expires_at')
+            # Written straight through, so the caller's session transaction is left alone
+            with db.engine.begin() as connection:
+                connection.execute(db.update(WaveToken).where(WaveToken.id == session.wave_token_id).values(
+                    access_token=token['access_token'],
+                    refresh_token=token.get('refresh_token') or session.token.get('refresh_token'),
+                    expires_at=datetime.fromtimestamp(int(expires_at)) if expires_at else None,
+                ))
+
+    # Upstream queries
+
+    def _post(self, user_id, query, variables):
+        from requests import RequestException
+
+        session, lock = self._session(user_id)
+        expires_at = session.token.get('expires_at')
+        if expires_at and expires_at - time.time() < TOKEN_REFRESH_MARGIN:
+            self._refresh_token(session, lock, session.token.get('access_token'))
+        for attempt in range(2):
+            self.limiter.acquire(self.rate_wait)
+            self.stats['upstream'] += 1
+            seen = session.token.get('access_token')
+            try:
+                with tracing.span('wave.graphql', 'client', **{'peer.service': 'wave'}) as span:
+                    response = session.post(self.graphql_url, json={'query': query, 'variables': variables or {}},
+                                            headers=tracing.inject({}), timeout=self.timeout)
+                    if span is not None:
+                        span.set(**{'http.status_code': response.status_code})
+            except RequestException as e:
+                raise WaveError(f'Wave unreachable: {e}') from e
+            if response.status_code == 401 and attempt == 0 and session.token.get('refresh_token'):
+                self._refresh_token(session, lock, seen)
+                continue
+            break
+        if response.status_code == 429:
+            retry_after = float(response.headers.get('Retry-After') or 1)
+            self.limiter.block(retry_after)
+            self.stats['rate_limited'] += 1
+            raise WaveRateLimited(retry_after)
+        if response.status_code >= 400:
+            raise WaveError(f'Wave answered {response.status_code}: {response.text[:200]}')
+        body = response.json()
+        if body.get('errors'):
+            raise WaveError('; '.join(error.get('message', '?') for error in body['errors']))
+        return body.get('data')
+
+    def _fetch(self, cache_key, query, variables, future):
+        """Run the query for ``cache_key`` and settle ``future``, which callers may be waiting on."""
+        try:
+            with self.app.app_context():
+                data = self._post(cache_key[0], query, variables)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._entries[cache_key] = (data, time.monotonic())
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            future.set_result(data)
+        finally:
+            with self._lock:
+                self._pending.pop(cache_key, None)
+
+    def _join_or_start(self, cache_key):
+        """Future of the query in flight for ``cache_key``, and whether this caller must run it."""
+        with self._lock:
+            future = self._pending.get(cache_key)
+            if future is not None:
+                return future, False
+            future = self._pending[cache_key] = Future()
+            return future, True
+
+    # Public API
+
+    def query(self, user_id, query, variables=None):
+        """
+        Data of a Wave GraphQL query for ``user_id``, cached as described above.
+
+        Raises:
+            WaveNotConnected: No stored token for the user
+            WaveRateLimited: Rate limited with nothing cached to serve
+            WaveError: Wave answered with an error, or the query this
+                call joined did not finish in time
+        """
+        cache_key = (user_id, query_key(query, variables))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+        if entry is not None:
+            data, fetched_at = entry
+            age = now - fetched_at
+            if age < self.ttl:
+                self.stats['hits'] += 1
+                return data
+            if age < self.ttl + self.stale:
+                self.stats['stale_hits'] += 1
+                future, start = self._join_or_start(cache_key)
+                if start:
+                    self.stats['refreshes'] += 1
+                    _executor.submit(tracing.bind(self._fetch), cache_key, query, variables, future)
+                return data
+
+        future, start = self._join_or_start(cache_key)
+        if start:
+            self.stats['misses'] += 1
+            self._fetch(cache_key, query, variables, future)
+        else:
+            self.stats['joined'] += 1
+        try:
+            return future.result(timeout=self.query_wait)
+        except WaveRateLimited:
+            if entry is not None:
+                return entry[0]  # expired, but better than nothing while Wave says wait
+            raise
+        except FutureTimeout:
+            if entry is not None:
+                return entry[0]
+            raise WaveError(f'Wave query still running after {self.query_wait:.1f}s')
+
+    def invalidate(self, user_id):
+        """Forget the user's session and cached responses, e.g. after Wave was reconnected."""
+        with self._lock:
+            self._sessions.pop(user_id, None)
+            for cache_key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[cache_key]
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries), 'pending': len(self._pending),
+                    'sessions': len(self._sessions)}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_wave_client():
+    """The process-wide Wave client, built from the app config on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WaveClient(current_app._get_current_object(), current_app.config)
+        return _client
+
+
+def wave_query(user_id, query, variables=None):
+    """Shorthand for ``get_wave_client().query(...)``."""
+    return get_wave_client().query(user_id, query, variables)
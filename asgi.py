@@ -0,0 +1,16 @@
+"""
+Flask Email Verification App with MFA
+ASGI entry point (uvicorn asgi:app, or gunicorn -k uvicorn.workers.UvicornWorker asgi:app)
+
+Requests run on a pool of ASGI_THREADS view threads (a2wsgi). An async
+view keeps its thread while it awaits Brevo or Vonage, so this is the
+same concurrency as gunicorn --threads ASGI_THREADS; what the async views
+add is that their thread holds no DB connection while waiting
+(release_connection), so the DB pool (DB_POOL_SIZE, DB_MAX_OVERFLOW) can
+stay far smaller than the thread pool. See app/config.py for sizing.
+"""
+from a2wsgi import WSGIMiddleware
+from app import create_app
+
+flask_app = create_app()
+app = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_THREADS'])
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Authenticated API throughput with in-memory token revocation.
+
+Logs in through /api/auth/login, seeds --revoked revocations, then
+times GET /api/me with the revocation check done by the in-memory
+Bloom filter + set, and with a revoked_token lookup per request for
+comparison. Also checks that logout takes effect at once in this
+process and after one sync interval in another, that a list holding
+more revocations than its capacity rebuilds once rather than per
+check, and measures the filter's false-positive rate. Exits 1 if a check fails.
+
+    python bench_api_tokens.py --requests 5000 --revoked 50000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JWT API throughput benchmark')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--revoked', type=int, default=50000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'api.db')}",
+                       'REVOCATION_SYNC_INTERVAL': '0.5', 'AUTH_EVENT_SINK': 'off',
+                       'JWT_SECRET_KEY': 'bench-api-tokens-signing-key-32-bytes-or-more'})
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User, RevokedToken
+    from app.utils.revocation import RevocationList, get_revocation_list
+
+    app = create_app()
+    statements = []
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:46} {detail}")
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='api@example.com', is_verified=True,
+                            password_hash=generate_password_hash('api-pw', method='pbkdf2:sha256:1000')))
+        expires = datetime.utcnow() + timedelta(days=1)
+        db.session.execute(db.insert(RevokedToken), [
+            {'jti': str(uuid.uuid4()), 'token_type': 'access', 'user_id': 1,
+             'revoked_at': datetime.utcnow(), 'expires_at': expires} for _ in range(args.revoked)
+        ])
+        db.session.commit()
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+    client = app.test_client()
+    tokens = client.post('/api/auth/login', json={'email': 'api@example.com', 'password': 'api-pw'}).get_json()
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+    check('login returns tokens', 'access_token' in tokens and 'refresh_token' in tokens)
+    client.get('/api/me', headers=headers)  # first check builds the filter
+
+    def throughput(label):
+        statements.clear()
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            response = client.get('/api/me', headers=headers)
+        seconds = time.perf_counter() - started
+        print(f'     {label:40} {args.requests / seconds:8.0f} req/s  '
+              f'{len(statements) / args.requests:.3f} queries/request  (last status {response.status_code})')
+        return args.requests / seconds
+
+    print(f'GET /api/me x {args.requests}, {args.revoked:,} revoked tokens on record:')
+    in_memory = throughput('Bloom filter + exact set')
+
+    jwt = app.extensions['flask-jwt-extended']
+    original = jwt._token_in_blocklist_callback
+
+    @jwt.token_in_blocklist_loader
+    def db_lookup(jwt_header, jwt_payload):
+        return db.session.scalar(db.select(RevokedToken.id).filter_by(jti=jwt_payload['jti'])) is not None
+
+    per_request = throughput('revoked_token lookup per request')
+    jwt._token_in_blocklist_callback = original
+    check('in-memory check is faster', in_memory > per_request, f'{in_memory / per_request:.2f}x')
+
+    # More unexpired revocations than the configured capacity: one rebuild sizes the filter for them
+    small = RevocationList(10, 3600, 3600)
+
+    def check_tokens(count):
+        with app.app_context():
+            for _ in range(count):
+                small.is_revoked(str(uuid.uuid4()))
+
+    workers = [threading.Thread(target=check_tokens, args=(25,)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    check('rebuilds bounded past capacity', small.stats['rebuilds'] == 1,
+          f"{small.stats['rebuilds']} rebuilds for {small.stats['checks']} checks, capacity 10, "
+          f"{len(small._exact):,} revoked")
+
+    # Another worker's view, synced before the logout
+    with app.app_context():
+        other = RevocationList(app.config['REVOCATION_BLOOM_CAPACITY'], 0.5, 3600)
+        other.refresh(force=True)
+
+    refreshed = client.post('/api/auth/refresh',
+                            headers={'Authorization': f"Bearer {tokens['refresh_token']}"}).get_json()
+    check('refresh issues a new access token', 'access_token' in refreshed)
+    from flask_jwt_extended import decode_token
+    with app.app_context():
+        jti = decode_token(tokens['access_token'])['jti']
+    client.post('/api/auth/logout', headers=headers, json={'refresh_token': tokens['refresh_token']})
+    check('revoked at once in this process', client.get('/api/me', headers=headers).status_code == 401)
+    check('refresh token revoked with it', client.post(
+        '/api/auth/refresh', headers={'Authorization': f"Bearer {tokens['refresh_token']}"}).status_code == 401)
+    with app.app_context():
+        before_sync = other.is_revoked(jti)
+        time.sleep(0.6)
+        after_sync = other.is_revoked(jti)
+    check('other process: revoked after one sync', not before_sync and after_sync,
+          f'before sync {before_sync}, after {after_sync}')
+
+    with app.app_context():
+        revocations = get_revocation_list()
+        probes = [str(uuid.uuid4()) for _ in range(100000)]
+        hits = sum(probe in revocations._bloom for probe in probes)
+        started = time.perf_counter()
+        for probe in probes:
+            revocations.is_revoked(probe)
+        per_check = (time.perf_counter() - started) / len(probes) * 1e6
+    check('false positives below 0.5%', hits / len(probes) < 0.005,
+          f'{hits / len(probes):.3%} of 100000 unknown jtis, {per_check:.1f}us per check, '
+          f'{revocations.snapshot()}')
+
+    shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
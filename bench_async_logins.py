@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the MFA login flow against slow provider stand-ins.
+
+Runs the same workload (password + SMS send, then password + SMS verify)
+against the current gunicorn WSGI command and against the ASGI entry point,
+with every Vonage call delayed by --delay seconds.
+
+    python bench_async_logins.py --users 200 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from provider_standins import STANDIN_CODE
+
+PASSWORD = 'bench-password'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def seed_users(count):
+    """Create MFA users; a cheap hash keeps PBKDF2 out of the measurement."""
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User
+
+    app = create_app()
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            User(email=f'bench{i}@example.com', password_hash=password_hash,
+                 is_verified=True, mfa_enabled=True, phone=f'+1555{i:07d}')
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+async def mfa_login(client, base_url, i):
+    form = {'email': f'bench{i}@example.com', 'password': PASSWORD}
+    started = time.perf_counter()
+    first = await client.post(f'{base_url}/login', data=form)
+    second = await client.post(f'{base_url}/login', data={**form, 'sms_code': STANDIN_CODE})
+    ok = first.status_code == 200 and second.status_code == 302
+    return ok, time.perf_counter() - started
+
+
+async def run_logins(base_url, users):
+    limits = httpx.Limits(max_connections=users)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(mfa_login(client, base_url, i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    latencies = sorted(latency for _, latency in results)
+    return {
+        'ok': sum(ok for ok, _ in results),
+        'elapsed': elapsed,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MFA login concurrency benchmark')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-async-')
+    standin_port = free_port()
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{workdir}/bench.db',
+        'BREVO_API_URL': f'http://127.0.0.1:{standin_port}/v3',
+        'VONAGE_API_URL': f'http://127.0.0.1:{standin_port}',
+        'VONAGE_API_KEY': 'bench',
+        'VONAGE_API_SECRET': 'bench',
+    })
+    seed_users(args.users)
+
+    standins = subprocess.Popen([sys.executable, 'provider_standins.py',
+                                 '--port', str(standin_port), '--delay', str(args.delay)])
+    servers = {
+        'gunicorn (1 worker, 2 threads)': ['gunicorn', '--workers', '1', '--threads', '2',
+                                           '--timeout', '120', '--bind', '127.0.0.1:{port}', '--log-level', 'warning',
+                                           'app:create_app()'],
+        'uvicorn asgi:app (1 worker)': [sys.executable, '-m', 'uvicorn', 'asgi:app',
+                                        '--port', '{port}', '--log-level', 'warning'],
+    }
+    try:
+        wait_for(f'http://127.0.0.1:{standin_port}/')
+        print(f'{args.users} concurrent MFA logins, provider delay {args.delay}s per call\n')
+        for name, command in servers.items():
+            port = free_port()
+            server = subprocess.Popen([part.format(port=port) for part in command])
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                wait_for(f'{base_url}/health')
+                result = asyncio.run(run_logins(base_url, args.users))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f'{name:34} ok={result["ok"]:4d}  total={result["elapsed"]:7.2f}s  '
+                  f'logins/s={result["ok"] / result["elapsed"]:7.1f}  '
+                  f'p50={result["p50"]:6.2f}s  p95={result["p95"]:6.2f}s')
+    finally:
+        standins.terminate()
+        standins.wait()
+
+
+if __name__ == '__main__':
+    main()
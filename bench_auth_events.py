@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Auth event log benchmark on a local SQLite file.
+
+Failed and successful logins are timed with the event log off, with a
+synchronous INSERT per request (what writing the audit row inline would
+cost), and with the buffered log. Then a flood of events against a tiny
+buffer and a slow sink checks that memory stays bounded and every event
+is either written or counted as dropped, and the file sink is read back.
+
+    python bench_auth_events.py --logins 300
+"""
+import argparse
+import gzip
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Auth event log benchmark')
+    parser.add_argument('--logins', type=int, default=300)
+    parser.add_argument('--flood', type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'events.db')}",
+                       'AUTH_EVENT_DIR': os.path.join(tmp, 'auth_events')})
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User, AuthEvent
+    from app.utils import auth_events
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='audit@example.com', is_verified=True,
+                            password_hash=generate_password_hash('audit-pw', method='pbkdf2:sha256:1000')))
+        db.session.commit()
+
+    failures = []
+
+    def check(label, ok, detail):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:40} {detail}")
+
+    inline = {'on': False}
+
+    @app.after_request
+    def write_inline(response):
+        if inline['on']:
+            auth_events.get_auth_event_log().flush()
+        return response
+
+    def time_logins(mode):
+        log = auth_events.get_auth_event_log()
+        log.sink = 'off' if mode == 'off' else 'db'
+        inline['on'] = mode == 'inline'
+        client = app.test_client()
+        samples = []
+        for i in range(args.logins):
+            password = 'audit-pw' if i % 2 else 'wrong-pw'
+            started = time.perf_counter()
+            client.post('/login', data={'email': 'audit@example.com', 'password': password})
+            samples.append(time.perf_counter() - started)
+            client.get('/logout')
+        print(f"     {mode:10} p50={percentile(samples, 0.5):6.2f}ms  p95={percentile(samples, 0.95):6.2f}ms  "
+              f"mean={statistics.mean(samples) * 1000:6.2f}ms")
+        return samples
+
+    print(f'{args.logins} logins (half with a wrong password), each followed by a logout:')
+    time_logins('off')
+    inline_samples = time_logins('inline')
+    buffered_samples = time_logins('buffered')
+    check('buffered p50 below inline p50', percentile(buffered_samples, 0.5) < percentile(inline_samples, 0.5),
+          f'{percentile(inline_samples, 0.5):.2f}ms -> {percentile(buffered_samples, 0.5):.2f}ms')
+
+    log = auth_events.get_auth_event_log()
+    log.flush()
+    stats = log.stats()
+    with app.app_context():
+        rows = db.session.scalar(db.select(db.func.count()).select_from(AuthEvent))
+    check('every emitted event written', rows == stats['emitted'] and stats['written'] == rows,
+          f"{rows} rows, {stats['batches']} batches, stats {stats}")
+
+    # Overload: 100-event ring, a sink that takes 50ms per batch
+    app.config.update(AUTH_EVENT_BUFFER=100, AUTH_EVENT_BATCH_SIZE=50, AUTH_EVENT_FLUSH_INTERVAL=0.01)
+    flood = auth_events.AuthEventLog(app)
+    write_db = flood._write_db
+    flood._write_db = lambda batch: (time.sleep(0.05), write_db(batch))
+    started = time.perf_counter()
+    threads = [threading.Thread(target=lambda: [flood.emit({
+        'created_at': auth_events.datetime.utcnow(), 'event': 'login_failed', 'user_id': None,
+        'email': 'flood@example.com', 'ip': '127.0.0.1', 'user_agent': None, 'detail': None,
+    }) for _ in range(args.flood // 4)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    emit_seconds = time.perf_counter() - started
+    peak = flood.stats()['buffered']
+    flood.stop()
+    stats = flood.stats()
+    accounted = stats['written'] + stats['dropped_full'] + stats['dropped_failed']
+    check(f'flood of {args.flood} events', accounted == stats['emitted'] == args.flood and peak <= 100,
+          f"{emit_seconds / args.flood * 1e6:.1f}us/emit, written {stats['written']}, "
+          f"dropped {stats['dropped_full']}, buffered at most {peak}")
+
+    # File sink: gzip NDJSON, one member per flush
+    app.config.update(AUTH_EVENT_SINK='file', AUTH_EVENT_BUFFER=10000, AUTH_EVENT_BATCH_SIZE=500)
+    files = auth_events.AuthEventLog(app)
+    for i in range(1200):
+        files.emit({'created_at': auth_events.datetime.utcnow(), 'event': 'login', 'user_id': i,
+                    'email': None, 'ip': None, 'user_agent': None, 'detail': {'mfa': None}})
+    files.stop()
+    lines = 0
+    for name in os.listdir(app.config['AUTH_EVENT_DIR']):
+        with gzip.open(os.path.join(app.config['AUTH_EVENT_DIR'], name), 'rt') as f:
+            lines += sum(1 for _ in f)
+    check('file sink round trip', lines == 1200, f"{lines} lines in {os.listdir(app.config['AUTH_EVENT_DIR'])}")
+
+    shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Verification email throughput: one Brevo call per message versus batched
+message versions, against the Brevo stand-in with --delay per request.
+
+    python bench_bulk_email.py --messages 2000 --delay 0.2
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_async_logins import free_port, wait_for
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk verification email benchmark')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--delay', type=float, default=0.2)
+    parser.add_argument('--single', type=int, default=100,
+                        help='messages sent one call at a time for the baseline')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    os.environ.update({
+        'DATABASE_URL': 'sqlite://',
+        'BREVO_API_URL': f'{base_url}/v3',
+        'SENDER_EMAIL': 'bench@example.com',
+    })
+
+    from app import create_app
+    from app.utils.bulk_email import send_bulk_verification_emails
+    from app.utils.email import send_verification_email_async
+
+    standin = subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(port),
+                                '--delay', str(args.delay)])
+    messages = [{'email': f'user{i}@example.com', 'code': f'{i % 1000000:06d}'}
+                for i in range(args.messages)]
+    try:
+        wait_for(f'{base_url}/_stats')
+        app = create_app()
+        with app.app_context():
+            async def serial():
+                for message in messages[:args.single]:
+                    await send_verification_email_async(message['email'], message['code'])
+
+            started = time.perf_counter()
+            asyncio.run(serial())
+            single_rate = args.single / (time.perf_counter() - started)
+
+            with tempfile.TemporaryDirectory() as tmp:
+                counts = send_bulk_verification_emails(
+                    messages, batch_size=args.batch_size, concurrency=args.concurrency,
+                    results_path=os.path.join(tmp, 'results.ndjson'),
+                )
+
+        print(f'\none call per message: {single_rate:8.1f} messages/sec ({args.single} sent)')
+        print(f'batched x{args.batch_size}, {args.concurrency} in flight: '
+              f'{counts["messages_per_sec"]:8.1f} messages/sec ({counts["sent"]} sent, '
+              f'{counts["failed"]} failed)')
+        print('Stand-in stats:', httpx.get(f'{base_url}/_stats').json())
+    finally:
+        standin.terminate()
+        standin.wait()
+
+
+if __name__ == '__main__':
+    main()
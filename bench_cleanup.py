@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Cleanup job (app/utils/cleanup.py) on a local SQLite file under live traffic.
+
+Seeds --users accounts:
+
+- verified users, some with leftover codes, Wave tokens (some replaced,
+  some expired without a refresh token) and abandoned SMS challenges
+  (half stored before migration 004, without a send time)
+- unverified ones, most past CLEANUP_UNVERIFIED_DAYS, some of those with
+  Wave tokens and questionnaire responses
+- expired and live JWT revocations
+
+Then, while --threads threads look users up by email and update them
+the way views do (optimistic, app/utils/optimistic.py), it compares:
+
+- one statement: the stale unverified accounts deleted in one
+  transaction
+- batched: `run_cleanup()` with its default batches and pauses
+
+It checks that each step processed exactly the rows it should, that
+nothing else was touched, that a second run finds nothing, and that
+two concurrent runs together do the work once, without errors. It also
+checks that live requests waited less behind the batched job than
+behind the single statement. Exits 1 if any check fails.
+
+    python bench_cleanup.py --users 100000 --threads 4
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def seed(users):
+    """Worker: fill a fresh database; prints the expected counts per step as JSON."""
+    from sqlalchemy import insert
+    from app import create_app
+    from app.models import db, User, QuestionnaireResponse, RevokedToken, WaveToken
+
+    app = create_app()
+    now = datetime.utcnow()
+    old, recent = now - timedelta(days=30), now - timedelta(days=1)
+    expected = {'unverified-users': 0, 'stale-codes': 0, 'sms-challenges': 0, 'wave-tokens': 0, 'revoked-tokens': 0}
+    rows, tokens, responses = [], [], []
+    for i in range(1, users + 1):
+        kind = i % 10
+        row = {'id': i, 'email': f'user{i}@example.com', 'password_hash': '-', 'is_verified': kind < 5,
+               'created_at': old if kind < 9 else recent, 'version_id': 1, 'verification_code': None,
+               'vonage_request_id': None, 'sms_challenge_phone': None, 'sms_challenge_sent_at': None}
+        if kind == 0:
+            row['verification_code'] = '123456'  # left over from before verify_email cleared it
+            expected['stale-codes'] += 1
+        if kind == 1:
+            # Every other one stored before migration 004, without a send time
+            row.update(vonage_request_id=f'vonage:{i}', sms_challenge_phone='+15550000000',
+                       sms_challenge_sent_at=now - timedelta(hours=1) if i % 20 == 1 else None)
+            expected['sms-challenges'] += 1
+        if kind == 2:
+            # Reconnected twice: the older rows are dead
+            tokens += [{'user_id': i, 'access_token': f'a{i}-{n}', 'refresh_token': f'r{i}-{n}',
+                        'expires_at': now + timedelta(hours=1)} for n in range(3)]
+            expected['wave-tokens'] += 2
+        if kind == 3:
+            tokens.append({'user_id': i, 'access_token': f'a{i}', 'refresh_token': None,
+                           'expires_at': now - timedelta(days=1)})
+            expected['wave-tokens'] += 1
+        if kind == 4:
+            # Expired access token, but refreshable: kept
+            tokens.append({'user_id': i, 'access_token': f'a{i}', 'refresh_token': f'r{i}',
+                           'expires_at': now - timedelta(days=1)})
+        if 5 <= kind < 9:
+            expected['unverified-users'] += 1
+            if kind == 5:
+                tokens.append({'user_id': i, 'access_token': f'a{i}', 'refresh_token': f'r{i}',
+                               'expires_at': now + timedelta(hours=1)})
+                responses.append({'user_id': i, 'answers': {'q1': 3}, 'score': 3.0, 'created_at': old})
+        rows.append(row)
+    revoked = [{'jti': f'{i:036d}', 'token_type': 'access', 'user_id': 1, 'revoked_at': old,
+                'expires_at': old if i % 2 else now + timedelta(days=1)} for i in range(users // 10)]
+    expected['revoked-tokens'] = sum(1 for r in revoked if r['expires_at'] == old)
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            for table, data in ((User, rows), (WaveToken, tokens), (QuestionnaireResponse, responses),
+                                (RevokedToken, revoked)):
+                for start in range(0, len(data), 5000):
+                    connection.execute(insert(table), data[start:start + 5000])
+    print(json.dumps(expected))
+
+
+def snapshot():
+    from sqlalchemy import func, select
+    from app.models import db, User, QuestionnaireResponse, RevokedToken, WaveToken
+
+    counts = {name: db.session.scalar(select(func.count()).select_from(model)) for name, model in (
+        ('users', User), ('verified', db.select(User).where(User.is_verified.is_(True)).subquery()),
+        ('wave_tokens', WaveToken), ('responses', QuestionnaireResponse), ('revoked', RevokedToken))}
+    db.session.commit()
+    return counts
+
+
+def run(mode, threads, concurrent):
+    """Worker: run one cleanup mode under live traffic; prints the results as JSON."""
+    from sqlalchemy import delete, select
+    from app import create_app
+    from app.models import db, User, QuestionnaireResponse, WaveToken
+    from app.utils.cleanup import run_cleanup, STEPS
+    from app.utils.optimistic import update_user
+
+    app = create_app()
+    with app.app_context():
+        verified_ids = db.session.scalars(select(User.id).where(User.is_verified.is_(True))).all()
+        before = snapshot()
+    latencies, errors, stop = [], [], threading.Event()
+
+    def traffic():
+        while not stop.is_set():
+            user_id = random.choice(verified_ids)
+            started = time.perf_counter()
+            try:
+                with app.app_context():
+                    user = User.query.filter_by(email=f'user{user_id}@example.com').first()
+                    update_user(user, lambda u: setattr(u, 'phone', f'+1555{random.randrange(10 ** 7):07d}'))
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            latencies.append((started, time.perf_counter()))
+            time.sleep(0.005)
+
+    def one_statement():
+        cutoff = datetime.utcnow() - timedelta(days=app.config['CLEANUP_UNVERIFIED_DAYS'])
+        stale = select(User.id).where(User.is_verified.is_(False), User.created_at < cutoff)
+        with db.engine.begin() as connection:
+            connection.execute(delete(WaveToken).where(WaveToken.user_id.in_(stale)))
+            connection.execute(delete(QuestionnaireResponse).where(QuestionnaireResponse.user_id.in_(stale)))
+            deleted = connection.execute(delete(User).where(User.id.in_(stale))).rowcount
+        return {'unverified-users': deleted}
+
+    def cleanup():
+        with app.app_context():
+            if mode == 'one statement':
+                return one_statement()
+            return run_cleanup(STEPS, progress=lambda line: None)
+
+    workers = [threading.Thread(target=traffic) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.5)
+    started = time.perf_counter()
+    if concurrent:
+        results = [None, None]
+
+        def runner(n):
+            results[n] = cleanup()
+        runners = [threading.Thread(target=runner, args=(n,)) for n in range(2)]
+        for runner_thread in runners:
+            runner_thread.start()
+        for runner_thread in runners:
+            runner_thread.join()
+        processed = {step: sum((result or {}).get(step, 0) for result in results) for step in STEPS}
+    else:
+        processed = cleanup()
+    finished = time.perf_counter()
+    seconds = finished - started
+    stop.set()
+    for worker in workers:
+        worker.join()
+    # Requests that overlapped the cleanup, including those it held up
+    during = [end - begin for begin, end in latencies if end >= started and begin <= finished]
+    with app.app_context():
+        again = run_cleanup(STEPS, progress=lambda line: None) if mode != 'one statement' else None
+        after = snapshot()
+    during.sort()
+    print(json.dumps({
+        'processed': processed, 'again': again, 'seconds': seconds, 'before': before, 'after': after,
+        'requests': len(during), 'errors': errors[:5], 'error_count': len(errors),
+        'p50': statistics.median(during) * 1000 if during else 0,
+        'p99': during[int(len(during) * 0.99)] * 1000 if during else 0,
+        'max': during[-1] * 1000 if during else 0,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cleanup job benchmark')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=4, help='Threads of live traffic.')
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--concurrent', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed:
+        seed(args.users)
+        return
+    if args.run:
+        run(args.run, args.threads, args.concurrent)
+        return
+
+    tmp = tempfile.mkdtemp()
+    seeded = os.path.join(tmp, 'seeded.db')
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:46} {detail}")
+
+    def worker(*flags, database):
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{database}', 'AUTH_EVENT_SINK': 'off',
+               'SMS_CODE_TTL': '300', 'LOG_LEVEL': 'ERROR'}  # app logs share stdout with the result
+        output = subprocess.run([sys.executable, __file__, '--users', str(args.users),
+                                 '--threads', str(args.threads), *flags],
+                                env=env, capture_output=True, text=True)
+        if output.returncode:
+            print(output.stderr[-2000:])
+            raise SystemExit(f'worker {flags} failed')
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    try:
+        expected = worker('--seed', database=seeded)
+        print(f"{args.users} users; {args.threads} threads of live lookups and updates while cleaning up:")
+        results = {}
+        for label, flags in (('one statement', ()), ('batched', ()), ('2 concurrent', ('--concurrent',))):
+            database = os.path.join(tmp, f'{len(results)}.db')
+            shutil.copy(seeded, database)
+            mode = 'one statement' if label == 'one statement' else 'batched'
+            results[label] = result = worker('--run', mode, *flags, database=database)
+            print(f"     {label:14} {result['seconds']:6.2f}s  {sum(result['processed'].values()):6} rows  "
+                  f"live: {result['requests']:5} requests  p50 {result['p50']:6.1f}ms  "
+                  f"p99 {result['p99']:6.1f}ms  max {result['max']:7.1f}ms  {result['error_count']} errors")
+
+        batched = results['batched']
+        check('each step processed exactly its rows', batched['processed'] == expected,
+              ', '.join(f"{step} {count}" for step, count in batched['processed'].items()))
+        before, after = batched['before'], batched['after']
+        check('verified users all kept', after['verified'] == before['verified'],
+              f"{after['users']} of {before['users']} users left")
+        check('second run finds nothing', not any(batched['again'].values()), str(batched['again']))
+        concurrent = results['2 concurrent']
+        check('two concurrent runs do the work once', concurrent['processed'] == expected
+              and concurrent['after'] == after, f"{concurrent['error_count']} errors")
+        check('no errors in live traffic', not batched['error_count'] and not concurrent['error_count'],
+              '; '.join(batched['errors'] + concurrent['errors']))
+        single = results['one statement']
+        check('live requests wait less behind batches', batched['max'] < single['max'],
+              f"max {single['max']:.0f}ms -> {batched['max']:.0f}ms")
+    finally:
+        shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Signup email validation latency with a slow DNS resolver.
+
+A fake resolver answers after --dns-delay seconds (undeliverable for
+*.nomail.example). The same stream of signups, drawn from a few
+popular domains plus a long tail, is validated with a lookup per signup
+(the old behaviour) and through the cached validator.
+
+    python bench_email_deliverability.py --signups 300 --dns-delay 0.8
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+POPULAR = ['gmail.com', 'yahoo.com', 'outlook.com', 'icloud.com', 'hotmail.com']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(label, latencies):
+    print(f'{label:34} p50={percentile(latencies, 0.5) * 1000:7.1f}ms  '
+          f'p95={percentile(latencies, 0.95) * 1000:7.1f}ms  max={max(latencies) * 1000:7.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Signup email validation benchmark')
+    parser.add_argument('--signups', type=int, default=300)
+    parser.add_argument('--dns-delay', type=float, default=0.8)
+    parser.add_argument('--tail-domains', type=int, default=40)
+    parser.add_argument('--uncached-sample', type=int, default=20,
+                        help='signups timed for the per-signup lookup baseline')
+    args = parser.parse_args()
+
+    os.environ.update({'DATABASE_URL': 'sqlite://', 'EMAIL_DELIVERABILITY': 'dns'})
+    from email_validator import EmailNotValidError
+    from app import create_app
+    from app.utils import deliverability
+
+    lookups = []
+
+    def slow_resolve(domain, timeout):
+        lookups.append(domain)
+        time.sleep(args.dns_delay)
+        return not domain.endswith('nomail.example')
+
+    random.seed(7)
+    domains = POPULAR * 8 + [f'company{i}.example' for i in range(args.tail_domains)] + ['x.nomail.example'] * 3
+    emails = [f'user{i}@{random.choice(domains)}' for i in range(args.signups)]
+
+    app = create_app()
+    with app.app_context():
+        uncached = []
+        for email in emails[:args.uncached_sample]:
+            started = time.perf_counter()
+            slow_resolve(email.split('@')[1], args.dns_delay)
+            uncached.append(time.perf_counter() - started)
+
+        config = app.config
+        deliverability._cache = deliverability.DomainCache(
+            config['EMAIL_DOMAIN_CACHE_SIZE'], config['EMAIL_DOMAIN_POSITIVE_TTL'],
+            config['EMAIL_DOMAIN_NEGATIVE_TTL'], resolve=slow_resolve,
+        )
+        lookups.clear()
+
+        async def signups():
+            latencies, rejected = [], 0
+            for email in emails:
+                started = time.perf_counter()
+                try:
+                    await deliverability.validate_signup_email(email)
+                except EmailNotValidError:
+                    rejected += 1
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)  # signups arrive over time
+            return latencies, rejected
+
+        cached, rejected = asyncio.run(signups())
+
+        print(f'{args.signups} signups over {len(set(e.split("@")[1] for e in emails))} domains, '
+              f'DNS answers after {args.dns_delay}s, signup waits at most {config["EMAIL_DNS_WAIT"]}s\n')
+        report(f'lookup per signup ({args.uncached_sample} timed)', uncached)
+        report('cached domain validation', cached)
+        print(f'\nDNS lookups: {len(lookups)} (was {args.signups}), rejected signups: {rejected}')
+        print('Cache:', deliverability.get_domain_cache().snapshot())
+        print('mean saved per signup: '
+              f'{(statistics.mean(uncached) - statistics.mean(cached)) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
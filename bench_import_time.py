@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for worker boot: `from app import create_app; create_app()`.
+
+Runs the boot in fresh interpreters under -X importtime, reports the
+median wall time and the slowest imports, and exits 1 when the median
+exceeds --budget-ms or a provider SDK is imported during boot.
+
+    python bench_import_time.py --runs 5 --budget-ms 800
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BOOT = ('import time; started = time.perf_counter(); '
+        'from app import create_app; create_app(); '
+        'print(f"BOOT_MS {(time.perf_counter() - started) * 1000:.1f}")')
+
+# Must only be imported on first use (or by preload_provider_sdks at warm-up)
+LAZY_MODULES = ('sib_api_v3_sdk', 'vonage', 'vonage_verify_legacy', 'httpx', 'alembic', 'numpy', 'requests_oauthlib')
+
+
+def boot_once():
+    env = dict(os.environ, DATABASE_URL='sqlite://')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT],
+                            capture_output=True, text=True, env=env, check=True)
+    boot_ms = float(result.stdout.split('BOOT_MS ')[1])
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = (int(cumulative) / 1000, (len(name) - len(name.lstrip()) - 1) // 2)
+    return boot_ms, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='create_app() import-time benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=800.0,
+                        help='fail when the median boot exceeds this')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [boot_once() for _ in range(args.runs)]
+    median_ms = statistics.median(boot_ms for boot_ms, _ in runs)
+    imports = runs[-1][1]
+
+    print(f'create_app() boot: median {median_ms:.1f}ms over {args.runs} runs '
+          f'(budget {args.budget_ms:.0f}ms)\n')
+    print('Slowest imports within two levels of the top (cumulative ms, last run):')
+    top_level = sorted(((ms, name) for name, (ms, depth) in imports.items() if depth <= 1), reverse=True)
+    for ms, name in top_level[:args.top]:
+        print(f'  {ms:8.1f}  {name}')
+
+    eager = [name for name in imports if name.split('.')[0] in LAZY_MODULES]
+    failed = False
+    if eager:
+        print(f'\nFAIL: imported during boot: {", ".join(sorted(eager)[:10])}')
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f'\nFAIL: boot {median_ms:.1f}ms exceeds budget {args.budget_ms:.0f}ms')
+        failed = True
+    if failed:
+        sys.exit(1)
+    print('\nok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+JSON provider microbenchmarks on questionnaire-shaped payloads.
+
+Encodes and decodes a single response, a user's history and a large
+list with the stdlib and orjson providers, checks both produce the same
+data, and times GET /api/questionnaire end to end with each provider.
+
+    python bench_json.py --responses 5000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+QUESTIONS = 40
+
+
+def response(i, now):
+    answers = {}
+    for q in range(QUESTIONS):
+        kind = q % 4
+        answers[f'q{q}'] = (
+            random.choice(['never', 'monthly', 'weekly', 'daily']) if kind == 0
+            else random.randint(0, 10) if kind == 1
+            else random.sample(['cash', 'card', 'transfer', 'crypto', 'cheque'], 2) if kind == 2
+            else {'value': round(random.uniform(0, 1e5), 2), 'currency': 'USD', 'note': 'Revenue — approx.'}
+        )
+    return {'id': i, 'answers': answers, 'score': Decimal(f'{random.uniform(0, 100):.2f}'),
+            'created_at': now - timedelta(minutes=i)}
+
+
+def timed(func, seconds=1.0):
+    """Calls per second of ``func`` over about ``seconds``."""
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        func()
+        calls += 1
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON provider benchmark')
+    parser.add_argument('--responses', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'json.db')}", 'AUTH_EVENT_SINK': 'off',
+                       'JWT_SECRET_KEY': 'bench-json-signing-key-with-at-least-32-bytes'})
+
+    from app import create_app
+    from app.models import db, User, QuestionnaireResponse
+    from app.utils.json_provider import OrjsonProvider, StdlibJSONProvider
+    from flask_jwt_extended import create_access_token
+
+    app = create_app()
+    providers = {'stdlib': StdlibJSONProvider(app), 'orjson': OrjsonProvider(app)}
+    now = datetime.utcnow()
+    payloads = {
+        'one response': response(1, now),
+        'history (50)': [response(i, now) for i in range(50)],
+        f'list ({args.responses})': [response(i, now) for i in range(args.responses)],
+    }
+
+    failures = []
+    print(f"{'payload':18} {'op':7} {'stdlib':>14} {'orjson':>14}  speedup")
+    for name, payload in payloads.items():
+        encoded = {label: provider.encode(payload) for label, provider in providers.items()}
+        if json.loads(encoded['stdlib']) != json.loads(encoded['orjson']):
+            failures.append(name)
+            print(f'FAIL {name}: providers disagree')
+        size = len(encoded['orjson'])
+        for op in ('encode', 'decode'):
+            rates = {}
+            for label, provider in providers.items():
+                func = (lambda p=provider: p.encode(payload)) if op == 'encode' else \
+                       (lambda p=provider, body=encoded['orjson']: p.loads(body))
+                rates[label] = timed(func)
+            print(f"{name:18} {op:7} {rates['stdlib'] * size / 1e6:9.1f} MB/s {rates['orjson'] * size / 1e6:9.1f} MB/s"
+                  f"  {rates['orjson'] / rates['stdlib']:5.1f}x")
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, email='json@example.com', password_hash='-', is_verified=True))
+        db.session.execute(db.insert(QuestionnaireResponse), [
+            {'user_id': 1, 'answers': r['answers'], 'score': float(r['score']), 'created_at': r['created_at']}
+            for r in payloads[f'list ({args.responses})']
+        ])
+        db.session.commit()
+        token = create_access_token(identity='1')
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    print(f'\nGET /api/questionnaire ({args.responses} responses, streamed in chunks of '
+          f"{app.config['JSON_STREAM_CHUNK']}):")
+    bodies = {}
+    for label, provider in providers.items():
+        app.json = provider
+        samples = []
+        for _ in range(5):
+            started = time.perf_counter()
+            body = client.get('/api/questionnaire', headers=headers).get_data()
+            samples.append(time.perf_counter() - started)
+        bodies[label] = json.loads(body)
+        print(f'  {label:7} best {min(samples) * 1000:7.1f}ms  ({len(body) / 1e6:.1f}MB)')
+    if bodies['stdlib'] != bodies['orjson'] or len(bodies['orjson']) != args.responses:
+        failures.append('endpoint')
+        print('FAIL endpoint bodies differ')
+
+    shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
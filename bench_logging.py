@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Log overhead per request, and what happens when stdout cannot keep up.
+
+Each worker process serves --requests requests through the test client,
+to a view that writes --lines log lines, the way views and provider
+helpers do. The worker's stdout (PYTHONUNBUFFERED, like the Dockerfile)
+is a pipe read by this script, either as fast as it can or slowly, like
+a log collector that has fallen behind. The ways of writing lines are:
+
+- none: logging calls below LOG_LEVEL, the baseline
+- print: print() lines, as the app did before app/utils/log.py
+- sync handler: the JSON formatter and filter, written by a plain
+  StreamHandler in the request thread
+- queue: the QueueHandler pipeline init_logging() sets up
+
+It checks that:
+
+- with a slow reader, queue requests do not wait for stdout: their p99
+  stays below that of print and the sync handler
+- with a fast reader, no line is lost, every line carries the request id
+  its request was sent with, responses echo it, and a malformed id is
+  replaced
+- LOG_SAMPLING keeps about its fraction of a chatty logger's info lines
+  (marked with sample_rate) and all of its warnings
+- LOG_LEVELS silences a logger below its level
+- a queue that is full drops lines and counts them
+
+Exits 1 if any check fails.
+
+    python bench_logging.py --requests 3000 --lines 4
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MODES = ('none', 'print', 'sync handler', 'queue')
+SAMPLE_RATE = 0.1
+ENV = {
+    'PYTHONUNBUFFERED': '1', 'AUTH_EVENT_SINK': 'off', 'TRACE_EXPORTER': 'off',
+    'LOG_SAMPLING': f'bench.chatty={SAMPLE_RATE}',
+    'LOG_LEVELS': 'bench.quiet=WARNING',
+}
+
+
+def serve(mode, requests, lines, result_path):
+    """Worker: serve requests that log; log lines go to stdout, the results as JSON to ``result_path``."""
+    import logging
+    from app import create_app
+    from app.utils import log
+
+    app = create_app()
+    logger, chatty, quiet = (logging.getLogger(name) for name in ('bench', 'bench.chatty', 'bench.quiet'))
+    if mode == 'sync handler':
+        root = logging.getLogger()
+        root.removeHandler(log._handler)
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(log.JsonFormatter())
+        handler.addFilter(log._filter)
+        root.addHandler(handler)
+    elif mode == 'none':
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def view(seq):
+        for n in range(lines):
+            if mode == 'print':
+                print(f"Bench line {n} of request {seq}: user=user{seq}@example.com provider=vonage")
+            else:
+                logger.info("Bench line %d of request %d: user=%s", n, seq, f'user{seq}@example.com',
+                            extra={'seq': seq, 'provider': 'vonage'})
+        if mode != 'print':
+            chatty.info("Chatty line of request %d", seq, extra={'seq': seq})
+            if seq % 10 == 0:
+                chatty.warning("Chatty warning of request %d", seq, extra={'seq': seq})
+            quiet.info("Quiet line of request %d", seq, extra={'seq': seq})
+        return 'ok'
+
+    app.add_url_rule('/bench-log/<int:seq>', 'bench_log', view)
+    client = app.test_client()
+    echoed, samples = 0, []
+    for seq in range(requests + 50):
+        started = time.perf_counter()
+        response = client.get(f'/bench-log/{seq}', headers={'X-Request-ID': f'bench-{seq}'})
+        if seq >= 50:  # the first ones warm up
+            samples.append(time.perf_counter() - started)
+        echoed += response.headers.get('X-Request-ID') == f'bench-{seq}'
+    replaced = client.get('/bench-log/0', headers={'X-Request-ID': 'not a "valid" id'}).headers.get('X-Request-ID')
+    stats = log.get_log_stats() if mode != 'print' else {}
+    log._handler.stop()  # writes what is still queued
+    samples.sort()
+    with open(result_path, 'w') as f:
+        json.dump({
+            'mean': statistics.fmean(samples) * 1e6, 'p50': samples[len(samples) // 2] * 1e6,
+            'p99': samples[int(len(samples) * 0.99)] * 1e6, 'max': samples[-1] * 1e6,
+            'echoed': echoed - 50, 'replaced': replaced, 'stats': stats,
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logging overhead benchmark')
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--lines', type=int, default=4, help='Log lines per request.')
+    parser.add_argument('--slow-read', type=float, default=0.02,
+                        help='Seconds the slow reader waits between 4KB reads.')
+    parser.add_argument('--serve', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.requests, args.lines, args.result)
+        return
+
+    tmp = tempfile.mkdtemp()
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:52} {detail}")
+
+    def worker(mode, slow, **env):
+        """Run one worker; returns its results and, for a fast reader, the lines it wrote."""
+        result_path = os.path.join(tmp, 'result.json')
+        process = subprocess.Popen(
+            [sys.executable, __file__, '--serve', mode, '--result', result_path,
+             '--requests', str(args.requests), '--lines', str(args.lines)],
+            env={**os.environ, **ENV, 'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}", **env},
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        chunks = []
+
+        def read():
+            while chunk := process.stdout.read1(4096):
+                if slow:
+                    time.sleep(args.slow_read)
+                else:
+                    chunks.append(chunk)
+        reader = threading.Thread(target=read)
+        reader.start()
+        stderr = process.stderr.read()
+        process.wait()
+        reader.join()
+        if process.returncode:
+            print(stderr.decode()[-2000:])
+            raise SystemExit(f'{mode} worker failed')
+        with open(result_path) as f:
+            result = json.load(f)
+        return result, b''.join(chunks).decode().splitlines()
+
+    try:
+        results = {}
+        calls = args.lines + 2  # plus the chatty and quiet ones
+        for slow in (False, True):
+            print(f"{args.requests} requests, {args.lines} lines each; "
+                  f"{'slow reader (4KB every ' + str(args.slow_read * 1000) + 'ms)' if slow else 'fast reader'}:")
+            for mode in MODES:
+                results[mode, slow] = result, lines = worker(mode, slow)
+                extra = result['mean'] - results['none', slow][0]['mean']
+                print(f"     {mode:13} mean {result['mean']:7.1f}us  p50 {result['p50']:7.1f}us  "
+                      f"p99 {result['p99']:8.1f}us  max {result['max']:9.1f}us  "
+                      f"{extra / (args.lines if mode == 'print' else calls):6.1f}us per log call"
+                      + (f"  {result['stats']['dropped_full']} dropped" if mode == 'queue' else ''))
+
+        queue, slow_print, slow_sync = (results[mode, True][0] for mode in ('queue', 'print', 'sync handler'))
+        check('slow stdout: queue p99 below print', queue['p99'] < slow_print['p99'],
+              f"{slow_print['p99']:.0f}us -> {queue['p99']:.0f}us")
+        check('slow stdout: queue p99 below sync handler', queue['p99'] < slow_sync['p99'],
+              f"{slow_sync['p99']:.0f}us -> {queue['p99']:.0f}us")
+
+        result, lines = results['queue', False]
+        records = [json.loads(line) for line in lines]
+        bench = [r for r in records if r['logger'] == 'bench' and 'seq' in r]
+        check('fast stdout: no line lost', len(bench) == (args.requests + 51) * args.lines
+              and not result['stats']['dropped_full'], f"{len(bench)} lines, {result['stats']['dropped_full']} dropped")
+        # The last request, sent a malformed id, logs under the one it was given instead
+        mismatched = [r for r in bench if r.get('request_id') not in (f"bench-{r['seq']}", result['replaced'])]
+        check('every line carries its request id', not mismatched and len(records) == len(lines),
+              f"{len(mismatched)} mismatched")
+        check('responses echo the request id', result['echoed'] == args.requests, f"{result['echoed']} echoed")
+        check('malformed request id replaced', len(result['replaced'] or '') == 32, str(result['replaced']))
+
+        chatty = [r for r in records if r['logger'] == 'bench.chatty']
+        info = [r for r in chatty if r['level'] == 'INFO']
+        kept = len(info) / (args.requests + 51)
+        check('sampling keeps about its fraction of info lines', abs(kept - SAMPLE_RATE) < SAMPLE_RATE / 2
+              and all(r.get('sample_rate') == SAMPLE_RATE for r in info),
+              f"{kept:.3f} kept at LOG_SAMPLING {SAMPLE_RATE}, {result['stats']['sampled_out']} sampled out")
+        warnings = [r for r in chatty if r['level'] == 'WARNING']
+        check('sampling keeps every warning', len(warnings) == len(range(0, args.requests + 50, 10)) + 1,
+              f"{len(warnings)} warnings")
+        check('per-logger level silences bench.quiet', not any(r['logger'] == 'bench.quiet' for r in records))
+
+        tiny, _ = worker('queue', True, LOG_QUEUE_SIZE='100')
+        check('full queue drops instead of blocking', tiny['stats']['dropped_full'] > 0
+              and tiny['p99'] < slow_sync['p99'],
+              f"{tiny['stats']['dropped_full']} dropped, p99 {tiny['p99']:.0f}us")
+    finally:
+        shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
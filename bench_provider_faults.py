@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Drive the email and SMS helpers through injected provider faults.
+
+Shows per-call latency and circuit breaker state while Brevo hangs past
+the deadline (email fails over to the SMTP relay stand-in) and while
+Vonage returns 503s, then lets both recover through a half-open probe.
+
+    python bench_provider_faults.py
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench_async_logins import free_port, wait_for
+
+DEADLINE = 1.0
+RESET_TIMEOUT = 2.0
+
+
+def main():
+    port, smtp_port = free_port(), free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    os.environ.update({
+        'DATABASE_URL': 'sqlite://',
+        'BREVO_API_URL': f'{base_url}/v3',
+        'VONAGE_API_URL': base_url,
+        'VONAGE_API_KEY': 'bench',
+        'VONAGE_API_SECRET': 'bench',
+        'SENDER_EMAIL': 'bench@example.com',
+        'SMTP_RELAY_HOST': '127.0.0.1',
+        'SMTP_RELAY_PORT': str(smtp_port),
+        'PROVIDER_TIMEOUT': str(DEADLINE),
+        'BREAKER_FAILURE_THRESHOLD': '3',
+        'BREAKER_RESET_TIMEOUT': str(RESET_TIMEOUT),
+    })
+
+    from app import create_app
+    from app.utils.breaker import breaker_states
+    from app.utils.email import send_verification_email_async
+    from app.utils.sms import send_sms_code_async
+
+    standins = subprocess.Popen([sys.executable, 'provider_standins.py',
+                                 '--port', str(port), '--smtp-port', str(smtp_port)])
+
+    def inject(**provider_faults):
+        httpx.post(f'{base_url}/_faults', json=provider_faults)
+
+    async def timed(label, call):
+        started = time.perf_counter()
+        result = await call
+        elapsed = time.perf_counter() - started
+        states = {name: s['state'] for name, s in breaker_states().items()}
+        print(f'  {label:22} result={str(bool(result)):5}  {elapsed * 1000:7.1f}ms  {states}')
+
+    async def scenario():
+        print('Brevo hangs past the deadline:')
+        inject(brevo={'hang': 5.0})
+        for i in range(6):
+            await timed(f'email #{i}', send_verification_email_async('user@example.com', '123456'))
+
+        print(f'Brevo recovers, waiting {RESET_TIMEOUT}s for half-open probe:')
+        inject(brevo={'hang': 0.0})
+        await asyncio.sleep(RESET_TIMEOUT)
+        for i in range(2):
+            await timed(f'email #{i}', send_verification_email_async('user@example.com', '123456'))
+
+        print('Vonage answers 503:')
+        inject(vonage={'fail_rate': 1.0})
+        for i in range(6):
+            await timed(f'sms #{i}', send_sms_code_async('+15550000000', None))
+
+        print(f'Vonage recovers, waiting {RESET_TIMEOUT}s for half-open probe:')
+        inject(vonage={'fail_rate': 0.0})
+        await asyncio.sleep(RESET_TIMEOUT)
+        for i in range(2):
+            await timed(f'sms #{i}', send_sms_code_async('+15550000000', None))
+
+    try:
+        wait_for(f'{base_url}/_stats')
+        app = create_app()
+        with app.app_context():
+            asyncio.run(scenario())
+            print('\nBreakers:', breaker_states())
+        print('Stand-in stats:', httpx.get(f'{base_url}/_stats').json())
+    finally:
+        standins.terminate()
+        standins.wait()
+
+
+if __name__ == '__main__':
+    main()
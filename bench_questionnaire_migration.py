@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Migration 006 (questionnaire_response partitioning) and the jobs built on it, end to end.
+
+On an empty database given by DATABASE_URL (a temporary SQLite file
+otherwise), through the real `flask --app manage` commands:
+
+- upgrades to 005, seeds --rows responses over the last --months months
+  (a few without created_at), and times the upgrade to head
+- checks the result: on PostgreSQL a table partitioned by month with a
+  default partition, every row copied with its id, the id sequence
+  continuing, indexes on the partitions and the users foreign key; on
+  other databases the same indexes on the single table
+- puts a row for a month without a partition into the default partition
+  and runs `flask questionnaire-partitions`, which must move it
+- runs `flask archive-questionnaires` and checks the archived months are
+  gone from the database (their partitions dropped on PostgreSQL)
+- times the downgrade to 005 and checks the plain table and its rows,
+  then upgrades to head again
+
+Exits 1 if a check fails.
+
+    python bench_questionnaire_migration.py
+    DATABASE_URL=postgresql://localhost/migration_check python bench_questionnaire_migration.py --rows 1000000
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+
+BEFORE = '005_auth_event_log'
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def flask(*args):
+    """Run a manage.py command; returns (seconds, output), raising on failure."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'manage', *args],
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"flask {' '.join(args)} failed:\n{result.stdout}{result.stderr}")
+    return time.perf_counter() - started, result.stdout
+
+
+def seed(engine, rows, months):
+    """Users and responses at revision 005, the oldest --months months back; returns their ids."""
+    now = datetime.utcnow()
+    span = timedelta(days=30.44 * months).total_seconds()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (email, password_hash, is_verified, mfa_enabled, created_at) "
+            "VALUES (:email, '-', true, false, :now)"
+        ), [{'email': f'migration{i}@example.com', 'now': now} for i in (1, 2)])
+        user_ids = connection.execute(text("SELECT id FROM users ORDER BY id")).scalars().all()
+        for offset in range(0, rows, 10000):
+            connection.execute(text(
+                "INSERT INTO questionnaire_response (user_id, answers, score, created_at) "
+                "VALUES (:user_id, :answers, 50.0, :created_at)"
+            ), [{'user_id': user_ids[i % 2], 'answers': '{"q1": "b"}',
+                 # Every 1000th row predates created_at being set on insert
+                 'created_at': None if i % 1000 == 999 else now - timedelta(seconds=span * (1 - i / rows))}
+                for i in range(offset, min(rows, offset + 10000))])
+        return set(connection.execute(text("SELECT id FROM questionnaire_response")).scalars())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='questionnaire_response partitioning migration check')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--retention', type=int, default=6, help='Months kept by archive-questionnaires')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmp, 'migration.db')}")
+    os.environ.update({'LOG_LEVEL': 'WARNING', 'AUTH_EVENT_SINK': 'off'})
+    engine = create_engine(os.environ['DATABASE_URL'].replace('postgres://', 'postgresql://', 1))
+    dialect = engine.dialect.name
+    if inspect(engine).get_table_names():
+        sys.exit(f'{engine.url.render_as_string(hide_password=True)} is not empty; give an empty database')
+
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:46} {detail}")
+
+    def scalar(sql, **params):
+        with engine.connect() as connection:
+            return connection.execute(text(sql), params).scalar()
+
+    def relkind():
+        return scalar("SELECT relkind FROM pg_class WHERE oid = CAST('questionnaire_response' AS regclass)")
+
+    def indexes():
+        return {index['name'] for index in inspect(engine).get_indexes('questionnaire_response')}
+
+    try:
+        flask('db', 'upgrade', BEFORE)
+        ids = seed(engine, args.rows, args.months)
+        seconds, _ = flask('db', 'upgrade')
+        print(f'{dialect}: {len(ids):,} responses over {args.months} months; upgrade to head {seconds:.1f}s')
+
+        with engine.connect() as connection:
+            copied = set(connection.execute(text("SELECT id FROM questionnaire_response")).scalars())
+        check('every row kept with its id', copied == ids, f'{len(copied):,} of {len(ids):,} rows')
+        check('created_at filled in', scalar("SELECT count(*) FROM questionnaire_response "
+                                             "WHERE created_at IS NULL") == 0)
+        check('indexes on user/created_at and created_at',
+              {'ix_questionnaire_response_user_created', 'ix_questionnaire_response_created_at'} <= indexes(),
+              ', '.join(sorted(indexes())))
+        if dialect == 'postgresql':
+            today = date.today()
+            oldest = add_months(date(today.year, today.month, 1), -args.months)
+            expected = args.months + 1 + 3  # back to the oldest row, this month and three ahead
+            partitions = scalar("SELECT count(*) FROM pg_inherits "
+                                "WHERE inhparent = CAST('questionnaire_response' AS regclass)")
+            check('partitioned by month, plus a default', relkind() == 'p' and partitions >= expected + 1,
+                  f'relkind {relkind()}, {partitions} partitions from {oldest:%Y-%m}')
+            check('default partition empty', scalar("SELECT count(*) FROM questionnaire_response_default") == 0)
+            oldest_partition = f'questionnaire_response_p{oldest:%Y%m}'
+            check('partitions carry the indexes', scalar(
+                "SELECT count(*) FROM pg_indexes WHERE tablename = :name", name=oldest_partition) >= 3,
+                oldest_partition)
+            check('users foreign key kept', scalar(
+                "SELECT count(*) FROM pg_constraint WHERE contype = 'f' "
+                "AND conrelid = CAST('questionnaire_response' AS regclass)") == 1)
+
+        with engine.begin() as connection:
+            new_id = connection.execute(text(
+                "INSERT INTO questionnaire_response (user_id, answers, score, created_at, rubric_version) "
+                "VALUES ((SELECT min(id) FROM users), '{}', 1.0, :created_at, 'v1') RETURNING id"
+            ), {'created_at': datetime.utcnow()}).scalar()
+        check('ids continue after the copied ones', new_id > max(ids), f'new id {new_id}')
+
+        far = add_months(date.today(), 6)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO questionnaire_response (user_id, answers, score, created_at, rubric_version) "
+                "VALUES ((SELECT min(id) FROM users), '{}', 2.0, :created_at, 'v1')"
+            ), {'created_at': datetime(far.year, far.month, 15)})
+        seconds, output = flask('questionnaire-partitions', '--months-ahead', '6')
+        if dialect == 'postgresql':
+            moved = scalar("SELECT CAST(tableoid AS regclass)::text || ' ' || rubric_version "
+                           "FROM questionnaire_response WHERE score = 2.0")
+            check('questionnaire-partitions moves default rows', moved == f'questionnaire_response_p{far:%Y%m} v1',
+                  f'{seconds:.1f}s, row now in {moved}')
+        else:
+            check('questionnaire-partitions is a no-op', 'nothing to do' in output, output.strip())
+
+        before = scalar("SELECT count(*) FROM questionnaire_response")
+        archive_dir = os.path.join(tmp, 'archive')
+        seconds, output = flask('archive-questionnaires', '--retention-months', str(args.retention),
+                                '--dir', archive_dir)
+        archived = sum(int(line.split(': ')[1].split()[0]) for line in output.splitlines() if ': ' in line)
+        horizon = add_months(date(date.today().year, date.today().month, 1), -args.retention)
+        left_behind = scalar("SELECT count(*) FROM questionnaire_response WHERE created_at < :horizon",
+                             horizon=datetime(horizon.year, horizon.month, 1))
+        after = scalar("SELECT count(*) FROM questionnaire_response")
+        check('archive-questionnaires empties old months',
+              archived > 0 and left_behind == 0 and after == before - archived,
+              f'{archived:,} rows in {len(os.listdir(archive_dir)) // 2} files, {seconds:.1f}s')
+        if dialect == 'postgresql':
+            check('archived partitions dropped', scalar(
+                "SELECT count(*) FROM pg_class WHERE relname = :name",
+                name=f'questionnaire_response_p{add_months(horizon, -1):%Y%m}') == 0)
+
+        seconds, _ = flask('db', 'downgrade', BEFORE)
+        check('downgrade keeps every row', scalar("SELECT count(*) FROM questionnaire_response") == after,
+              f'{after:,} rows, {seconds:.1f}s')
+        check('downgrade restores the user_id index', 'ix_questionnaire_response_user_id' in indexes())
+        if dialect == 'postgresql':
+            check('downgrade leaves a plain table', relkind() == 'r' and scalar(
+                "SELECT count(*) FROM pg_class WHERE relname LIKE 'questionnaire_response_p%'") == 0)
+
+        seconds, _ = flask('db', 'upgrade')
+        check('upgrade again', scalar("SELECT count(*) FROM questionnaire_response") == after, f'{seconds:.1f}s')
+    finally:
+        engine.dispose()
+        shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
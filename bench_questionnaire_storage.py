@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Questionnaire storage benchmark: insert and list latency before and after archival.
+
+Seeds --rows responses spread evenly over the last --months months, times
+single-row inserts and a user's latest responses, archives everything
+older than --retention months, and times them again, plus a list that
+reads the archive files.
+
+Runs on a temporary SQLite file unless DATABASE_URL is set; on
+PostgreSQL run `flask db upgrade` first so the table is partitioned.
+
+    python bench_questionnaire_storage.py --rows 10000000
+    DATABASE_URL=postgresql://... python bench_questionnaire_storage.py --rows 10000000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+    return f'p50={pick(0.5):7.2f}ms  p95={pick(0.95):7.2f}ms  mean={statistics.mean(samples) * 1000:7.2f}ms'
+
+
+def seed(db, rows, users, months, chunk=50000):
+    """Bulk insert through the DBAPI; returns rows per second."""
+    now = datetime.utcnow()
+    span = timedelta(days=30.44 * months).total_seconds()
+    marker = '?' if db.engine.dialect.paramstyle == 'qmark' else '%s'
+    sql = (f'INSERT INTO questionnaire_response (user_id, answers, score, created_at) '
+           f'VALUES ({marker}, {marker}, {marker}, {marker})')
+    # SQLite stores DateTime as text in SQLAlchemy's format
+    stamp = (lambda value: value.strftime('%Y-%m-%d %H:%M:%S.%f')) if marker == '?' else (lambda value: value)
+    answers = json.dumps({'q1': 'b', 'q2': 3, 'q3': ['x', 'y'], 'q4': 'monthly'})
+    started = time.perf_counter()
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for offset in range(0, rows, chunk):
+            count = min(chunk, rows - offset)
+            cursor.executemany(sql, [
+                (random.randint(1, users), answers, 50.0,
+                 stamp(now - timedelta(seconds=span * (1 - (offset + i) / rows))))
+                for i in range(count)
+            ])
+            connection.commit()
+            print(f'\r  seeded {offset + count:,}/{rows:,}', end='', flush=True)
+    finally:
+        connection.close()
+    print()
+    return rows / (time.perf_counter() - started)
+
+
+def measure(db, QuestionnaireResponse, list_responses, users, samples):
+    inserts, lists = [], []
+    for _ in range(samples):
+        started = time.perf_counter()
+        db.session.add(QuestionnaireResponse(user_id=random.randint(1, users), answers={'q1': 'a'}, score=1.0))
+        db.session.commit()
+        inserts.append(time.perf_counter() - started)
+    for _ in range(samples):
+        started = time.perf_counter()
+        list_responses(random.randint(1, users), limit=20)
+        db.session.rollback()
+        lists.append(time.perf_counter() - started)
+    print(f'  insert one response      {percentiles(inserts)}')
+    print(f'  latest 20 for a user     {percentiles(lists)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Questionnaire partitioning/archival benchmark')
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--retention', type=int, default=12)
+    parser.add_argument('--samples', type=int, default=300)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmp, 'questionnaire.db')}")
+    os.environ['QUESTIONNAIRE_ARCHIVE_DIR'] = os.path.join(tmp, 'archive')
+
+    from app import create_app
+    from app.models import db, User, QuestionnaireResponse
+    from app.utils.questionnaire_storage import archive_old_months, list_responses, partitions, ensure_partitions
+
+    app = create_app()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            ensure_partitions()
+            print(f'PostgreSQL, {len(partitions())} monthly partitions')
+        else:
+            db.create_all()
+            print(f'{dialect}: single table, no partitions')
+        db.session.execute(db.insert(User), [
+            {'id': i, 'email': f'q{i}@example.com', 'password_hash': '-', 'is_verified': True,
+             'mfa_enabled': False, 'created_at': datetime.utcnow()} for i in range(1, args.users + 1)
+        ])
+        db.session.commit()
+
+        print(f'Seeding {args.rows:,} responses over {args.months} months for {args.users:,} users')
+        rate = seed(db, args.rows, args.users, args.months)
+        print(f'  {rate:,.0f} rows/s')
+        if dialect == 'postgresql':
+            db.session.execute(db.text('ANALYZE questionnaire_response'))
+            db.session.commit()
+
+        print(f'\n{args.rows:,} rows in the database:')
+        measure(db, QuestionnaireResponse, list_responses, args.users, args.samples)
+
+        started = time.perf_counter()
+        archived = archive_old_months(args.retention)
+        seconds = time.perf_counter() - started
+        moved = sum(archived.values())
+        directory = app.config['QUESTIONNAIRE_ARCHIVE_DIR']
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f'\nArchived {moved:,} rows in {len(archived)} months in {seconds:.1f}s '
+              f'({moved / seconds:,.0f} rows/s), {size / 1e6:.1f}MB compressed ({size / max(moved, 1):.1f} B/row)')
+
+        remaining = db.session.scalar(db.select(db.func.count()).select_from(QuestionnaireResponse))
+        print(f'\n{remaining:,} rows left in the database:')
+        measure(db, QuestionnaireResponse, list_responses, args.users, args.samples)
+
+        reads = []
+        for _ in range(5):
+            user_id = random.randint(1, args.users)
+            started = time.perf_counter()
+            found = list_responses(user_id, include_archived=True)
+            reads.append(time.perf_counter() - started)
+        print(f'  all history incl. archive {percentiles(reads)}  ({len(found)} responses for the last user)')
+
+    shutil.rmtree(tmp)
+    sys.exit(0 if moved else 1)
+
+
+if __name__ == '__main__':
+    main()
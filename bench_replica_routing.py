@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Read-replica routing walkthrough with two local SQLite databases.
+
+The "replica" is a copy of the primary taken after seeding, so a read
+that lands on it after a write returns the old value. Each step prints
+which database served the statements and exits 1 if routing differs
+from what is expected.
+
+    python bench_replica_routing.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+WINDOW = 0.5
+CHECK_INTERVAL = 0.2
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    primary_path, replica_path = os.path.join(tmp, 'primary.db'), os.path.join(tmp, 'replica.db')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{primary_path}',
+        'SQLALCHEMY_REPLICA_URIS': f'sqlite:///{replica_path}',
+        'REPLICA_READ_YOUR_WRITES': str(WINDOW),
+        'REPLICA_CHECK_INTERVAL': str(CHECK_INTERVAL),
+        'REPLICA_MAX_LAG': '2',
+    })
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User
+    from app.utils import replicas
+
+    app = create_app()
+    served = []
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='replica@example.com', is_verified=True, phone='+15550000000',
+                            password_hash=generate_password_hash('replica-pw', method='pbkdf2:sha256:1000')))
+        db.session.commit()
+        shutil.copy(primary_path, replica_path)
+
+        for name, engine in db.engines.items():
+            label = 'replica' if name else 'primary'
+            event.listen(engine, 'before_cursor_execute',
+                         lambda *args, label=label: served.append(label))
+
+    failures = []
+
+    def step(label, expected, func, app_context=True):
+        served.clear()
+        if app_context:
+            with app.app_context():
+                result = func()
+        else:
+            result = func()  # test client requests push their own context
+        where = sorted(set(served))
+        ok = where == [expected]
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:48} -> {','.join(where) or '-':16} {result}")
+
+    def phone():
+        return db.session.scalar(db.select(User.phone).filter_by(email='replica@example.com'))
+
+    def update_phone():
+        user = db.session.scalar(db.select(User).filter_by(email='replica@example.com').with_for_update())
+        user.phone = '+15559999999'
+        db.session.commit()
+        return 'committed'
+
+    step('plain read', 'replica', phone)
+    step('SELECT ... FOR UPDATE, write, commit', 'primary', update_phone)
+    time.sleep(WINDOW + 0.1)
+    step('read after the window (stale replica copy)', 'replica', phone)
+
+    def read_your_writes():
+        user = db.session.scalar(db.select(User).filter_by(email='replica@example.com'))
+        user.phone = '+15551111111'
+        db.session.commit()
+        return phone()
+
+    time.sleep(WINDOW + 0.1)
+    served.clear()
+    with app.app_context():
+        read_your_writes()
+    where = sorted(set(served))
+    print(f"{'ok  ' if where == ['primary', 'replica'] else 'FAIL'} {'read, write, then read in one session':48} "
+          f"-> {','.join(where):16} first read on the replica, the rest on the primary")
+    if where != ['primary', 'replica']:
+        failures.append('read your writes')
+
+    time.sleep(WINDOW + 0.1)
+    replicas.LAG_PROBES['sqlite'] = lambda connection: 30.0
+    time.sleep(CHECK_INTERVAL + 0.1)
+    step('read while replica lags 30s', 'primary', phone)
+    replicas.LAG_PROBES['sqlite'] = lambda connection: 0.0
+    time.sleep(CHECK_INTERVAL + 0.1)
+    step('read once lag recovers', 'replica', phone)
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'replica@example.com', 'password': 'replica-pw'})
+    time.sleep(WINDOW + 0.1)
+    client.post('/disable-mfa')  # writes; the session cookie carries the write time
+    step('next request within the window (via cookie)', 'primary',
+         lambda: client.get('/dashboard').status_code, app_context=False)
+    time.sleep(WINDOW + 0.1)
+    step('next request after the window', 'replica',
+         lambda: client.get('/dashboard').status_code, app_context=False)
+
+    print('\nReplica lag cache:', replicas.replica_health.snapshot())
+    shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
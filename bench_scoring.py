@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Questionnaire scoring throughput.
+
+Seeds --rows responses with answers drawn from the rubric (some
+malformed), checks the compiled NumPy scorer against a plain per-answer
+implementation of the same rubric, then reports responses/sec for:
+
+- scoring in memory, per row in Python vs. vectorized
+- one submission inline (score_answers) and POST /api/questionnaire
+- re-scoring the table row by row through the ORM (the old way, on
+  --baseline-rows) vs. rescore_responses()
+
+Exits 1 if a check fails.
+
+    python bench_scoring.py --rows 200000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def reference_score(rubric, answers):
+    """Straightforward per-question scoring, used as the correctness oracle and the slow baseline."""
+    earned = possible = 0.0
+    for question in rubric['questions']:
+        value = answers.get(question['id']) if isinstance(answers, dict) else None
+        kind = question['type']
+        if kind == 'number':
+            possible += question['weight']
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                scaled = (min(max(value, question['min']), question['max']) - question['min']) / \
+                         (question['max'] - question['min'])
+                earned += question['weight'] * (1 - scaled if question.get('invert') else scaled)
+        elif kind == 'boolean':
+            possible += question['weight']
+            earned += question['weight'] if value in (True, 'yes', 'true') else 0
+        elif kind == 'choice':
+            possible += max(question['points'].values())
+            earned += question['points'].get(value, 0) if isinstance(value, str) else 0
+        else:
+            cap = question.get('cap', sum(p for p in question['points'].values() if p > 0))
+            possible += cap
+            if isinstance(value, list):
+                earned += min(cap, sum(question['points'].get(v, 0) for v in set(value) if isinstance(v, str)))
+    return round(earned * 100 / possible, 2)
+
+
+def random_answers(rubric):
+    answers = {}
+    for question in rubric['questions']:
+        roll = random.random()
+        if roll < 0.03:
+            continue  # unanswered
+        if roll < 0.05:
+            answers[question['id']] = random.choice(['n/a', None, [1], {'x': 1}, True, 'maybe'])
+            continue
+        kind = question['type']
+        if kind == 'number':
+            span = question['max'] - question['min']
+            answers[question['id']] = round(random.uniform(question['min'] - span / 4, question['max'] + span / 4), 1)
+        elif kind == 'boolean':
+            answers[question['id']] = random.choice([True, False, 'yes', 'no'])
+        elif kind == 'choice':
+            answers[question['id']] = random.choice(list(question['points']))
+        else:
+            answers[question['id']] = random.sample(list(question['points']) + ['other'], random.randint(0, 4))
+    answers['notes'] = 'Seasonal business; cash flow tight in Q1.'
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Questionnaire scoring benchmark')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--baseline-rows', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'scoring.db')}", 'AUTH_EVENT_SINK': 'off',
+                       'JWT_SECRET_KEY': 'bench-scoring-signing-key-with-at-least-32-bytes'})
+
+    from app import create_app
+    from app.models import db, User, QuestionnaireResponse
+    from app.utils.scoring import get_rubric, load_rubric, rescore_responses, score_answers
+    from flask_jwt_extended import create_access_token
+
+    app = create_app()
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:48} {detail}")
+
+    with app.app_context():
+        version = app.config['QUESTIONNAIRE_RUBRIC']
+        rubric, compiled = load_rubric(version), get_rubric()
+        answers = [random_answers(rubric) for _ in range(args.rows)]
+
+        print(f'rubric {version}: {len(rubric["questions"])} questions, {compiled.columns} feature columns\n')
+        started = time.perf_counter()
+        expected = [reference_score(rubric, a) for a in answers]
+        per_row = args.rows / (time.perf_counter() - started)
+        started = time.perf_counter()
+        vectorized = compiled.score(answers)
+        batch = args.rows / (time.perf_counter() - started)
+        # Summation order differs, so the last rounded digit may too
+        worst = max(abs(a - b) for a, b in zip(expected, vectorized.tolist()))
+        check('vectorized matches per-row scoring', worst <= 0.01 + 1e-9, f'max difference {worst:.4f}')
+        print(f'     in memory: per row {per_row:10,.0f}/s   vectorized {batch:10,.0f}/s  ({batch / per_row:.1f}x)')
+
+        started = time.perf_counter()
+        for a in answers[:2000]:
+            score_answers(a)
+        print(f'     inline score_answers: {(time.perf_counter() - started) / 2000 * 1e6:.0f}us per submission')
+
+        db.create_all()
+        db.session.add(User(id=1, email='scoring@example.com', password_hash='-', is_verified=True))
+        now = datetime.utcnow()
+        for start in range(0, args.rows, 50000):
+            db.session.execute(db.insert(QuestionnaireResponse), [
+                {'user_id': 1, 'answers': a, 'score': 100.0, 'created_at': now - timedelta(minutes=start + i)}
+                for i, a in enumerate(answers[start:start + 50000])
+            ])
+        db.session.commit()
+        token = create_access_token(identity='1')
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    started = time.perf_counter()
+    for a in answers[:500]:
+        response = client.post('/api/questionnaire', headers=headers, json={**a, 'score': 100})
+    body = response.get_json()
+    print(f'     POST /api/questionnaire: {500 / (time.perf_counter() - started):,.0f} submissions/s')
+    check('client-sent score is ignored', response.status_code == 201 and body['rubric_version'] == version
+          and abs(body['score'] - expected[499]) <= 0.01, str(body))
+
+    with app.app_context():
+        # The old way: load ORM objects one by one, one UPDATE each, committed every 1000
+        started = time.perf_counter()
+        query = QuestionnaireResponse.query.order_by(QuestionnaireResponse.id).limit(args.baseline_rows)
+        for n, qr in enumerate(query.all(), 1):
+            qr.score = reference_score(rubric, qr.answers)
+            qr.rubric_version = version
+            if n % 1000 == 0:
+                db.session.commit()
+        db.session.commit()
+        baseline = args.baseline_rows / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        counts = rescore_responses(chunk_size=args.chunk_size)
+        seconds = time.perf_counter() - started
+        print(f'     re-score table: ORM row by row {baseline:8,.0f}/s   rescore_responses '
+              f"{counts['scanned'] / seconds:8,.0f}/s  ({counts['scanned'] / seconds / baseline:.0f}x, "
+              f"{counts['scanned']:,} rows in {seconds:.1f}s)")
+        check('only stale rows re-scored', counts['scanned'] == args.rows - args.baseline_rows,
+              f"{counts['scanned']} scanned, {counts['changed']} changed")
+
+        stored = dict(db.session.execute(db.select(QuestionnaireResponse.id, QuestionnaireResponse.score)
+                                         .where(QuestionnaireResponse.id <= args.rows)).all())
+        wrong = sum(abs(stored[i + 1] - expected[i]) > 0.01 + 1e-9 for i in range(args.rows))
+        stale = db.session.scalar(db.select(db.func.count()).where(
+            db.or_(QuestionnaireResponse.rubric_version.is_(None), QuestionnaireResponse.rubric_version != version)))
+        check('stored scores match the rubric', wrong == 0 and stale == 0, f'{wrong} wrong, {stale} unscored')
+        check('second run has nothing to do', rescore_responses()['scanned'] == 0)
+
+    shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+SMS challenge coalescing against the Vonage stand-in.
+
+A burst of --clicks simultaneous "resend code" requests for one user is
+sent twice: straight to send_sms_code_async (what every request did
+before), then through /request-sms-code, where they share one challenge.
+A follow-up burst checks that a still-valid challenge is reused, and the
+last step cancels --abandoned unanswered challenges in one batch.
+
+The stand-in refuses a second open verification to a number (Vonage
+status 10), as the real API does. Exits 1 if any step misbehaves.
+
+    python bench_sms_coalescing.py --clicks 8 --abandoned 50
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import httpx
+
+from bench_async_logins import free_port, wait_for
+
+DELAY = 0.3
+
+
+def stand_in_stats(port):
+    return httpx.get(f'http://127.0.0.1:{port}/_stats').json()
+
+
+def burst(app, email, clicks):
+    """``clicks`` simultaneous POST /request-sms-code for ``email``; returns flashed categories."""
+    barrier = threading.Barrier(clicks)
+    outcomes = []
+
+    def click():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/request-sms-code', data={'email': email})
+        outcomes.append('already sent' if b'already sent' in response.data
+                        else 'sent' if b'SMS code sent' in response.data else 'failed')
+
+    threads = [threading.Thread(target=click) for _ in range(clicks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SMS challenge coalescing benchmark')
+    parser.add_argument('--clicks', type=int, default=8)
+    parser.add_argument('--abandoned', type=int, default=50)
+    args = parser.parse_args()
+
+    port = free_port()
+    os.environ.update({'DATABASE_URL': 'sqlite:///:memory:', 'SMS_PROVIDERS': 'vonage'})
+    standin = subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(port),
+                                '--delay', str(DELAY)], stdout=subprocess.DEVNULL)
+    failures = []
+
+    def check(label, ok, detail):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:44} {detail}")
+
+    try:
+        wait_for(f'http://127.0.0.1:{port}/_stats')
+        from sqlalchemy.pool import StaticPool
+        from werkzeug.security import generate_password_hash
+        from app import create_app
+        from app.models import db, User
+        from app.utils.sms import send_sms_code_async
+        from app.utils.sms_challenges import cancel_abandoned_challenges
+
+        app = create_app()
+        app.config.update(
+            VONAGE_API_URL=f'http://127.0.0.1:{port}',
+            VONAGE_API_KEY='bench',
+            VONAGE_API_SECRET='bench',
+            BREAKER_FAILURE_THRESHOLD=1000,  # status 10 rejections should not open the breaker
+            SQLALCHEMY_ENGINE_OPTIONS={'poolclass': StaticPool,
+                                       'connect_args': {'check_same_thread': False}},
+        )
+        password_hash = generate_password_hash('bench', method='pbkdf2:sha256:1000')
+        with app.app_context():
+            db.create_all()
+            db.session.add_all(User(email=f'user{i}@example.com', password_hash=password_hash,
+                                    is_verified=True, mfa_enabled=True, phone=f'+1555{i:07d}')
+                               for i in range(args.abandoned + 1))
+            db.session.commit()
+
+        # Before: every click starts its own verification
+        before = stand_in_stats(port)
+
+        async def uncoalesced():
+            return await asyncio.gather(*(send_sms_code_async('+15559999999', None) for _ in range(args.clicks)))
+
+        with app.app_context():
+            sent = asyncio.run(uncoalesced())
+        after = stand_in_stats(port)
+        check(f'uncoalesced: {args.clicks} clicks', True,
+              f"{after['vonage_started'] - before['vonage_started']} started, "
+              f"{after['vonage_concurrent'] - before['vonage_concurrent']} refused as concurrent, "
+              f"{sum(1 for s in sent if s)} challenge ids")
+
+        # After: the burst shares one in-flight challenge
+        before = stand_in_stats(port)
+        outcomes = burst(app, 'user0@example.com', args.clicks)
+        after = stand_in_stats(port)
+        started = after['vonage_started'] - before['vonage_started']
+        refused = after['vonage_concurrent'] - before['vonage_concurrent']
+        check(f'coalesced: {args.clicks} clicks', started == 1 and refused == 0 and 'failed' not in outcomes,
+              f'{started} started, {refused} refused, responses {dict((o, outcomes.count(o)) for o in set(outcomes))}')
+
+        before = stand_in_stats(port)
+        outcomes = burst(app, 'user0@example.com', args.clicks)
+        started = stand_in_stats(port)['vonage_started'] - before['vonage_started']
+        check('retry while the code is still valid', started == 0 and set(outcomes) == {'already sent'},
+              f'{started} started')
+
+        # Abandoned challenges: start them, age them, cancel in one batch
+        for i in range(1, args.abandoned + 1):
+            app.test_client().post('/request-sms-code', data={'email': f'user{i}@example.com'})
+        before = stand_in_stats(port)
+        with app.app_context():
+            db.session.execute(db.update(User).values(
+                sms_challenge_sent_at=datetime.utcnow() - timedelta(seconds=app.config['SMS_CHALLENGE_ABANDON_AFTER'] + 1)
+            ))
+            db.session.commit()
+            counts = cancel_abandoned_challenges()
+            remaining = db.session.scalar(db.select(db.func.count()).where(User.vonage_request_id.is_not(None)))
+        cancelled = stand_in_stats(port)['vonage_cancelled'] - before['vonage_cancelled']
+        check(f'batch cancel of {args.abandoned + 1} abandoned', cancelled == args.abandoned + 1 and remaining == 0,
+              f"{counts}, stand-in cancelled {cancelled}")
+
+        outcomes = burst(app, 'user1@example.com', 1)
+        check('new code after cancel', outcomes == ['sent'], f"{outcomes}")
+    finally:
+        standin.terminate()
+        standin.wait()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
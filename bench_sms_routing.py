@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+SMS routing benchmark against fake providers with different latency profiles.
+
+Three stand-ins are started:
+  vonage   Vonage Verify, fast to +44, slow to +1
+  fastsms  HTTP gateway, fast to +1, slow to +44
+  flaky    HTTP gateway, medium everywhere, 30% of sends fail
+
+US and UK challenges are sent through Vonage alone and through the
+router, then every challenge is verified against its issuing provider.
+
+    python bench_sms_routing.py --sends 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from bench_async_logins import free_port, wait_for
+from provider_standins import STANDIN_CODE
+
+PROFILES = {
+    'vonage': ['--country-delay', '1=0.40,44=0.05'],
+    'fastsms': ['--country-delay', '1=0.05,44=0.50'],
+    'flaky': ['--delay', '0.15', '--fail-rate', '0.3'],
+}
+NUMBERS = {'US': '+1555{:07d}', 'UK': '+447700{:06d}'}
+
+
+def build_app(ports, providers):
+    from app import create_app
+
+    app = create_app()
+    app.config.update(
+        VONAGE_API_URL=f"http://127.0.0.1:{ports['vonage']}",
+        VONAGE_API_KEY='bench',
+        VONAGE_API_SECRET='bench',
+        SMS_PROVIDERS=providers,
+        SMS_HTTP_PROVIDERS=','.join(f'{name}=http://127.0.0.1:{ports[name]}/sms/send'
+                                    for name in ('fastsms', 'flaky')),
+        BREAKER_FAILURE_THRESHOLD=1000,  # measure routing, not breakers
+    )
+    return app
+
+
+async def run(ports, sends):
+    from app.utils.sms import send_sms_code_async, verify_sms_code_async
+    from app.utils.sms_providers import get_router
+
+    results = []
+    for i in range(sends):
+        country = 'US' if i % 2 == 0 else 'UK'
+        phone = NUMBERS[country].format(i)
+        started = time.perf_counter()
+        challenge_id = await send_sms_code_async(phone, None)
+        results.append((country, phone, challenge_id, time.perf_counter() - started))
+
+    verified = 0
+    async with httpx.AsyncClient() as client:
+        codes = {}
+        for name in ('fastsms', 'flaky'):
+            codes.update((await client.get(f"http://127.0.0.1:{ports[name]}/_sms_codes")).json())
+    for _, phone, challenge_id, _ in results:
+        if challenge_id:
+            code = STANDIN_CODE if challenge_id.startswith('vonage:') else codes[phone]
+            verified += await verify_sms_code_async(challenge_id, code)
+    return results, verified, get_router().snapshot()
+
+
+def report(label, results, verified):
+    print(f'\n{label}')
+    for country in NUMBERS:
+        rows = [r for r in results if r[0] == country]
+        latencies = sorted(r[3] for r in rows)
+        chosen = Counter(r[2].split(':')[0] if r[2] else 'failed' for r in rows)
+        print(f'  {country}: mean={statistics.mean(latencies) * 1000:6.1f}ms  '
+              f'p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:6.1f}ms  providers={dict(chosen)}')
+    print(f'  verified {verified}/{sum(1 for r in results if r[2])} issued challenges')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SMS routing benchmark')
+    parser.add_argument('--sends', type=int, default=200)
+    parser.add_argument('--providers', default='vonage,fastsms,flaky')
+    parser.add_argument('--baseline', default='vonage',
+                        help='provider list to compare against (default: Vonage only)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    ports = {name: free_port() for name in PROFILES}
+    standins = [subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(ports[name]), *profile],
+                                 stdout=subprocess.DEVNULL)
+                for name, profile in PROFILES.items()]
+    try:
+        for port in ports.values():
+            wait_for(f'http://127.0.0.1:{port}/_stats')
+        for label, providers in (('baseline: ' + args.baseline, args.baseline),
+                                 ('router: ' + args.providers, args.providers)):
+            app = build_app(ports, providers)
+            with app.app_context():
+                results, verified, snapshot = asyncio.run(run(ports, args.sends))
+            report(label, results, verified)
+        print('\nRouter window:', snapshot)
+    finally:
+        for standin in standins:
+            standin.terminate()
+            standin.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Concurrent signups and logins on SQLite: SQLITE_PROFILE=default vs wal.
+
+The same mixed workload runs against a fresh SQLite file per profile:
+
+- signups: a new users row plus its auth event
+- MFA logins: password check, SMS challenge stored, then cleared after
+  the code is accepted (two users-row updates through update_user)
+- plain logins: password check for a verified user without MFA (reads)
+
+Two layers:
+
+- HTTP: gunicorn --workers x --threads (gthread) serving the real views,
+  driven by --clients concurrent clients, provider calls to the
+  stand-ins. On a small machine the clients, stand-ins and Flask share
+  the CPU, so this mostly shows errors and latency spread
+- database: --processes x --threads running the views' statements with
+  no HTTP around them, which is where the profiles differ
+
+Auth events stay on the 'db' sink, so their batch writer competes for
+the database as it does in production. Password hashes are cheap to keep
+PBKDF2 out of the measurement. --db-dir puts the files on the volume to
+be measured (fsync cost differs a lot between disks). Exits 1 if wal
+fails operations, logs "database is locked", is slower than default at
+the database layer or clearly slower over HTTP.
+
+    python bench_sqlite.py --workers 2 --threads 8 --clients 32 --ops 600 --processes 3
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+
+from bench_async_logins import free_port, seed_users, wait_for, PASSWORD
+from provider_standins import STANDIN_CODE
+
+MFA_USERS = 200
+KINDS = ('signup', 'mfa login', 'login')
+
+
+def create_bench_app():
+    """gunicorn entry point: the app with a cheap password hash for new accounts."""
+    from werkzeug.security import generate_password_hash
+    import app.models
+    from app import create_app
+
+    app.models.generate_password_hash = partial(generate_password_hash, method='pbkdf2:sha256:1000')
+    return create_app()
+
+
+def seed():
+    seed_users(MFA_USERS)
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User
+    with create_app().app_context():
+        db.session.add(User(email='plain@example.com', is_verified=True,
+                            password_hash=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')))
+        db.session.commit()
+
+
+def http_operation(transport, base_url, i):
+    """One workload step with its own cookies; returns (kind, ok, seconds)."""
+    # Not closed: closing a client would close the shared transport
+    client = httpx.Client(transport=transport, base_url=base_url, timeout=60)
+    started = time.perf_counter()
+    kind = KINDS[i % 3]
+    if kind == 'signup':
+        form = {'email': f'new{i}@example.com', 'password': PASSWORD, 'password_confirm': PASSWORD}
+        ok = client.post('/signup', data=form).status_code == 302
+    elif kind == 'mfa login':
+        form = {'email': f'bench{i % MFA_USERS}@example.com', 'password': PASSWORD}
+        first = client.post('/login', data=form)
+        second = client.post('/login', data={**form, 'sms_code': STANDIN_CODE})
+        ok = first.status_code == 200 and second.status_code == 302
+    else:
+        form = {'email': 'plain@example.com', 'password': PASSWORD}
+        ok = client.post('/login', data=form).status_code == 302
+    return kind, ok, time.perf_counter() - started
+
+
+def run_http(args, workdir):
+    port = free_port()
+    log_path = os.path.join(workdir, 'server.log')
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(args.workers),
+                                   '--threads', str(args.threads), '--timeout', '120',
+                                   '--bind', f'127.0.0.1:{port}', 'bench_sqlite:create_bench_app()'],
+                                  env=dict(os.environ, WARMUP_ENABLED='0'), stdout=log, stderr=subprocess.STDOUT)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_for(f'{base_url}/health')
+        # One connection pool for all clients, so the client side stays cheap
+        transport = httpx.HTTPTransport(limits=httpx.Limits(max_connections=args.clients))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            results = list(pool.map(lambda i: http_operation(transport, base_url, i), range(args.ops)))
+        elapsed = time.perf_counter() - started
+        transport.close()
+    finally:
+        server.terminate()
+        server.wait()
+    with open(log_path) as log:
+        locked = log.read().count('database is locked')
+    return summarize(results, elapsed, locked)
+
+
+def db_worker(args):
+    """--db-worker: --threads threads of the views' statements, from --start-at; prints JSON."""
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User
+    from app.utils.auth_events import emit, get_auth_event_log
+    from app.utils.sms_challenges import clear_answered_challenge, store_sms_challenge
+
+    app = create_app()
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    results, locked = [], []
+
+    def operation(i):
+        started = time.perf_counter()
+        kind = KINDS[i % 3]
+        try:
+            if kind == 'signup':
+                user = User(email=f'db{os.getpid()}-{i}@example.com', password_hash=password_hash,
+                            verification_code='123456')
+                db.session.add(user)
+                db.session.commit()
+                emit('signup', user.id, user.email)
+            elif kind == 'mfa login':
+                user = User.query.filter_by(email=f'bench{i % MFA_USERS}@example.com').first()
+                user.check_password(PASSWORD)
+                challenge = f'db-{os.getpid()}-{i}'
+                store_sms_challenge(user, challenge, user.phone, user.vonage_request_id)
+                user = User.query.filter_by(email=user.email).first()
+                user.check_password(PASSWORD)
+                clear_answered_challenge(user, challenge)
+                emit('login', user.id, user.email, mfa='sms')
+            else:
+                user = User.query.filter_by(email='plain@example.com').first()
+                user.check_password(PASSWORD)
+                emit('login', user.id, user.email)
+            ok = True
+        except Exception as e:
+            db.session.rollback()
+            locked.extend(['database is locked'] if 'database is locked' in str(e) else [])
+            ok = False
+        finally:
+            db.session.remove()
+        results.append((kind, ok, time.perf_counter() - started))
+
+    def thread(offset):
+        with app.app_context():
+            for i in range(offset, args.ops, args.threads):
+                operation(i)
+
+    time.sleep(max(0.0, args.start_at - time.time()))
+    started = time.perf_counter()
+    threads = [threading.Thread(target=thread, args=(offset,)) for offset in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    get_auth_event_log().stop()
+    print(json.dumps({'elapsed': elapsed, 'locked': len(locked), 'results': results}))
+
+
+def run_db(args):
+    start_at = time.time() + 3  # every process imported and connected before the clock starts
+    workers = [subprocess.Popen([sys.executable, __file__, '--db-worker', '--start-at', str(start_at),
+                                 '--threads', str(args.threads), '--ops', str(args.ops // args.processes)],
+                                env=dict(os.environ, LOG_LEVEL='ERROR'),  # app logs share stdout with the result
+                                stdout=subprocess.PIPE, text=True)
+               for _ in range(args.processes)]
+    outputs = [json.loads(worker.communicate()[0].strip().splitlines()[-1]) for worker in workers]
+    return summarize([tuple(r) for out in outputs for r in out['results']],
+                     max(out['elapsed'] for out in outputs), sum(out['locked'] for out in outputs))
+
+
+def summarize(results, elapsed, locked):
+    summary = {'elapsed': elapsed, 'locked': locked, 'failed': sum(not ok for _, ok, _ in results)}
+    for kind in KINDS:
+        latencies = sorted(seconds for k, ok, seconds in results if k == kind and ok)
+        summary[kind] = {
+            'ok': len(latencies),
+            'p50': statistics.median(latencies) * 1000 if latencies else float('nan'),
+            'p95': latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000 if latencies else float('nan'),
+        }
+    summary['ops/s'] = sum(summary[kind]['ok'] for kind in KINDS) / elapsed
+    return summary
+
+
+def report(title, default, wal):
+    print(f"\n{title:24} {'default':>18} {'wal':>18}")
+    print(f"{'ops/s':24} {default['ops/s']:18.1f} {wal['ops/s']:18.1f}")
+    print(f"{'failed operations':24} {default['failed']:18} {wal['failed']:18}")
+    print(f"{'database is locked':24} {default['locked']:18} {wal['locked']:18}")
+    for kind in KINDS:
+        cells = [f"{r[kind]['p50']:6.0f} / {r[kind]['p95']:6.0f}ms" for r in (default, wal)]
+        print(f"{kind + ' p50 / p95':24} {cells[0]:>18} {cells[1]:>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite profile benchmark')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (HTTP layer).')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker or DB process.')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent HTTP clients.')
+    parser.add_argument('--ops', type=int, default=600, help='Operations per layer, split evenly between kinds.')
+    parser.add_argument('--processes', type=int, default=3, help='Processes at the database layer.')
+    parser.add_argument('--db-dir', default=None, help='Directory for the SQLite files (default: a temp dir).')
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed:
+        return seed()
+    if args.db_worker:
+        return db_worker(args)
+
+    standin_port = free_port()
+    os.environ.update({
+        'BREVO_API_URL': f'http://127.0.0.1:{standin_port}/v3',
+        'VONAGE_API_URL': f'http://127.0.0.1:{standin_port}',
+        'VONAGE_API_KEY': 'bench',
+        'VONAGE_API_SECRET': 'bench',
+        'EMAIL_DELIVERABILITY': 'local',
+        'AUTH_EVENT_SINK': 'db',
+    })
+    standins = subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(standin_port)])
+    results = {}
+    try:
+        wait_for(f'http://127.0.0.1:{standin_port}/')
+        print(f'{args.ops} operations per layer: HTTP from {args.clients} clients to gunicorn '
+              f'{args.workers} workers x {args.threads} threads; database {args.processes} processes x '
+              f'{args.threads} threads')
+        for profile in ('default', 'wal'):
+            for layer, run in (('http', run_http), ('db', run_db)):
+                workdir = tempfile.mkdtemp(prefix=f'bench-sqlite-{profile}-', dir=args.db_dir)
+                os.environ.update({'DATABASE_URL': f'sqlite:///{workdir}/bench.db', 'SQLITE_PROFILE': profile})
+                # Config is read at import, so each database is seeded by a fresh interpreter
+                subprocess.run([sys.executable, __file__, '--seed'], check=True, stdout=subprocess.DEVNULL)
+                try:
+                    results[profile, layer] = run(args, workdir) if layer == 'http' else run(args)
+                finally:
+                    shutil.rmtree(workdir)
+    finally:
+        standins.terminate()
+        standins.wait()
+
+    report('HTTP', results['default', 'http'], results['wal', 'http'])
+    report('database', results['default', 'db'], results['wal', 'db'])
+    wal_http, wal_db = results['wal', 'http'], results['wal', 'db']
+    ok = (not wal_http['failed'] and not wal_db['failed'] and not wal_http['locked'] and not wal_db['locked']
+          and wal_db['ops/s'] >= results['default', 'db']['ops/s']
+          and wal_http['ops/s'] >= 0.8 * results['default', 'http']['ops/s'])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Request tracing against the OTLP collector in provider_standins.py.
+
+First, one traced signup (Brevo failing, so mail goes out through the
+SMTP relay) and one traced two-step SMS login. The spans the collector
+receives are checked:
+
+- the request, its SQL, PBKDF2 and provider spans share one trace
+  and nest under the request span
+- provider requests carry the traceparent
+- the domain lookup on the DNS executor and the queued auth event
+  writes keep the request's trace
+- an incoming traceparent is continued, and one marked unsampled is
+  left alone
+
+Then --logins password logins are timed with tracing off, at the default
+TRACE_SAMPLE_RATE, with every request traced, and with every request
+sent a sampled traceparent but capped by TRACE_MAX_PER_SECOND. Exits 1
+if a check fails, if the default rate costs more than --max-overhead,
+or if the cap lets more traces through than it allows.
+
+    python bench_tracing.py --logins 400
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_async_logins import PASSWORD, free_port, wait_for
+from provider_standins import STANDIN_CODE
+
+MODES = {
+    'off': {'TRACE_EXPORTER': 'off'},
+    'default rate': {'TRACE_EXPORTER': 'otlp'},
+    'every request': {'TRACE_EXPORTER': 'otlp', 'TRACE_SAMPLE_RATE': '1', 'TRACE_MAX_PER_SECOND': '1000000'},
+    'forced, capped': {'TRACE_EXPORTER': 'otlp', 'TRACE_SAMPLE_RATE': '0', 'TRACE_MAX_PER_SECOND': '20',
+                       'BENCH_FORCE_TRACEPARENT': '1'},
+}
+
+
+def sampled_traceparent():
+    return f'00-{random.getrandbits(128):032x}-{random.getrandbits(64):016x}-01'
+
+
+def timed_logins(logins):
+    """Worker: time password logins under the TRACE_* settings in the environment; prints JSON."""
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User
+    from app.utils.tracing import get_tracer
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='trace@example.com', is_verified=True,
+                            password_hash=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')))
+        db.session.commit()
+    force = os.environ.get('BENCH_FORCE_TRACEPARENT') == '1'
+    form = {'email': 'trace@example.com', 'password': PASSWORD}
+    samples = []
+    started = time.perf_counter()
+    for i in range(logins + 20):
+        headers = {'traceparent': sampled_traceparent()} if force else {}
+        begin = time.perf_counter()
+        response = app.test_client().post('/login', data=form, headers=headers)
+        if response.status_code != 302:
+            raise SystemExit(f'login answered {response.status_code}')
+        if i >= 20:  # first ones warm up the pool and templates
+            samples.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+    get_tracer().flush()
+    print(json.dumps({'p50': statistics.median(samples) * 1000, 'mean': statistics.fmean(samples) * 1000,
+                      'elapsed': elapsed, 'stats': get_tracer().stats()}))
+
+
+def trace_of(spans, trace_id):
+    return [span for span in spans if span['traceId'] == trace_id]
+
+
+def nested(spans, root):
+    """Every span reaches ``root`` through its parents."""
+    by_id = {span['spanId']: span for span in spans}
+    for span in spans:
+        seen = span
+        while seen is not root:
+            seen = by_id.get(seen.get('parentSpanId'))
+            if seen is None:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request tracing benchmark')
+    parser.add_argument('--logins', type=int, default=400, help='Timed logins per mode.')
+    parser.add_argument('--max-overhead', type=float, default=0.10,
+                        help='Largest slowdown allowed at the default sample rate (fraction).')
+    parser.add_argument('--timed-logins', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.timed_logins:
+        timed_logins(args.timed_logins)
+        return
+
+    tmp = tempfile.mkdtemp()
+    port, smtp_port = free_port(), free_port()
+    standin = f'http://127.0.0.1:{port}'
+    os.environ.update({
+        'BREVO_API_URL': f'{standin}/v3', 'BREVO_API_KEY': 'bench', 'SENDER_EMAIL': 'bench@bba-services.com',
+        'VONAGE_API_URL': standin, 'VONAGE_API_KEY': 'bench', 'VONAGE_API_SECRET': 'bench',
+        'SMTP_RELAY_HOST': '127.0.0.1', 'SMTP_RELAY_PORT': str(smtp_port),
+        'TRACE_OTLP_URL': f'{standin}/v1/traces', 'TRACE_FLUSH_INTERVAL': '60',
+    })
+    standins = subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(port),
+                                 '--smtp-port', str(smtp_port)])
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:48} {detail}")
+
+    try:
+        wait_for(f'{standin}/_stats')
+        env = {**os.environ, 'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'trace.db')}",
+               'TRACE_EXPORTER': 'otlp', 'TRACE_SAMPLE_RATE': '1'}
+        os.environ.update(env)
+
+        from werkzeug.security import generate_password_hash
+        from app import create_app
+        from app.models import db, User
+        from app.utils.auth_events import get_auth_event_log
+        from app.utils.deliverability import get_domain_cache
+        from app.utils.tracing import get_tracer
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(email='sms@example.com', is_verified=True, mfa_enabled=True, phone='+15550000001',
+                                password_hash=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')))
+            db.session.commit()
+
+        with app.app_context():
+            # No DNS here; the lookup still runs on the DNS executor
+            get_domain_cache().resolve = lambda domain, timeout: True
+        httpx.post(f'{standin}/_faults', json={'brevo': {'fail_rate': 1.0}})
+        client = app.test_client()
+        client.post('/signup', data={'email': 'new@bba-services.com', 'password': PASSWORD,
+                                     'password_confirm': PASSWORD})
+        httpx.post(f'{standin}/_faults', json={'brevo': {'fail_rate': 0.0}})
+        client = app.test_client()
+        form = {'email': 'sms@example.com', 'password': PASSWORD}
+        first = client.post('/login', data=form)
+        second = client.post('/login', data={**form, 'sms_code': STANDIN_CODE})
+        continued = sampled_traceparent()
+        app.test_client().get('/health', headers={'traceparent': continued})
+        unsampled = sampled_traceparent()[:-2] + '00'
+        app.test_client().get('/health', headers={'traceparent': unsampled})
+        check('signup and SMS login answered', first.status_code == 200 and second.status_code == 302,
+              f'{first.status_code}, {second.status_code}')
+
+        get_auth_event_log().flush()
+        get_tracer().flush()
+        spans = httpx.get(f'{standin}/_traces').json()
+        roots = {span['name']: span for span in spans if span['kind'] == 2}
+
+        signup = trace_of(spans, roots['POST /signup']['traceId']) if 'POST /signup' in roots else []
+        names = {span['name'] for span in signup}
+        check('signup: request, SQL, hash, Brevo, SMTP relay',
+              {'db.query', 'password.hash', 'brevo.send', 'smtp.send'} <= names
+              and nested(signup, roots['POST /signup']), f'{len(signup)} spans: {sorted(names)}')
+        check('signup: DNS lookup on the executor kept the trace', 'email.dns' in names)
+
+        logins = [trace_of(spans, span['traceId']) for span in spans
+                  if span['kind'] == 2 and span['name'] == 'POST /login']
+        names = [{span['name'] for span in trace} for trace in logins]
+        check('login: two traces, each nested under its request', len(logins) == 2 and all(
+            nested(trace, next(span for span in trace if span['kind'] == 2)) for trace in logins))
+        check('login: SQL, PBKDF2 and Vonage spans', len(names) == 2
+              and {'db.query', 'password.verify', 'vonage /verify/json'} <= names[0]
+              and {'db.query', 'password.verify', 'vonage /verify/check/json'} <= names[1],
+              ' / '.join(str(len(trace)) for trace in logins) + ' spans')
+        traced = httpx.get(f'{standin}/_stats').json()['traced_requests']
+        check('provider requests carried the traceparent', traced >= 3, f'{traced} requests')
+
+        login_traces = {trace[0]['traceId'] for trace in logins}
+        writes = [span for span in spans if span['name'] == 'auth_events.write']
+        linked = {link['traceId'] for span in writes for link in span.get('links', [])}
+        check('queued auth events linked to their requests', login_traces <= linked
+              and any(span['name'] == 'db.query' and span['traceId'] == write['traceId']
+                      for write in writes for span in spans),
+              f'{len(writes)} batch spans, {len(linked)} linked traces')
+
+        _, trace_id, parent_id, _ = continued.split('-')
+        health = roots.get('GET /health', {})
+        check('incoming traceparent continued', health.get('traceId') == trace_id
+              and health.get('parentSpanId') == parent_id)
+        check('unsampled traceparent not traced', not trace_of(spans, unsampled.split('-')[1]))
+
+        print(f'\n{args.logins} password logins per mode (cheap hash), exporting to the stand-in collector:')
+        results = {}
+        for label, settings in MODES.items():
+            worker_env = {**env, 'DATABASE_URL': f"sqlite:///{os.path.join(tmp, f'{len(results)}.db')}",
+                          'AUTH_EVENT_SINK': 'off', 'TRACE_SAMPLE_RATE': '0.01', 'LOG_LEVEL': 'ERROR', **settings}
+            output = subprocess.run([sys.executable, __file__, '--timed-logins', str(args.logins)],
+                                    env=worker_env, capture_output=True, text=True, check=True).stdout
+            results[label] = result = json.loads(output.strip().splitlines()[-1])
+            stats = result['stats']
+            print(f"     {label:15} p50 {result['p50']:6.2f}ms  mean {result['mean']:6.2f}ms  "
+                  f"{stats['sampled']:4} traced  {stats['capped']:4} capped  {stats['exported']:5} spans exported")
+        overhead = results['default rate']['mean'] / results['off']['mean'] - 1
+        check('default sample rate overhead bounded', overhead <= args.max_overhead,
+              f"{overhead:+.1%} mean (every request: "
+              f"{results['every request']['mean'] / results['off']['mean'] - 1:+.1%})")
+        capped = results['forced, capped']
+        allowed = 20 * (int(capped['elapsed']) + 2)
+        check('forced sampling held to TRACE_MAX_PER_SECOND', capped['stats']['sampled'] <= allowed,
+              f"{capped['stats']['sampled']} traced in {capped['elapsed']:.1f}s (at most {allowed})")
+    finally:
+        standins.terminate()
+        standins.wait()
+        shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
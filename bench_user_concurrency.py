@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Concurrent updates to one users row.
+
+--threads workers hammer a single account with read / await provider /
+write cycles, the shape of login + request_sms_code + resend: each reads
+the row, sleeps --provider-ms with no transaction open, then increments
+a counter kept in verification_code. Three ways of writing:
+
+- last write wins: plain UPDATE of the value read before the await (the
+  old behaviour); lost updates are counted
+- optimistic: update_user() with the users.version_id check, re-applied
+  on conflict
+- row lock: the row held from read to write across the await. SQLite
+  has no SELECT ... FOR UPDATE, so a per-user mutex stands in for it
+
+Also replays the clobber this guards against: a login clearing an
+answered SMS challenge after another request stored a new one.
+Exits 1 if updates are lost with optimistic writes, or if optimistic
+throughput is not at least twice the row lock's.
+
+    python bench_user_concurrency.py --threads 16 --ops 50 --provider-ms 20
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Optimistic concurrency stress test')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=50, help='Cycles per thread.')
+    parser.add_argument('--provider-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'users.db')}", 'AUTH_EVENT_SINK': 'off',
+                       'USER_UPDATE_ATTEMPTS': str(args.threads * 4)})
+
+    from sqlalchemy import update
+    from app import create_app
+    from app.models import db, User, release_connection
+    from app.utils import optimistic
+    from app.utils.optimistic import update_user
+    from app.utils.sms_challenges import clear_answered_challenge, store_sms_challenge
+
+    app = create_app()
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:46} {detail}")
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, email='busy@example.com', password_hash='-', verification_code='000000'))
+        db.session.commit()
+
+    provider = args.provider_ms / 1000
+    row_lock = threading.Lock()
+
+    def increment(user):
+        user.verification_code = f'{int(user.verification_code) + 1:06d}'
+
+    def last_write_wins():
+        user = db.session.get(User, 1)
+        seen = int(user.verification_code)
+        release_connection()
+        time.sleep(provider)
+        db.session.execute(update(User.__table__).where(User.__table__.c.id == 1)
+                           .values(verification_code=f'{seen + 1:06d}'))
+        db.session.commit()
+
+    def optimistic_write():
+        user = db.session.get(User, 1)
+        user.verification_code  # noqa: B018 - read before the await, like the views
+        release_connection()
+        time.sleep(provider)
+        update_user(user, increment)
+
+    def locked_write():
+        with row_lock:
+            user = db.session.get(User, 1)
+            seen = int(user.verification_code)
+            time.sleep(provider)
+            user.verification_code = f'{seen + 1:06d}'
+            db.session.commit()
+
+    def run(label, cycle):
+        with app.app_context():
+            db.session.execute(update(User.__table__).values(verification_code='000000'))
+            db.session.commit()
+        errors = []
+
+        def worker():
+            with app.app_context():
+                for _ in range(args.ops):
+                    try:
+                        cycle()
+                    except Exception as e:
+                        errors.append(e)
+                        db.session.rollback()
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        optimistic.stats.update(commits=0, conflicts=0, declined=0)
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        with app.app_context():
+            final = int(db.session.get(User, 1).verification_code)
+        total = args.threads * args.ops
+        print(f'     {label:18} {total / seconds:8.0f} updates/s  {total - final - len(errors):5} lost  '
+              f"{len(errors)} errors  {optimistic.stats['conflicts']} conflicts retried")
+        return total / seconds, total - final, errors
+
+    print(f'{args.threads} threads x {args.ops} updates of one users row, {args.provider_ms:g}ms provider await:')
+    naive, naive_lost, _ = run('last write wins', last_write_wins)
+    fast, lost, errors = run('optimistic', optimistic_write)
+    locked, _, _ = run('row lock', locked_write)
+    check('optimistic loses no updates', lost == 0 and not errors,
+          f'{lost} lost, {len(errors)} errors (last write wins lost {naive_lost})')
+    check('optimistic outpaces row lock', fast >= 2 * locked,
+          f'{fast / locked:.1f}x row lock, {fast / naive:.0%} of last write wins')
+
+    # Login A answered challenge 'first'; meanwhile request B stored 'second'
+    with app.app_context():
+        login_user = db.session.get(User, 1)
+        login_user.phone = '+15555550100'
+        store_sms_challenge(login_user, 'first', '+15555550100', None)
+        login_user.vonage_request_id  # noqa: B018 - loaded before B writes, so A's copy goes stale
+        conflicts = optimistic.stats['conflicts']
+        with app.app_context():
+            resend_user = db.session.get(User, 1)
+            stored = store_sms_challenge(resend_user, 'second', '+15555550100', 'first')
+        cleared = clear_answered_challenge(login_user, 'first')
+        survivor = db.session.get(User, 1).vonage_request_id
+    check("answered challenge clear keeps newer one", stored and not cleared and survivor == 'second',
+          f"stored challenge after both: {survivor!r}, {optimistic.stats['conflicts'] - conflicts} conflict")
+
+    shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
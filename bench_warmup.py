@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+First-request latency of a fresh gunicorn worker, with and without warm-up.
+
+Starts `gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker
+asgi:app` --restarts times per mode against the provider stand-ins, and
+times the first hit on each of these right after the worker is up, then
+the same requests again for the steady state:
+
+- GET /login: templates, create_all, routing
+- POST /api/auth/login, then GET /api/me: revocation list load
+- POST /api/questionnaire: NumPy and the scoring rubric
+- POST /login for an SMS MFA user: provider client and connection
+
+Without warm-up the worker counts as up once uvicorn reports startup.
+With warm-up it counts as up once /ready answers 200. Exits 1 if the
+warmed first requests are not faster in total.
+
+    python bench_warmup.py --restarts 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from bench_async_logins import free_port, seed_users, wait_for, PASSWORD
+
+REQUESTS = ('GET /login', 'POST /api/auth/login', 'GET /api/me', 'POST /api/questionnaire', 'POST /login (SMS MFA)')
+
+
+def start_worker(port, warmup):
+    env = dict(os.environ, WARMUP_ENABLED='1' if warmup else '0', WARMUP_PROVIDERS='1')
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '--workers', '1',
+                               '-k', 'uvicorn.workers.UvicornWorker', '--bind', f'127.0.0.1:{port}',
+                               '--log-level', 'info', 'asgi:app'],
+                              env=env, stderr=subprocess.PIPE, text=True)
+    for line in server.stderr:
+        if 'Application startup complete' in line:
+            break
+    # Keep draining so the worker never blocks on a full pipe
+    threading.Thread(target=lambda: [None for _ in server.stderr], daemon=True).start()
+    started = time.perf_counter()
+    if warmup:
+        deadline = time.time() + 60
+        while httpx.get(f'http://127.0.0.1:{port}/ready').status_code != 200:
+            if time.time() > deadline:
+                raise RuntimeError('worker never became ready')
+            time.sleep(0.05)
+    return server, time.perf_counter() - started
+
+
+def first_requests(base_url):
+    timings = {}
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        def timed(name, method, path, **kwargs):
+            started = time.perf_counter()
+            response = client.request(method, path, **kwargs)
+            timings[name] = (time.perf_counter() - started) * 1000
+            return response
+
+        timed('GET /login', 'GET', '/login')
+        tokens = timed('POST /api/auth/login', 'POST', '/api/auth/login',
+                       json={'email': 'plain@example.com', 'password': PASSWORD}).json()
+        headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+        timed('GET /api/me', 'GET', '/api/me', headers=headers)
+        timed('POST /api/questionnaire', 'POST', '/api/questionnaire', headers=headers,
+              json={'cash_reserve_months': 3, 'revenue_trend': 'growing', 'insurance': ['cyber']})
+        timed('POST /login (SMS MFA)', 'POST', '/login', data={'email': 'bench0@example.com', 'password': PASSWORD})
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker warm-up benchmark')
+    parser.add_argument('--restarts', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-warmup-')
+    standin_port = free_port()
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{workdir}/bench.db',
+        'BREVO_API_URL': f'http://127.0.0.1:{standin_port}/v3',
+        'VONAGE_API_URL': f'http://127.0.0.1:{standin_port}',
+        'VONAGE_API_KEY': 'bench',
+        'VONAGE_API_SECRET': 'bench',
+        'AUTH_EVENT_SINK': 'off',
+        'JWT_SECRET_KEY': 'bench-warmup-signing-key-with-at-least-32-bytes',
+    })
+    seed_users(1)
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, User
+    app = create_app()
+    with app.app_context():
+        db.session.add(User(email='plain@example.com', is_verified=True,
+                            password_hash=generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')))
+        db.session.commit()
+
+    standins = subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(standin_port)])
+    results = {}
+    try:
+        wait_for(f'http://127.0.0.1:{standin_port}/')
+        for mode in ('cold', 'warm'):
+            firsts, seconds, waits = [], [], []
+            for _ in range(args.restarts):
+                port = free_port()
+                server, waited = start_worker(port, mode == 'warm')
+                try:
+                    firsts.append(first_requests(f'http://127.0.0.1:{port}'))
+                    seconds.append(first_requests(f'http://127.0.0.1:{port}'))
+                finally:
+                    server.terminate()
+                    server.wait()
+                waits.append(waited)
+            results[mode] = {name: statistics.median(run[name] for run in firsts) for name in REQUESTS}
+            results[f'{mode} again'] = {name: statistics.median(run[name] for run in seconds) for name in REQUESTS}
+            print(f'{mode}: worker up -> ready {statistics.median(waits) * 1000:.0f}ms (median of {args.restarts})')
+    finally:
+        standins.terminate()
+        standins.wait()
+
+    print(f"\n{'first request (median ms)':28} {'cold':>8} {'warm':>8} {'steady':>8}")
+    for name in REQUESTS:
+        print(f"{name:28} {results['cold'][name]:8.1f} {results['warm'][name]:8.1f} {results['warm again'][name]:8.1f}")
+    cold, warm = sum(results['cold'].values()), sum(results['warm'].values())
+    print(f"{'total':28} {cold:8.1f} {warm:8.1f} {sum(results['warm again'].values()):8.1f}")
+    sys.exit(0 if warm < cold else 1)
+
+
+if __name__ == '__main__':
+    main()
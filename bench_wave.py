@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Wave client layer against the local Wave stand-in (provider_standins.py).
+
+Every Wave call is delayed by --delay seconds and the stand-in refuses
+more than --wave-rate-limit queries per token and second, like a
+rate-limited API would. Compares:
+
+- per call: a fresh OAuth2Session per query, the way wave_connect /
+  wave_callback build theirs, no caching
+- cached: wave_query(), with per-user sessions, the response cache and
+  the rate limiter
+
+over --threads threads each sending --calls queries for --users users,
+then checks that concurrent identical queries are sent once, that a
+stale answer is served at once while one background query refreshes it,
+that no query is refused for rate limiting, and that expired and
+rejected tokens are refreshed and saved. Exits 1 if any check fails.
+
+    python bench_wave.py --users 8 --threads 16 --calls 20 --delay 0.1
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from bench_async_logins import free_port, wait_for
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wave client cache benchmark')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=20, help='Queries per thread.')
+    parser.add_argument('--delay', type=float, default=0.1, help='Stand-in latency per Wave call.')
+    parser.add_argument('--wave-rate-limit', type=int, default=5, help='Stand-in limit per token and second.')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    port = free_port()
+    standin = f'http://127.0.0.1:{port}'
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'wave.db')}",
+        'AUTH_EVENT_SINK': 'off',
+        'OAUTHLIB_INSECURE_TRANSPORT': '1',  # the stand-in speaks plain HTTP
+        'WAVE_CLIENT_ID': 'bench', 'WAVE_CLIENT_SECRET': 'bench',
+        'WAVE_OAUTH_URL': f'{standin}/wave/oauth2',
+        'WAVE_GRAPHQL_URL': f'{standin}/wave/graphql/public',
+        'WAVE_CACHE_TTL': '2', 'WAVE_CACHE_STALE': '60',
+        'WAVE_RATE_LIMIT': str(args.wave_rate_limit), 'WAVE_RATE_BURST': str(args.wave_rate_limit),
+    })
+
+    from requests_oauthlib import OAuth2Session
+    from app import create_app
+    from app.models import db, User, WaveToken
+    from app.routes.api import BUSINESSES_QUERY
+    from app.utils.wave import WaveRateLimited, get_wave_client, wave_query
+
+    app = create_app()
+    failures = []
+
+    def check(label, ok, detail=''):
+        failures.extend([] if ok else [label])
+        print(f"{'ok  ' if ok else 'FAIL'} {label:44} {detail}")
+
+    far = datetime.now() + timedelta(days=1)
+    with app.app_context():
+        db.create_all()
+        for i in range(1, args.users + 3):
+            db.session.add(User(id=i, email=f'wave{i}@example.com', password_hash='-'))
+        db.session.add_all([WaveToken(user_id=i, access_token=f'wave-access-user{i}', refresh_token=f'r{i}',
+                                      expires_at=far) for i in range(1, args.users + 2)])
+        # Expired an hour ago; only its refresh token still works
+        db.session.add(WaveToken(user_id=args.users + 2, access_token='wave-access-expired', refresh_token='r',
+                                 expires_at=datetime.now() - timedelta(hours=1)))
+        db.session.commit()
+
+    standins = subprocess.Popen([sys.executable, 'provider_standins.py', '--port', str(port),
+                                 '--delay', str(args.delay), '--wave-rate-limit', str(args.wave_rate_limit)])
+
+    def standin_stats():
+        return httpx.get(f'{standin}/_stats').json()
+
+    def run(label, call):
+        before = standin_stats()
+        refused, errors = [], []
+
+        def worker(t):
+            for n in range(args.calls):
+                try:
+                    call(1 + (t + n) % args.users)
+                except WaveRateLimited as e:
+                    refused.append(e)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        after = standin_stats()
+        upstream = after['wave_queries'] - before['wave_queries']
+        limited = after['wave_rate_limited'] - before['wave_rate_limited']
+        answered = args.threads * args.calls - len(refused) - len(errors)
+        print(f'     {label:10} {answered / seconds:8.1f} answered/s  {upstream:4} sent to Wave  '
+              f'{limited:4} refused by Wave (429)  {len(refused)} refused locally  {len(errors)} errors')
+        return answered / seconds, limited, errors
+
+    def per_call(user_id):
+        # What a view gets by copying wave_connect: a new session and connection per query
+        oauth = OAuth2Session('bench', token={'access_token': f'wave-access-user{user_id}', 'token_type': 'Bearer'})
+        response = oauth.post(os.environ['WAVE_GRAPHQL_URL'], json={'query': BUSINESSES_QUERY}, timeout=10)
+        if response.status_code == 429:
+            raise WaveRateLimited(float(response.headers.get('Retry-After', 1)))
+        response.raise_for_status()
+
+    def cached(user_id):
+        with app.app_context():
+            wave_query(user_id, BUSINESSES_QUERY)
+
+    try:
+        wait_for(f'{standin}/_stats')
+        print(f'{args.threads} threads x {args.calls} business queries for {args.users} users, '
+              f'{args.delay:g}s Wave latency, {args.wave_rate_limit}/s per token at Wave:')
+        slow, slow_limited, _ = run('per call', per_call)
+        time.sleep(1.1)  # the stand-in counts per token and wall-clock second; start the cached run clean
+        fast, fast_limited, fast_errors = run('cached', cached)
+        check('cached layer outpaces per-call sessions', fast >= 3 * slow and not fast_errors,
+              f'{fast / slow:.0f}x, {len(fast_errors)} errors')
+        check('cached layer stays under the rate limit', fast_limited == 0,
+              f'{fast_limited} refused (per call: {slow_limited})')
+
+        client = get_wave_client()
+        user_id = args.users + 1
+        echo = 'query Echo($n: Int) { standin(n: $n) }'
+
+        # Identical queries from many threads on a cold cache
+        before = standin_stats()['wave_queries']
+        barrier = threading.Barrier(32)
+
+        def same_query():
+            with app.app_context():
+                barrier.wait()
+                wave_query(user_id, echo, {'n': 1})
+
+        threads = [threading.Thread(target=same_query) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sent = standin_stats()['wave_queries'] - before
+        check('concurrent identical queries sent once', sent == 1, f'32 callers, {sent} sent')
+
+        # Past the TTL: stale answer at once, fresh one after the background query
+        with app.app_context():
+            first = wave_query(user_id, echo, {'n': 2})
+            time.sleep(client.ttl + 0.1)
+            started = time.perf_counter()
+            stale = wave_query(user_id, echo, {'n': 2})
+            stale_ms = (time.perf_counter() - started) * 1000
+            time.sleep(args.delay * 3)
+            fresh = wave_query(user_id, echo, {'n': 2})
+        check('stale answer served while revalidating', stale == first and fresh != first
+              and stale_ms < args.delay * 1000 / 2,
+              f"stale in {stale_ms:.1f}ms, served #{first['standin']['served']} then "
+              f"#{fresh['standin']['served']}")
+
+        # A token past expires_at, then one Wave rejects before it says it expires
+        refreshed = standin_stats()['wave_refreshed']
+        with app.app_context():
+            wave_query(args.users + 2, echo, {'n': 3})
+            stored = db.session.execute(db.select(WaveToken.access_token)
+                                        .where(WaveToken.user_id == args.users + 2)).scalar()
+            httpx.post(f'{standin}/_wave', json={'expire': [stored]})
+            wave_query(args.users + 2, echo, {'n': 4})
+            latest = db.session.execute(db.select(WaveToken.access_token)
+                                        .where(WaveToken.user_id == args.users + 2)).scalar()
+        refreshes = standin_stats()['wave_refreshed'] - refreshed
+        check('expired and rejected tokens refreshed', refreshes == 2 and stored != 'wave-access-expired'
+              and latest != stored, f'{refreshes} refreshes, saved token changed twice')
+        print(f'     client stats: {client.snapshot()}')
+    finally:
+        standins.terminate()
+        standins.wait()
+        shutil.rmtree(tmp)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""
+Gunicorn settings read from the working directory by every start command
+(Procfile, Dockerfile, railway.json); their command-line flags still win.
+"""
+
+
+def post_worker_init(worker):
+    """Warm the freshly forked worker up in the background; /ready turns 200 when done."""
+    from app.utils.warmup import start_warm_up
+
+    wsgi = worker.wsgi  # asgi:app wraps the Flask app in a2wsgi's WSGIMiddleware
+    start_warm_up(getattr(wsgi, 'app', wsgi), executor=getattr(wsgi, 'executor', None))
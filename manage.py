@@ -1,9 +1,242 @@
+import click
+from flask_migrate import Migrate
+
 from app import create_app, db
+from app.utils.cleanup import STEPS, run_cleanup
 
 app = create_app()
 
+# Migrations are a CLI concern (flask --app manage db upgrade); keeping
+# Flask-Migrate out of create_app() keeps alembic out of web worker boot
+Migrate(app, db)
+
 
 @app.shell_context_processor
 def make_shell_context():
     from app.models import User, QuestionnaireResponse, WaveToken
     return dict(db=db, User=User, QuestionnaireResponse=QuestionnaireResponse, WaveToken=WaveToken)
+
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format (default: from file extension).')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per insert batch.')
+@click.option('--workers', default=None, type=int, help='Hashing processes (default: CPU count).')
+@click.option('--checkpoint', default=None, help='Checkpoint file (default: PATH.checkpoint).')
+@click.option('--outbox', default=None,
+              help='NDJSON file to queue verification emails in (default: PATH.outbox.ndjson).')
+@click.option('--no-email', is_flag=True, help='Do not queue verification emails.')
+def import_users_command(path, fmt, chunk_size, workers, checkpoint, outbox, no_email):
+    """Bulk-create users from a CSV or NDJSON file of email,password[,phone]."""
+    from app.utils.user_import import import_users
+
+    outbox = None if no_email else (outbox or f"{path}.outbox.ndjson")
+    db.create_all()
+    state = import_users(path, fmt=fmt, chunk_size=chunk_size, workers=workers,
+                         checkpoint_path=checkpoint, outbox_path=outbox, progress=click.echo)
+    click.echo(f"Done: {state['inserted']} inserted, {state['skipped']} skipped, "
+               f"{state['rows_per_sec']:.0f} rows/sec this run")
+    if outbox:
+        click.echo(f"Verification emails queued in {outbox}")
+
+
+@app.cli.command('send-verification-emails')
+@click.argument('outbox', required=False, type=click.Path(exists=True, dir_okay=False))
+@click.option('--unverified', is_flag=True,
+              help='Send to every unverified user with a pending code instead of an outbox file.')
+@click.option('--results', default=None,
+              help='NDJSON per-recipient results (default: OUTBOX.results.ndjson).')
+@click.option('--batch-size', default=None, type=int, help='Recipients per Brevo request.')
+@click.option('--concurrency', default=None, type=int, help='Brevo requests in flight.')
+def send_verification_emails_command(outbox, unverified, results, batch_size, concurrency):
+    """Send verification codes in Brevo batches from an import outbox or the database."""
+    from app.models import User
+    from app.utils.bulk_email import read_outbox, send_bulk_verification_emails
+
+    if unverified:
+        messages = (
+            {'email': email, 'code': code}
+            for email, code in db.session.execute(
+                db.select(User.email, User.verification_code)
+                .where(User.is_verified.is_(False), User.verification_code.is_not(None))
+            )
+        )
+        results = results or 'unverified.results.ndjson'
+    elif outbox:
+        messages = read_outbox(outbox)
+        results = results or f"{outbox}.results.ndjson"
+    else:
+        raise click.UsageError('Give an OUTBOX file or --unverified.')
+
+    counts = send_bulk_verification_emails(messages, batch_size=batch_size,
+                                           concurrency=concurrency, results_path=results)
+    click.echo(f"Results written to {results}")
+    if counts['failed']:
+        click.echo(f"{counts['failed']} recipients failed; rerun to retry them.")
+
+
+@app.cli.command('check-query-plans')
+@click.option('--migrate', is_flag=True, help='Run flask db upgrade first (use on a scratch database).')
+@click.option('--seed', default=2000, show_default=True,
+              help='Users to seed, with a response and Wave token each, if the users table is empty.')
+def check_query_plans_command(migrate, seed):
+    """EXPLAIN the hot lookups and fail if any of them scans a whole table.
+
+    For CI: DATABASE_URL=<scratch db> flask --app manage check-query-plans --migrate
+    """
+    from flask_migrate import upgrade
+    from app.models import User
+    from app.utils.query_plans import check_hot_queries, seed as seed_tables
+
+    if migrate:
+        upgrade()
+    if seed and db.session.scalar(db.select(db.func.count(User.id))) == 0:
+        seed_tables(seed)
+
+    failed = False
+    for name, (lines, seq_scans) in check_hot_queries().items():
+        click.echo(f"{'FAIL' if seq_scans else 'ok  '} {name}")
+        for line in lines:
+            click.echo(f"       {line}")
+        failed = failed or bool(seq_scans)
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('check-query-budgets')
+def check_query_budgets_command():
+    """Request each budgeted endpoint as a verified user and fail if it runs too many queries.
+
+    For CI: DATABASE_URL=<scratch db> flask --app manage check-query-budgets
+    """
+    from werkzeug.security import generate_password_hash
+    from app.models import User
+    from app.utils.query_stats import QUERY_BUDGETS, assert_query_budget
+
+    email = 'query-budget@example.com'
+    db.create_all()
+    if db.session.scalar(db.select(User).filter_by(email=email)) is None:
+        db.session.add(User(email=email, is_verified=True,
+                            password_hash=generate_password_hash('query-budget', method='pbkdf2:sha256:1000')))
+        db.session.commit()
+
+    # A separate app instance, so each request gets its own app context and g
+    # instead of sharing the one this command runs in
+    budget_app = create_app()
+    budget_app.testing = True
+    with budget_app.test_request_context():
+        paths = {endpoint: budget_app.url_for(endpoint) for endpoint in QUERY_BUDGETS}
+
+    client = budget_app.test_client()
+    client.get('/health')  # first request creates tables; keep it out of the numbers
+    client.post('/login', data={'email': email, 'password': 'query-budget'})
+    failed = False
+    for endpoint, budget in QUERY_BUDGETS.items():
+        try:
+            response = assert_query_budget(client, paths[endpoint], budget)
+            click.echo(f"ok   {paths[endpoint]}: {response.headers['X-DB-Query-Count']} queries "
+                       f"(budget {budget})")
+        except AssertionError as e:
+            click.echo(f"FAIL {e}")
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('profile-token')
+@click.option('--ttl', default=600, show_default=True, help='Seconds the token stays valid.')
+def profile_token_command(ttl):
+    """Print an X-Profile header value that profiles requests until it expires."""
+    from app.utils.profiler import PROFILE_HEADER, profile_token
+
+    click.echo(f"{PROFILE_HEADER}: {profile_token(app.config['SECRET_KEY'], ttl)}")
+
+
+@app.cli.command('profile-report')
+@click.option('--dir', 'directory', default=None, help='Profile directory (default: PROFILE_DIR).')
+@click.option('--endpoint', default=None, help='Only dumps for this endpoint, e.g. auth.login.')
+@click.option('--top', default=20, show_default=True, help='Functions to list.')
+def profile_report_command(directory, endpoint, top):
+    """Aggregate profile dumps into the hottest functions by self and total time."""
+    from app.utils.profiler import hot_functions, read_dumps
+
+    total, self_samples, inclusive = hot_functions(read_dumps(directory or app.config['PROFILE_DIR'], endpoint))
+    if not total:
+        click.echo('No profile samples found.')
+        return
+    click.echo(f"{total} samples\n\n  self%  total%  function")
+    for name, count in self_samples.most_common(top):
+        click.echo(f"{count / total:7.1%} {inclusive[name] / total:7.1%}  {name}")
+    click.echo("\n  total%  function (inclusive)")
+    for name, count in inclusive.most_common(top):
+        click.echo(f"{count / total:8.1%}  {name}")
+
+
+@app.cli.command('cancel-sms-challenges')
+@click.option('--older-than', type=int, default=None,
+              help='Seconds after which an unanswered challenge is abandoned (default: SMS_CHALLENGE_ABANDON_AFTER).')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--concurrency', default=10, show_default=True, help='Cancel calls in flight at once.')
+def cancel_sms_challenges_command(older_than, batch_size, concurrency):
+    """Clear abandoned SMS challenges and cancel them at the provider. Run from cron."""
+    from app.utils.sms_challenges import cancel_abandoned_challenges
+
+    cancel_abandoned_challenges(older_than, batch_size, concurrency)
+
+
+@app.cli.command('cleanup')
+@click.option('--step', 'steps', multiple=True, type=click.Choice(STEPS),
+              help='Only this step (repeatable; default: all).')
+@click.option('--batch-size', type=int, default=None, help='Rows per batch (default: CLEANUP_BATCH_SIZE).')
+@click.option('--pause', type=float, default=None, help='Seconds between batches (default: CLEANUP_BATCH_PAUSE).')
+@click.option('--dry-run', is_flag=True, help='Only count the rows each step would process.')
+def cleanup_command(steps, batch_size, pause, dry_run):
+    """Delete stale unverified accounts, codes and expired tokens in small batches. Run from cron."""
+    processed = run_cleanup(steps or STEPS, batch_size, pause, dry_run, progress=click.echo)
+    if processed is not None:
+        click.echo(f"Done: {sum(processed.values())} rows{' would be' if dry_run else ''} processed")
+
+
+@app.cli.command('questionnaire-partitions')
+@click.option('--months-ahead', type=int, default=None,
+              help='Months after the current one to create (default: QUESTIONNAIRE_PARTITIONS_AHEAD).')
+def questionnaire_partitions_command(months_ahead):
+    """Create upcoming monthly questionnaire_response partitions (PostgreSQL). Run from cron."""
+    from app.utils.questionnaire_storage import ensure_partitions, partitions
+
+    if db.engine.dialect.name != 'postgresql':
+        click.echo(f'{db.engine.dialect.name}: questionnaire_response is not partitioned; nothing to do.')
+        return
+    for month in ensure_partitions(months_ahead):
+        click.echo(f'created {month:%Y-%m}')
+    months = partitions()
+    click.echo(f'{len(months)} partitions, {months[0]:%Y-%m} to {months[-1]:%Y-%m}' if months else 'no partitions')
+
+
+@app.cli.command('archive-questionnaires')
+@click.option('--retention-months', type=int, default=None,
+              help='Months kept in the database (default: QUESTIONNAIRE_RETENTION_MONTHS).')
+@click.option('--dir', 'directory', default=None, help='Archive directory (default: QUESTIONNAIRE_ARCHIVE_DIR).')
+@click.option('--dry-run', is_flag=True, help='Only count the rows that would be archived.')
+def archive_questionnaires_command(retention_months, directory, dry_run):
+    """Move questionnaire responses past the retention horizon into compressed monthly files."""
+    from app.utils.questionnaire_storage import archive_old_months
+
+    archived = archive_old_months(retention_months, directory, dry_run=dry_run)
+    for month, rows in archived.items():
+        click.echo(f"{month}: {rows} rows{' (dry run)' if dry_run else ''}")
+    if not archived:
+        click.echo('Nothing past the retention horizon.')
+
+
+@app.cli.command('rescore-questionnaires')
+@click.option('--rubric', 'version', default=None, help='Rubric version (default: QUESTIONNAIRE_RUBRIC).')
+@click.option('--chunk-size', default=10000, show_default=True, help='Responses per read/score/write round.')
+@click.option('--all', 'everything', is_flag=True, help='Also re-score responses already on this rubric.')
+def rescore_questionnaires_command(version, chunk_size, everything):
+    """Re-score stored questionnaire responses with a rubric, in vectorized chunks."""
+    from app.utils.scoring import rescore_responses
+
+    counts = rescore_responses(version, chunk_size, everything, progress=click.echo)
+    click.echo(f"Done: {counts['scanned']} re-scored, {counts['changed']} scores changed")
@@ -1,4 +1,6 @@
-"""Initial migration - create users table with Vonage support
+"""Initial migration - users, questionnaire responses and Wave tokens
+
+Matches the schema db.create_all() builds from the original models.
 
 Revision ID: 001_initial
 Revises: 
@@ -21,16 +23,42 @@ def upgrade():
     op.create_table('users',
         sa.Column('id', sa.Integer(), nullable=False),
         sa.Column('email', sa.String(length=120), nullable=False),
-        sa.Column('password', sa.String(length=255), nullable=False),
-        sa.Column('email_verified', sa.Boolean(), nullable=True),
-        sa.Column('verification_code', sa.String(length=6), nullable=True),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
+        sa.Column('is_verified', sa.Boolean(), nullable=False),
         sa.Column('phone', sa.String(length=20), nullable=True),
-        sa.Column('mfa_enabled', sa.Boolean(), nullable=True),
+        sa.Column('mfa_enabled', sa.Boolean(), nullable=False),
+        sa.Column('verification_code', sa.String(length=6), nullable=True),
+        sa.Column('sms_code', sa.String(length=6), nullable=True),
         sa.Column('vonage_request_id', sa.String(length=64), nullable=True),
-        sa.PrimaryKeyConstraint('id'),
-        sa.UniqueConstraint('email')
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('verified_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table('questionnaire_response',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('answers', sa.JSON(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    op.create_table('wave_token',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('access_token', sa.String(), nullable=False),
+        sa.Column('refresh_token', sa.String(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
     )
 
 
 def downgrade():
+    op.drop_table('wave_token')
+    op.drop_table('questionnaire_response')
+    op.drop_index('ix_users_email', table_name='users')
     op.drop_table('users')
@@ -0,0 +1,28 @@
+"""Add TOTP MFA columns to users
+
+Revision ID: 002_totp_mfa
+Revises: 001_initial
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002_totp_mfa'
+down_revision = '001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('mfa_method', sa.String(length=10), nullable=True))
+    op.add_column('users', sa.Column('totp_secret', sa.String(length=32), nullable=True))
+    # Accounts that already have MFA on are SMS accounts
+    op.execute("UPDATE users SET mfa_method = 'sms' WHERE mfa_enabled")
+
+
+def downgrade():
+    op.drop_column('users', 'totp_secret')
+    op.drop_column('users', 'mfa_method')
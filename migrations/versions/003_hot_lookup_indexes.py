@@ -0,0 +1,46 @@
+"""Index the hot lookups: users.phone and the user_id foreign keys
+
+On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY so
+writes to these tables are not blocked while they build. CONCURRENTLY
+cannot run inside a transaction, hence the autocommit block.
+
+Revision ID: 003_hot_lookup_indexes
+Revises: 002_totp_mfa
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '003_hot_lookup_indexes'
+down_revision = '002_totp_mfa'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_users_phone', 'users', ['phone']),
+    ('ix_questionnaire_response_user_id', 'questionnaire_response', ['user_id']),
+    ('ix_wave_token_user_id', 'wave_token', ['user_id']),
+]
+
+
+def upgrade():
+    # if_not_exists: databases built by db.create_all() may already have them
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, _ in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True)
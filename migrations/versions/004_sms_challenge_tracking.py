@@ -0,0 +1,26 @@
+"""Track the active SMS challenge's phone and send time on users
+
+Revision ID: 004_sms_challenge_tracking
+Revises: 003_hot_lookup_indexes
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_sms_challenge_tracking'
+down_revision = '003_hot_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('sms_challenge_phone', sa.String(length=20), nullable=True))
+    op.add_column('users', sa.Column('sms_challenge_sent_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'sms_challenge_sent_at')
+    op.drop_column('users', 'sms_challenge_phone')
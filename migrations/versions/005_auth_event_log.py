@@ -0,0 +1,39 @@
+"""Add the append-only auth_event table
+
+Revision ID: 005_auth_event_log
+Revises: 004_sms_challenge_tracking
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005_auth_event_log'
+down_revision = '004_sms_challenge_tracking'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'auth_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('event', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('email', sa.String(length=120), nullable=True),
+        sa.Column('ip', sa.String(length=45), nullable=True),
+        sa.Column('user_agent', sa.String(length=255), nullable=True),
+        sa.Column('detail', sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_auth_event_created_at', 'auth_event', ['created_at'])
+    op.create_index('ix_auth_event_user_id', 'auth_event', ['user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_auth_event_user_id', table_name='auth_event')
+    op.drop_index('ix_auth_event_created_at', table_name='auth_event')
+    op.drop_table('auth_event')
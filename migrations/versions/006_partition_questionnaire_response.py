@@ -0,0 +1,115 @@
+"""Partition questionnaire_response by month on PostgreSQL
+
+The table becomes PARTITION BY RANGE (created_at) with one partition
+per month from the oldest row to three months ahead, plus a default
+partition; `flask questionnaire-partitions` keeps creating months ahead.
+The primary key becomes (id, created_at) since it must contain the
+partition key, and ids keep coming from the existing sequence.
+
+Other databases keep one table and get the same indexes, so the
+archival job deletes archived months instead of dropping partitions.
+
+Revision ID: 006_partition_questionnaire
+Revises: 005_auth_event_log
+Create Date: 2026-10-19
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006_partition_questionnaire'
+down_revision = '005_auth_event_log'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _set_aside(new_name):
+    """Rename the current table and its constraints so the replacement can reuse the names."""
+    op.execute("ALTER SEQUENCE questionnaire_response_id_seq OWNED BY NONE")
+    op.rename_table('questionnaire_response', new_name)
+    op.execute(f"ALTER TABLE {new_name} RENAME CONSTRAINT questionnaire_response_pkey TO {new_name}_pkey")
+    op.execute(f"ALTER TABLE {new_name} RENAME CONSTRAINT questionnaire_response_user_id_fkey "
+               f"TO {new_name}_user_id_fkey")
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.execute(sa.text("UPDATE questionnaire_response SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('questionnaire_response') as batch:
+            batch.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+        op.drop_index('ix_questionnaire_response_user_id', table_name='questionnaire_response', if_exists=True)
+        op.create_index('ix_questionnaire_response_user_created', 'questionnaire_response',
+                        ['user_id', 'created_at'])
+        op.create_index('ix_questionnaire_response_created_at', 'questionnaire_response', ['created_at'])
+        return
+
+    _set_aside('questionnaire_response_unpartitioned')
+    op.execute("""
+        CREATE TABLE questionnaire_response (
+            id INTEGER NOT NULL DEFAULT nextval('questionnaire_response_id_seq'),
+            user_id INTEGER NOT NULL CONSTRAINT questionnaire_response_user_id_fkey REFERENCES users (id),
+            answers JSON NOT NULL,
+            score FLOAT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT questionnaire_response_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("CREATE TABLE questionnaire_response_default PARTITION OF questionnaire_response DEFAULT")
+
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM questionnaire_response_unpartitioned")).scalar()
+    today = date.today()
+    month = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    last = date(today.year, today.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        op.execute(f"CREATE TABLE questionnaire_response_p{month:%Y%m} PARTITION OF questionnaire_response "
+                   f"FOR VALUES FROM ('{month}') TO ('{_next_month(month)}')")
+        month = _next_month(month)
+
+    op.execute("INSERT INTO questionnaire_response SELECT id, user_id, answers, score, created_at "
+               "FROM questionnaire_response_unpartitioned")
+    op.drop_table('questionnaire_response_unpartitioned')
+    op.execute("ALTER SEQUENCE questionnaire_response_id_seq OWNED BY questionnaire_response.id")
+    op.create_index('ix_questionnaire_response_user_created', 'questionnaire_response', ['user_id', 'created_at'])
+    op.create_index('ix_questionnaire_response_created_at', 'questionnaire_response', ['created_at'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        op.drop_index('ix_questionnaire_response_created_at', table_name='questionnaire_response')
+        op.drop_index('ix_questionnaire_response_user_created', table_name='questionnaire_response')
+        op.create_index('ix_questionnaire_response_user_id', 'questionnaire_response', ['user_id'])
+        with op.batch_alter_table('questionnaire_response') as batch:
+            batch.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+        return
+
+    _set_aside('questionnaire_response_partitioned')
+    op.create_table('questionnaire_response',
+        sa.Column('id', sa.Integer(), nullable=False,
+                  server_default=sa.text("nextval('questionnaire_response_id_seq')")),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('answers', sa.JSON(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO questionnaire_response SELECT id, user_id, answers, score, created_at "
+               "FROM questionnaire_response_partitioned")
+    op.execute("DROP TABLE questionnaire_response_partitioned CASCADE")
+    op.execute("ALTER SEQUENCE questionnaire_response_id_seq OWNED BY questionnaire_response.id")
+    op.create_index('ix_questionnaire_response_user_id', 'questionnaire_response', ['user_id'])
@@ -0,0 +1,38 @@
+"""Add the revoked_token table for API token revocation
+
+Revision ID: 007_revoked_tokens
+Revises: 006_partition_questionnaire
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007_revoked_tokens'
+down_revision = '006_partition_questionnaire'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'revoked_token',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sa.String(length=36), nullable=False),
+        sa.Column('token_type', sa.String(length=10), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('jti'),
+    )
+    op.create_index('ix_revoked_token_revoked_at', 'revoked_token', ['revoked_at'])
+    op.create_index('ix_revoked_token_expires_at', 'revoked_token', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_revoked_token_expires_at', table_name='revoked_token')
+    op.drop_index('ix_revoked_token_revoked_at', table_name='revoked_token')
+    op.drop_table('revoked_token')
@@ -0,0 +1,25 @@
+"""Record which scoring rubric computed each questionnaire score
+
+Revision ID: 008_questionnaire_rubric_version
+Revises: 007_revoked_tokens
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008_questionnaire_rubric_version'
+down_revision = '007_revoked_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing scores were sent by clients; NULL marks them for `flask rescore-questionnaires`
+    op.add_column('questionnaire_response', sa.Column('rubric_version', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    op.drop_column('questionnaire_response', 'rubric_version')
@@ -0,0 +1,25 @@
+"""Add users.version_id for optimistic concurrency control
+
+Revision ID: 009_user_version_id
+Revises: 008_questionnaire_rubric_version
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009_user_version_id'
+down_revision = '008_questionnaire_rubric_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant default is a metadata-only change on PostgreSQL 11+, no table rewrite
+    op.add_column('users', sa.Column('version_id', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('users', 'version_id')
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Brevo, Vonage Verify and Wave APIs and the SMTP relay.
+
+Point BREVO_API_URL at http://127.0.0.1:<port>/v3, VONAGE_API_URL at
+http://127.0.0.1:<port>, an SMS_HTTP_PROVIDERS entry at
+http://127.0.0.1:<port>/sms/send, WAVE_OAUTH_URL at
+http://127.0.0.1:<port>/wave/oauth2, WAVE_GRAPHQL_URL at
+http://127.0.0.1:<port>/wave/graphql/public and
+SMTP_RELAY_HOST/SMTP_RELAY_PORT at the SMTP sink to exercise the
+provider-bound flows without real credentials. Every response is delayed to mimic a slow provider; the
+Vonage verification code is always STANDIN_CODE.
+
+The Wave GraphQL endpoint accepts bearer tokens starting with
+WAVE_TOKEN_PREFIX that have not been expired through /_wave, answers
+`businesses` queries with WAVE_BUSINESSES and anything else with an echo
+of the variables, and refuses more than --wave-rate-limit queries per
+token and second with 429 and Retry-After.
+
+/v1/traces stands in for an OTLP/HTTP collector (TRACE_EXPORTER=otlp,
+TRACE_OTLP_URL=http://127.0.0.1:<port>/v1/traces): it keeps the last
+TRACE_KEEP spans, served flattened at /_traces. Provider requests that
+carried a traceparent header are counted in the stats.
+
+Faults can be injected per provider at startup or at runtime:
+
+    curl -X POST localhost:9100/_faults -d '{"brevo": {"fail_rate": 1.0}}'
+    curl localhost:9100/_stats
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import random
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+import uvicorn
+
+STANDIN_CODE = '123456'
+
+settings = {
+    'delay': 0.0,
+    'country_delays': {},  # number prefix -> delay, overrides 'delay'
+    'wave_rate_limit': 0,  # queries per token and second, 0 = unlimited
+    'wave_token_ttl': 3600,
+}
+
+# Per-provider faults: fail_rate answers 503, hang adds seconds before answering
+faults = {
+    'brevo': {'fail_rate': 0.0, 'hang': 0.0},
+    'vonage': {'fail_rate': 0.0, 'hang': 0.0},
+    'sms': {'fail_rate': 0.0, 'hang': 0.0},
+    'wave': {'fail_rate': 0.0, 'hang': 0.0},
+}
+
+# Last code texted to each number by the generic HTTP SMS endpoint
+sms_codes = {}
+
+# Vonage verifications still open: request_id -> (number, expires at).
+# Like Vonage, a second verification to an open number is refused (status 10).
+VONAGE_PIN_EXPIRY = 300
+vonage_open = {}
+
+WAVE_TOKEN_PREFIX = 'wave-access-'
+WAVE_BUSINESSES = [{'id': 'QnVzaW5lc3M6MQ==', 'name': 'Standin Bakery', 'isPersonal': False},
+                   {'id': 'QnVzaW5lc3M6Mg==', 'name': 'Standin Consulting', 'isPersonal': False}]
+wave_expired = set()  # access tokens answered with 401
+wave_windows = {}  # access token -> (second, queries in it)
+
+TRACE_KEEP = 10000
+traces = []  # received spans, oldest first, with their service name
+
+# Headers of the request being handled, for handlers that check credentials
+request_headers = contextvars.ContextVar('request_headers', default={})
+
+stats = {
+    'brevo_sent': 0,
+    'brevo_batches': 0,
+    'vonage_started': 0,
+    'vonage_checked': 0,
+    'vonage_concurrent': 0,
+    'vonage_cancelled': 0,
+    'sms_sent': 0,
+    'failed': 0,
+    'smtp_received': 0,
+    'wave_queries': 0,
+    'wave_refreshed': 0,
+    'wave_rate_limited': 0,
+    'wave_unauthorized': 0,
+    'traced_requests': 0,
+    'spans_received': 0,
+}
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def parse_params(headers, body):
+    """Decode a JSON or form-encoded request body into a flat dict."""
+    if headers.get(b'content-type', b'').startswith(b'application/json'):
+        return json.loads(body or b'{}')
+    return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+
+async def respond(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def brevo_send(params):
+    versions = params.get('messageVersions')
+    if versions is not None:
+        if not 0 < len(versions) <= 1000:
+            return 400, {'code': 'invalid_parameter', 'message': 'messageVersions must hold 1-1000 items'}
+        stats['brevo_sent'] += len(versions)
+        stats['brevo_batches'] += 1
+        return 201, {'messageIds': [f'<{uuid.uuid4().hex}@standin>' for _ in versions]}
+    stats['brevo_sent'] += 1
+    return 201, {'messageId': f'<{uuid.uuid4().hex}@standin>'}
+
+
+async def vonage_start(params):
+    if not params.get('number'):
+        return 200, {'status': '3', 'error_text': 'Invalid value for param: number'}
+    now = time.monotonic()
+    for request_id, (number, expires_at) in list(vonage_open.items()):
+        if expires_at <= now:
+            del vonage_open[request_id]
+        elif number == params['number']:
+            stats['vonage_concurrent'] += 1
+            return 200, {'request_id': request_id, 'status': '10',
+                         'error_text': 'Concurrent verifications to the same number are not allowed'}
+    stats['vonage_started'] += 1
+    request_id = uuid.uuid4().hex
+    vonage_open[request_id] = (params['number'], now + VONAGE_PIN_EXPIRY)
+    return 200, {'request_id': request_id, 'status': '0'}
+
+
+async def vonage_check(params):
+    stats['vonage_checked'] += 1
+    if params.get('code') == STANDIN_CODE:
+        vonage_open.pop(params.get('request_id'), None)
+        return 200, {'request_id': params.get('request_id'), 'status': '0'}
+    return 200, {'status': '16', 'error_text': 'The code provided does not match the expected value'}
+
+
+async def vonage_control(params):
+    if params.get('cmd') != 'cancel' or vonage_open.pop(params.get('request_id'), None) is None:
+        return 200, {'status': '6', 'error_text': f"The requestId '{params.get('request_id')}' does not exist "
+                                                  'or its no longer active.'}
+    stats['vonage_cancelled'] += 1
+    return 200, {'status': '0', 'command': 'cancel'}
+
+
+async def http_sms_send(params):
+    if not params.get('to'):
+        return 400, {'error': 'missing to'}
+    stats['sms_sent'] += 1
+    sms_codes[params['to']] = re.search(r'\d{6}', params.get('text', '')).group(0)
+    return 202, {'id': uuid.uuid4().hex}
+
+
+async def wave_token(params):
+    if params.get('grant_type') != 'refresh_token' or not params.get('refresh_token'):
+        return 400, {'error': 'invalid_grant'}
+    stats['wave_refreshed'] += 1
+    return 200, {'access_token': f'{WAVE_TOKEN_PREFIX}{uuid.uuid4().hex}', 'token_type': 'Bearer',
+                 'expires_in': settings['wave_token_ttl'], 'refresh_token': f'wave-refresh-{uuid.uuid4().hex}'}
+
+
+async def wave_graphql(params):
+    token = request_headers.get().get(b'authorization', b'').decode().removeprefix('Bearer ')
+    if not token.startswith(WAVE_TOKEN_PREFIX) or token in wave_expired:
+        stats['wave_unauthorized'] += 1
+        return 401, {'errors': [{'message': 'Unauthorized', 'extensions': {'code': 'UNAUTHENTICATED'}}]}
+    limit = settings['wave_rate_limit']
+    if limit:
+        second = int(time.time())
+        window, count = wave_windows.get(token, (second, 0))
+        count = count + 1 if window == second else 1
+        wave_windows[token] = (second, count)
+        if count > limit:
+            stats['wave_rate_limited'] += 1
+            return 429, {'errors': [{'message': 'Rate limit exceeded'}]}, [(b'retry-after', b'1')]
+    stats['wave_queries'] += 1
+    if 'businesses' in params.get('query', ''):
+        edges = [{'node': business} for business in WAVE_BUSINESSES]
+        return 200, {'data': {'businesses': {'edges': edges}}}
+    return 200, {'data': {'standin': {'variables': params.get('variables'), 'served': stats['wave_queries']}}}
+
+
+async def wave_control(params):
+    wave_expired.update(params.get('expire', []))
+    settings.update({k: params[k] for k in ('wave_rate_limit', 'wave_token_ttl') if k in params})
+    return 200, {'expired': len(wave_expired), **{k: settings[k] for k in ('wave_rate_limit', 'wave_token_ttl')}}
+
+
+async def otlp_traces(params):
+    for resource_spans in params.get('resourceSpans', []):
+        service = next((a['value'].get('stringValue') for a in resource_spans.get('resource', {}).get('attributes', [])
+                        if a['key'] == 'service.name'), None)
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for span in scope_spans.get('spans', []):
+                traces.append({'service': service, **span})
+                stats['spans_received'] += 1
+    del traces[:-TRACE_KEEP]
+    return 200, {'partialSuccess': {}}
+
+
+async def get_traces(params):
+    return 200, traces
+
+
+async def get_sms_codes(params):
+    return 200, sms_codes
+
+
+async def set_faults(params):
+    for provider, values in params.items():
+        faults[provider].update(values)
+    return 200, faults
+
+
+async def get_stats(params):
+    return 200, stats
+
+
+ROUTES = {
+    '/v3/smtp/email': ('brevo', brevo_send),
+    '/verify/json': ('vonage', vonage_start),
+    '/verify/check/json': ('vonage', vonage_check),
+    '/verify/control/json': ('vonage', vonage_control),
+    '/sms/send': ('sms', http_sms_send),
+    '/wave/oauth2/token': ('wave', wave_token),
+    '/wave/graphql/public': ('wave', wave_graphql),
+    '/v1/traces': (None, otlp_traces),
+    '/_traces': (None, get_traces),
+    '/_wave': (None, wave_control),
+    '/_sms_codes': (None, get_sms_codes),
+    '/_faults': (None, set_faults),
+    '/_stats': (None, get_stats),
+}
+
+
+def delay_for(number):
+    number = number.lstrip('+')
+    for prefix, delay in settings['country_delays'].items():
+        if number.startswith(prefix):
+            return delay
+    return settings['delay']
+
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    provider, handler = ROUTES.get(scope['path'], (None, None))
+    body = await read_body(receive)
+    if handler is None:
+        await respond(send, 404, {'error': 'not found'})
+        return
+
+    headers = dict(scope['headers'])
+    request_headers.set(headers)
+    params = parse_params(headers, body)
+    if provider is not None:
+        stats['traced_requests'] += b'traceparent' in headers
+        fault = faults[provider]
+        number = params.get('number') or params.get('to')
+        await asyncio.sleep(delay_for(number if isinstance(number, str) else '') + fault['hang'])
+        if random.random() < fault['fail_rate']:
+            stats['failed'] += 1
+            await respond(send, 503, {'error': 'injected failure'})
+            return
+
+    status, payload, *extra_headers = await handler(params)
+    await respond(send, status, payload, *extra_headers)
+
+
+async def smtp_session(reader, writer):
+    """Minimal SMTP sink: accepts every message and counts it."""
+    writer.write(b'220 standin ESMTP\r\n')
+    in_data = False
+    while line := await reader.readline():
+        if in_data:
+            if line in (b'.\r\n', b'.\n'):
+                in_data = False
+                stats['smtp_received'] += 1
+                writer.write(b'250 OK queued\r\n')
+            continue
+        command = line[:4].upper()
+        if command == b'EHLO':
+            writer.write(b'250-standin\r\n250 8BITMIME\r\n')
+        elif command == b'DATA':
+            in_data = True
+            writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+        elif command == b'QUIT':
+            writer.write(b'221 Bye\r\n')
+            await writer.drain()
+            break
+        else:
+            writer.write(b'250 OK\r\n')
+        await writer.drain()
+    writer.close()
+
+
+async def serve(host, port, smtp_port):
+    smtp = None
+    if smtp_port:
+        smtp = await asyncio.start_server(smtp_session, host, smtp_port)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level='warning'))
+    try:
+        await server.serve()
+    finally:
+        if smtp is not None:
+            smtp.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--smtp-port', type=int, default=0,
+                        help='also run an SMTP sink on this port')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='seconds to wait before answering each request')
+    parser.add_argument('--country-delay', default='',
+                        help='per-prefix delays, e.g. 1=0.05,44=0.6')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='fraction of provider requests answered with 503')
+    parser.add_argument('--hang', type=float, default=0.0,
+                        help='extra seconds before answering, to trip client deadlines')
+    parser.add_argument('--wave-rate-limit', type=int, default=0,
+                        help='Wave queries allowed per token and second (0 = unlimited)')
+    args = parser.parse_args()
+
+    settings['delay'] = args.delay
+    settings['wave_rate_limit'] = args.wave_rate_limit
+    settings['country_delays'] = {
+        prefix: float(delay) for prefix, delay in
+        (entry.split('=') for entry in args.country_delay.split(',') if entry)
+    }
+    for fault in faults.values():
+        fault.update(fail_rate=args.fail_rate, hang=args.hang)
+    asyncio.run(serve(args.host, args.port, args.smtp_port))